@@ -1,35 +1,69 @@
-from json import loads, dumps
-from utils import Logger, build_allowlist_from_routes
-from fastapi import FastAPI, Query, status, Request
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import FileResponse, JSONResponse
+import re
+import httpx
+import asyncio
+from hmac import compare_digest
+from utils import Logger, build_allowlist_matcher
+from typing import Optional
+from fastapi import FastAPI, Query, Header, status, Request
+from starlette.types import ASGIApp, Scope, Receive, Send
+from starlette.responses import FileResponse, Response
 from starlette.exceptions import HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from models.requests import CreateWalletRequest, UpdateWalletInfoRequest
-from backend.database import dbpool, create_db_and_tables
-from models.responses import WalletsResponse, WalletDeletedResponse, UserWalletObject
-from security.tokenization import test_authorization_token, get_current_user_session
+from models.requests import CreateWalletRequest, UpdateWalletInfoRequest, CreateWalletsBatchRequest, \
+    DeleteWalletsBatchRequest
+from backend.database import async_dbpool, async_engine, create_db_and_tables_async, entity_cache
+from models.responses import WalletsResponse, WalletDeletedResponse, WalletsBatchResponse, BatchItemResult, \
+    WalletsPageResponse
+from models.serialization import FastJSONResponse, wallets_response, version_etag, etag_matches, fragment_cache
+from security.tokenization import test_authorization_token, get_current_user_session, get_bearer_token, token_cache
 from services.broadcaster import broadcaster
+from services.resilience import CircuitOpenError
+from services.validation_worker import validation_workers
+from security.api_keys import api_keys
+from services.secret_store import secrets_provider
+from services import address_format
+from services import metrics
+from services.metrics import MetricsMiddleware
+from backend.query_profiler import QueryProfilingMiddleware
+from services.admission import AdmissionMiddleware
+from services.idempotency import idempotency, request_fingerprint, IdempotencyError
 from utils import check_association
+from decouple import config
 
 logger = Logger("app")
 
-app = FastAPI(title="YoursBTC Wallets Service", version="0.1.0")
+app = FastAPI(title="YoursBTC Wallets Service", version="0.1.0", default_response_class=FastJSONResponse)
+
+# GET /wallets is revalidated with If-None-Match; a max-age lets clients skip even that
+WALLETS_CACHE_MAX_AGE = int(config("WALLETS_CACHE_MAX_AGE", default="0"))
+WALLETS_CACHE_CONTROL = f"private, max-age={WALLETS_CACHE_MAX_AGE}" if WALLETS_CACHE_MAX_AGE else "private, no-cache"
 
 # Cross Origins trusted hosts
 allowed_origins = ["https://yoursbtc.com", "http://localhost:4200"]
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-    allow_origins=allowed_origins
-)
 
 
 @app.on_event("startup")
 async def startup_event():
-    create_db_and_tables()
+    if validation_workers.enabled:
+        # before anything is opened: refuse to start rather than fail every validation job
+        validation_workers.check_config()
+    if config("LOCAL", default="0") != "1":
+        # the first read goes to Secrets Manager: do it off the event loop,
+        # the engine's connect hook is then served from the cache
+        await asyncio.to_thread(secrets_provider.get, "database")
+    await create_db_and_tables_async()
+    if validation_workers.enabled:
+        validation_workers.start()
+    api_keys.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await validation_workers.stop()
+    await api_keys.stop()
+    await broadcaster.aclose()
+    await async_engine.dispose()
+    secrets_provider.stop()
 
 
 @app.get("/robots.txt", include_in_schema=False)
@@ -42,47 +76,151 @@ async def favicon_ico():
     return FileResponse("static/favicon.ico", media_type="image/x-icon")
 
 
+def upstream_auth_token(request: Request) -> str:
+    """Token forwarded to the broadcaster: the caller's JWT, or the service token for API-key clients."""
+    if "Authorization" in request.headers:
+        return get_bearer_token(request)
+    return broadcaster.service_token
+
+
+def validation_failure(error: BaseException) -> tuple[int, str]:
+    """Status code and detail answered for a remote validation that raised instead of giving a verdict."""
+    if isinstance(error, httpx.HTTPStatusError) and 400 <= error.response.status_code < 500 \
+            and error.response.status_code != 429:
+        # not an outage: the broadcaster answered, and rejected the request itself
+        if error.response.status_code in (400, 404, 422):
+            return status.HTTP_400_BAD_REQUEST, "Invalid wallet"
+        return status.HTTP_502_BAD_GATEWAY, "Wallet validation rejected"
+    return status.HTTP_503_SERVICE_UNAVAILABLE, "Wallet validation unavailable"
+
+
+async def validate_wallet_or_raise(request: Request, payload: CreateWalletRequest) -> bool:
+    """Remote validation for the synchronous create path, run outside of any DB session/transaction."""
+    try:
+        is_valid = await broadcaster.validate_wallet(
+            address=payload.public_address,
+            network=payload.network,
+            auth_token=upstream_auth_token(request)
+        )
+    except CircuitOpenError as e:
+        logger.error("wallet validation rejected: %s", e)
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Wallet validation unavailable",
+            headers={"Retry-After": str(max(1, round(e.retry_after)))}
+        )
+    except Exception as e:
+        logger.error("wallet validation failed: %r", e)
+        status_code, detail = validation_failure(e)
+        raise HTTPException(status_code=status_code, detail=detail)
+    if not is_valid:
+        logger.error("wallet is invalid")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid wallet")
+    return is_valid
+
+
+# ---------- metrics ----------
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+# /metrics shares the public listener: outside LOCAL it is only served with a token
+METRICS_ENABLED = bool(METRICS_TOKEN) or config("LOCAL", default="0") == "1"
+if not METRICS_ENABLED:
+    logger.warning("METRICS_TOKEN is not set, /metrics is disabled")
+metrics.register_stats("entity_cache", "Entity read-through cache", entity_cache.stats)
+metrics.register_stats("validation_cache", "Broadcaster validation cache", broadcaster.validation_stats)
+metrics.register_stats("token_cache", "Verified JWT cache", token_cache.stats)
+metrics.register_stats("wallet_fragment_cache", "Serialized wallet fragment cache", fragment_cache.stats)
+metrics.register_stats("api_key_cache", "API key cache", api_keys.stats)
+metrics.register_stats("broadcaster_breaker", "Broadcaster circuit breaker", broadcaster.breaker.stats)
+metrics.register_stats("broadcaster_retry_budget", "Broadcaster retry budget", broadcaster.retry_budget.stats)
+metrics.register_stats("secrets", "Cached secrets", secrets_provider.stats)
+metrics.register_stats("idempotency", "Idempotency-Key store", idempotency.stats)
+metrics.registry.register(metrics.Gauge(
+    "broadcaster_circuit_open", "1 while the broadcaster circuit is open (calls are rejected)",
+    function=lambda: {(): float(broadcaster.breaker.state == broadcaster.breaker.OPEN)}))
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint(request: Request):
+    """Prometheus text exposition of this worker's metrics."""
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if METRICS_TOKEN and not compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    if validation_workers.enabled:
+        stats = await validation_workers.stats()
+        metrics.validation_queue_depth.set(stats["queue_depth"])
+        metrics.validation_queue_lag.set(stats["queue_lag_seconds"])
+        for outcome in ("processed", "validated", "rejected", "failed", "dropped"):
+            metrics.validation_jobs.set(stats[outcome], outcome)
+    return Response(content=metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/wallets", response_model=WalletsResponse)
 @test_authorization_token
 async def create_wallet(
         create_wallet_payload: CreateWalletRequest,
-        request: Request
+        request: Request,
+        idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key")
 ):
     logger.info("============ Create Wallet ============")
-    logger.debug(f"Logging in user {create_wallet_payload=}")
+    logger.debug("Logging in user create_wallet_payload=%r", create_wallet_payload)
     session_id = await get_current_user_session(request)
     if not session_id:
-        logger.error(f"cannot login without session id")
+        logger.error("cannot login without session id")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    logger.debug(f"session id {session_id=}")
-    user = None
-    with dbpool as conn:
-        logger.debug(f"Searching for user {session_id=}")
-        user = conn.find('user', user_id=session_id)
-        if not user:
-            logger.error(f"not found {user=}")
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-        logger.debug(f"User found {user=}")
-        validation_status = await broadcaster.test_wallet(
-            address=create_wallet_payload.public_address,
-            network=create_wallet_payload.network,
-            auth_token=request.headers.get('Authorization').split(' ')[1]
-        ).get('results').get('mempool').get('ok')
-        if not validation_status:
-            logger.error(f"wallet is invalid")
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid wallet")
-        wallet = conn.add_wallet(
-            user_id=user.user_id,
-            name=create_wallet_payload.name,
+    logger.debug("session id session_id=%r", session_id)
+    if idempotency_key is None:
+        return await add_wallet_for_user(session_id, create_wallet_payload, request)
+    # a retry gets the stored response back: no broadcaster call, no second wallet
+    try:
+        return await idempotency.run(
+            session_id, idempotency_key, request_fingerprint(create_wallet_payload.tojson()),
+            lambda: add_wallet_for_user(session_id, create_wallet_payload, request)
+        )
+    except IdempotencyError as e:
+        logger.error("idempotency key rejected: %s", e)
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+
+async def add_wallet_for_user(session_id: str, create_wallet_payload: CreateWalletRequest, request: Request):
+    if address_format.ENABLED:
+        format_error = address_format.address_format_error(
+            create_wallet_payload.public_address,
             network=create_wallet_payload.network,
-            force_testnet=create_wallet_payload.force_testnet,
-            public_address=create_wallet_payload.public_address,
-            validated_by_blockchain=validation_status
+            force_testnet=create_wallet_payload.force_testnet
         )
-        logger.debug(f"User create {wallet=}")
-        user = conn.update('user', user=user)
-        logger.debug(f"User create {user=}")
-        return WalletsResponse(user_id=user.user_id, user_wallets=user.wallets)
+        if format_error:
+            logger.error("wallet address rejected: %s", format_error)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid wallet address")
+    async with async_dbpool as conn:
+        logger.debug("Searching for user session_id=%r", session_id)
+        user = await conn.find('user', user_id=session_id, cached=True)
+    if not user:
+        logger.error("user not found session_id=%r", session_id)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    if validation_workers.enabled:
+        # validated later by services.validation_worker
+        is_valid = False
+    else:
+        is_valid = await validate_wallet_or_raise(request, create_wallet_payload)
+    async with async_dbpool as conn:
+        try:
+            await conn.add_wallet(
+                user_id=session_id,
+                name=create_wallet_payload.wallet_name,
+                network=create_wallet_payload.network,
+                force_testnet=create_wallet_payload.force_testnet,
+                public_address=create_wallet_payload.public_address,
+                validated_by_blockchain=is_valid,
+                enqueue_validation=validation_workers.enabled
+            )
+        except ValueError as e:
+            logger.error("cannot add wallet: %s", e)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+        rows = await conn.find_user_wallets(user_id=session_id)
+    validation_workers.notify()
+    logger.debug("User session_id=%r has %s wallets", session_id, len(rows))
+    return wallets_response(session_id, rows)
 
 
 @app.put("/wallets", response_model=WalletsResponse)
@@ -92,31 +230,31 @@ async def update_wallet(
         request: Request
 ):
     logger.info("============ Update Wallet ============")
-    logger.debug(f"Registering user {update_wallet_payload=}")
+    logger.debug("Registering user update_wallet_payload=%r", update_wallet_payload)
     session_id = await get_current_user_session(request)
     if not session_id:
-        logger.error(f"cannot register without session id")
+        logger.error("cannot register without session id")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    logger.debug(f"session id {session_id=}")
+    logger.debug("session id session_id=%r", session_id)
     user = None
-    with dbpool as conn:
-        logger.debug(f"searching for user {update_wallet_payload.username=}")
-        user = conn.find('user', user_id=session_id)
+    async with async_dbpool as conn:
+        logger.debug("searching for user update_wallet_payload.username=%r", update_wallet_payload.username)
+        user = await conn.find('user', user_id=session_id)
         if user:
-            logger.error(f"not found {user=}")
+            logger.error("not found user=%r", user)
             raise HTTPException(status_code=status.HTTP_302_FOUND, detail="User already exists")
-        wallet = conn.find('wallet', wallet_id=update_wallet_payload.wallet_id)
+        wallet = await conn.find('wallet', wallet_id=update_wallet_payload.wallet_id)
         if not wallet:
-            logger.error(f"wallet not found {update_wallet_payload.wallet_id=}")
+            logger.error("wallet not found update_wallet_payload.wallet_id=%r", update_wallet_payload.wallet_id)
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Wallet not found")
         if not check_association(user=user, wallet=wallet):
-            logger.error(f"{wallet.wallet_id=} not associated to{user.user_id=}")
+            logger.error("wallet.wallet_id=%r not associated touser.user_id=%r", wallet.wallet_id, user.user_id)
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Wallet not found")
-        logger.debug(f"User found {user=}")
-        wallet = conn.update('wallet', wallet=update_wallet_payload)
-        logger.debug(f"User update {wallet=}")
-        conn.update('user', user=user)
-        logger.debug(f"User update {user=}")
+        logger.debug("User found user=%r", user)
+        wallet = await conn.update('wallet', wallet=update_wallet_payload)
+        logger.debug("User update wallet=%r", wallet)
+        await conn.update('user', user=user)
+        logger.debug("User update user=%r", user)
         return WalletsResponse(user_id=user.user_id, user_wallets=user.wallets)
 
 
@@ -127,41 +265,76 @@ async def get_wallet(
         wallet_id: str = Query(..., min_length=16)
 ):
     logger.info("============ Get Wallet ============")
-    logger.debug(f"call get_wallet, params({wallet_id=})")
+    logger.debug("call get_wallet, params(wallet_id=%r)", wallet_id)
     session_id = await get_current_user_session(request)
     if not session_id:
-        logger.error(f"cannot login without session id")
+        logger.error("cannot login without session id")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    logger.debug(f"session id {session_id=}")
-    user = None
-    with dbpool as conn:
-        logger.debug(f"Searching for user {wallet_id=}")
-        user = conn.find('user', user_id=session_id)
-        if not user:
-            logger.error(f"{user=} not found")
+    logger.debug("session id session_id=%r", session_id)
+    async with async_dbpool as conn:
+        version = await conn.find_user_wallets_version(user_id=session_id)
+        if version is None:
+            logger.error("user not found session_id=%r", session_id)
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-        logger.debug(f"User found {user=}")
-        wallet = conn.find('wallet', wallet_id=wallet_id)
-        if not wallet:
-            logger.error(f"wallet not found {wallet_id=}")
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Wallet not found")
-        if not check_association(user=user, wallet=wallet):
-            logger.error(f"{wallet.wallet_id=} not associated to{user.user_id=}")
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Wallet not found")
-        logger.debug(f"User found {wallet=}")
-        user_wallets = [
-            UserWalletObject(
-                wallet_name=wallet.name,
-                wallet_id=wallet.wallet_id,
-                network=wallet.network,
-                blockchain_validated=wallet.validated_by_blockchain,
-                public_address=wallet.public_address,
-                created_at=wallet.created_at.isoformat(),
-                force_testnet=wallet.force_testnet
+        # wallet_id is part of the tag: a 304 implies the same ownership check passed for this version
+        etag = version_etag(session_id, wallet_id, *version)
+        headers = {"ETag": etag, "Cache-Control": WALLETS_CACHE_CONTROL}
+        if etag_matches(request.headers.get("If-None-Match"), etag):
+            logger.debug("wallets not modified session_id=%r", session_id)
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        logger.debug("Searching for user wallets session_id=%r", session_id)
+        rows = await conn.find_user_wallets(user_id=session_id, cached=True)
+        _, count, last_update = version
+        if rows is None or len(rows) != count or (rows and max(row.updated_at for row in rows) != last_update):
+            # the cached listing is behind the version the tag was computed from
+            rows = await conn.find_user_wallets(user_id=session_id)
+    if rows is None:
+        logger.error("user not found session_id=%r", session_id)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    if not any(row.wallet_id == wallet_id for row in rows):
+        logger.error("wallet_id=%r not associated to session_id=%r", wallet_id, session_id)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Wallet not found")
+    return wallets_response(session_id, rows, headers=headers)
+
+
+@app.get("/wallets/list", response_model=WalletsPageResponse)
+@test_authorization_token
+async def list_wallets(
+        request: Request,
+        limit: int = Query(100, ge=1, le=1000),
+        cursor: Optional[str] = Query(None),
+        fields: Optional[str] = Query(None, description="comma separated UserWalletObject fields"),
+        network: Optional[str] = Query(None),
+        validated_by_blockchain: Optional[bool] = Query(None)
+):
+    logger.info("============ List Wallets ============")
+    logger.debug(
+        "call list_wallets, params(limit=%r, cursor=%r, fields=%r, network=%r, validated_by_blockchain=%r)",
+        limit, cursor, fields, network, validated_by_blockchain
+    )
+    session_id = await get_current_user_session(request)
+    if not session_id:
+        logger.error("cannot login without session id")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    try:
+        async with async_dbpool as conn:
+            page = await conn.find_user_wallets_page(
+                user_id=session_id,
+                limit=limit,
+                cursor=cursor,
+                fields=[field.strip() for field in fields.split(",") if field.strip()] if fields else None,
+                network=network,
+                validated_by_blockchain=validated_by_blockchain
             )
-            for wallet in user.wallets
-        ]
-        return WalletsResponse(user_id=user.user_id, user_wallets=user_wallets)
+    except ValueError as e:
+        logger.error("invalid listing parameters: %s", e)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    if page is None:
+        logger.error("user not found session_id=%r", session_id)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    user_wallets, next_cursor = page
+    return WalletsPageResponse(user_id=session_id, user_wallets=user_wallets, next_cursor=next_cursor)
+
 
 @app.delete("/wallets", response_model=WalletDeletedResponse)
 @test_authorization_token
@@ -170,69 +343,213 @@ async def delete_wallet(
         wallet_id: str = Query(..., min_length=16)
 ):
     logger.info("============ Delete Wallet ============")
-    logger.debug(f"call delete_wallet, params({wallet_id=})")
+    logger.debug("call delete_wallet, params(wallet_id=%r)", wallet_id)
     session_id = await get_current_user_session(request)
     if not session_id:
-        logger.error(f"cannot login without session id")
+        logger.error("cannot login without session id")
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    logger.debug(f"session id {session_id=}")
+    logger.debug("session id session_id=%r", session_id)
     user = None
-    with dbpool as conn:
-        logger.debug(f"Searching for user {wallet_id=}")
-        user = conn.find('user', user_id=session_id)
+    async with async_dbpool as conn:
+        logger.debug("Searching for user wallet_id=%r", wallet_id)
+        # uncached: a snapshot can miss a wallet created through another worker
+        user = await conn.find('user', user_id=session_id)
         if not user:
-            logger.error(f"{user=} not found")
+            logger.error("user=%r not found", user)
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
-        logger.debug(f"User found {user=}")
-        wallet = conn.find('wallet', wallet_id=wallet_id)
+        logger.debug("User found user=%r", user)
+        wallet = await conn.find('wallet', wallet_id=wallet_id)
         if not wallet:
-            logger.error(f"wallet not found {wallet_id=}")
+            logger.error("wallet not found wallet_id=%r", wallet_id)
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Wallet not found")
         if not check_association(user=user, wallet=wallet):
-            logger.error(f"{wallet.wallet_id=} not associated to{user.user_id=}")
+            logger.error("wallet.wallet_id=%r not associated touser.user_id=%r", wallet.wallet_id, user.user_id)
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Wallet not found")
-        deleted = conn.delete_wallet(wallet_id=wallet_id)
-        logger.debug(f"User found {wallet=}")
+        deleted = await conn.delete_wallet(wallet_id=wallet_id)
+        logger.debug("User found wallet=%r", wallet)
         return WalletDeletedResponse(wallet_id=wallet_id, deleted=deleted)
 
 
-class PathWhitelistMiddleware(BaseHTTPMiddleware):
+@app.post("/wallets/batch", response_model=WalletsBatchResponse)
+@test_authorization_token
+async def create_wallets_batch(
+        create_wallets_payload: CreateWalletsBatchRequest,
+        request: Request
+):
+    logger.info("============ Create Wallets Batch ============")
+    logger.debug(
+        "call create_wallets_batch, params(len(create_wallets_payload.wallets)=%r)",
+        len(create_wallets_payload.wallets)
+    )
+    session_id = await get_current_user_session(request)
+    if not session_id:
+        logger.error("cannot login without session id")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    async with async_dbpool as conn:
+        user = await conn.find('user', user_id=session_id, cached=True)
+    if not user:
+        logger.error("user not found session_id=%r", session_id)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+    payloads = create_wallets_payload.wallets
+    auth_token = upstream_auth_token(request)
+    if address_format.ENABLED:
+        format_errors = address_format.address_format_errors(
+            (payload.public_address, payload.network, payload.force_testnet) for payload in payloads
+        )
+    else:
+        format_errors = [None] * len(payloads)
+    well_formed = [index for index, error in enumerate(format_errors) if error is None]
+    if validation_workers.enabled:
+        # accepted as is, validated later by services.validation_worker
+        checked = [True] * len(well_formed)
+    else:
+        # validate every well-formed address concurrently, outside of any DB transaction
+        checked = await asyncio.gather(
+            *(
+                broadcaster.validate_wallet(
+                    address=payloads[index].public_address,
+                    network=payloads[index].network,
+                    auth_token=auth_token
+                )
+                for index in well_formed
+            ),
+            return_exceptions=True
+        )
+    outcomes = dict(zip(well_formed, checked))
+    results: list[BatchItemResult] = []
+    accepted: list[int] = []
+    for index, payload in enumerate(payloads):
+        result = BatchItemResult(index=index, public_address=payload.public_address)
+        outcome = outcomes.get(index, False)
+        if format_errors[index]:
+            result.detail = "Invalid wallet address"
+        elif isinstance(outcome, BaseException):
+            # CancelledError included: it is a BaseException, and truthy
+            logger.error("validation failed for item %s: %r", index, outcome)
+            _, result.detail = validation_failure(outcome)
+        elif outcome is not True:
+            result.detail = "Invalid wallet"
+        else:
+            accepted.append(index)
+        results.append(result)
+    if accepted:
+        async with async_dbpool as conn:
+            wallet_ids = await conn.add_wallets(user_id=session_id, wallets=[
+                dict(
+                    name=payloads[index].wallet_name,
+                    network=payloads[index].network,
+                    force_testnet=payloads[index].force_testnet,
+                    public_address=payloads[index].public_address,
+                    validated_by_blockchain=not validation_workers.enabled
+                )
+                for index in accepted
+            ], enqueue_validation=validation_workers.enabled)
+        validation_workers.notify()
+        for index, wallet_id in zip(accepted, wallet_ids):
+            results[index].wallet_id = wallet_id
+            results[index].ok = True
+    logger.debug("created %s/%s wallets for session_id=%r", len(accepted), len(payloads), session_id)
+    return WalletsBatchResponse(user_id=session_id, results=results)
+
+
+@app.delete("/wallets/batch", response_model=WalletsBatchResponse)
+@test_authorization_token
+async def delete_wallets_batch(
+        delete_wallets_payload: DeleteWalletsBatchRequest,
+        request: Request
+):
+    logger.info("============ Delete Wallets Batch ============")
+    logger.debug(
+        "call delete_wallets_batch, params(len(delete_wallets_payload.wallet_ids)=%r)",
+        len(delete_wallets_payload.wallet_ids)
+    )
+    session_id = await get_current_user_session(request)
+    if not session_id:
+        logger.error("cannot login without session id")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    async with async_dbpool as conn:
+        user = await conn.find('user', user_id=session_id, cached=True)
+        if not user:
+            logger.error("user not found session_id=%r", session_id)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+        deleted = await conn.delete_wallets(user_id=session_id, wallet_ids=delete_wallets_payload.wallet_ids)
+    results = [
+        BatchItemResult(
+            index=index,
+            wallet_id=wallet_id,
+            ok=wallet_id in deleted,
+            detail=None if wallet_id in deleted else "Wallet not found"
+        )
+        for index, wallet_id in enumerate(delete_wallets_payload.wallet_ids)
+    ]
+    logger.debug("deleted %s/%s wallets for session_id=%r", len(deleted), len(results), session_id)
+    return WalletsBatchResponse(user_id=session_id, results=results)
+
+
+class PathWhitelistMiddleware:
     """
-    Middleware for restricting access to specific paths based on a whitelist.
-
-    This middleware intercepts incoming HTTP requests and restricts access to
-    certain paths that are not explicitly allowed for the application. The
-    allowed paths are defined in a whitelist and are checked against each
-    request's URL path. It supports both exact string matching and regex-based
-    matching for path validation. Requests to paths not in the whitelist are
-    blocked, and a 403 Forbidden response is returned, except for CORS `OPTIONS`
-    method, which is always allowed.
-
-    Attributes:
-        ALLOWED_PATHS: List of paths or regex patterns representing the allowed
-        routes.
-
-    Methods:
-        dispatch: Asynchronous handler for intercepting HTTP requests and
-        enforcing the path-based whitelist logic.
+    Pure ASGI middleware restricting access to the paths of the application routes.
+
+    Every HTTP request path is checked with one match() of a single compiled
+    alternation of all route paths (see utils.build_allowlist_matcher), built
+    from the routes of the application serving the request on first use and
+    rebuilt whenever that route list changes. Requests to other paths get a
+    pre-encoded 403 Forbidden response, except for the CORS `OPTIONS` method,
+    which is always allowed. Non-HTTP scopes (lifespan) are passed through.
     """
-    ALLOWED_PATHS = build_allowlist_from_routes(app)
-    async def dispatch(self, request, call_next):
-        path = request.url.path
-        method = request.method.upper()
+    FORBIDDEN_BODY = b'{"message":"Forbidden path"}'
+    FORBIDDEN_START = {
+        "type": "http.response.start",
+        "status": status.HTTP_403_FORBIDDEN,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(FORBIDDEN_BODY)).encode()),
+        ],
+    }
+    FORBIDDEN_BODY_MESSAGE = {"type": "http.response.body", "body": FORBIDDEN_BODY}
 
-        # Always allow OPTIONS for CORS
-        if method == "OPTIONS":
-            return await call_next(request)
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._routes_version = None
+        self._matcher = None
+        self._route_paths: dict[str, str] = {}
 
-        # Check against whitelist (supports regex)
-        for allowed in self.ALLOWED_PATHS:
-            if (isinstance(allowed, str) and path == allowed) or \
-               (hasattr(allowed, "match") and allowed.match(path)):
-                return await call_next(request)
+    def matcher(self, routes) -> re.Pattern:
+        version = (id(routes), len(routes))
+        if version != self._routes_version:
+            self._matcher = build_allowlist_matcher(routes)
+            self._route_paths = {f"r{index}": route.path for index, route in enumerate(routes) if hasattr(route, "path")}
+            self._routes_version = version
+        return self._matcher
 
-        # Anything not in ALLOWED_PATHS is blocked
-        return JSONResponse(content=loads(dumps({"message": "Forbidden path"})), status_code=status.HTTP_403_FORBIDDEN)
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Always allow OPTIONS for CORS
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        match = self.matcher(scope["app"].routes).match(scope["path"])
+        if match:
+            # route template for MetricsMiddleware, e.g. "/wallets" rather than the raw path
+            scope["route_path"] = self._route_paths[match.lastgroup]
+            await self.app(scope, receive, send)
+            return
+        # Anything not matching a route is blocked
+        await send(self.FORBIDDEN_START)
+        await send(self.FORBIDDEN_BODY_MESSAGE)
 
 
+# inside the allowlist: it needs scope["route_path"]
+app.add_middleware(middleware_class=AdmissionMiddleware)
+# outside admission, so its 429/503 responses carry the CORS headers too
+app.add_middleware(
+    CORSMiddleware,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["ETag", "Server-Timing", "Idempotent-Replayed"],
+    allow_origins=allowed_origins
+)
 app.add_middleware(middleware_class=PathWhitelistMiddleware)
+app.add_middleware(middleware_class=QueryProfilingMiddleware)
+# outermost, so forbidden paths are measured too
+app.add_middleware(middleware_class=MetricsMiddleware)
@@ -0,0 +1,246 @@
+from __future__ import annotations
+import os
+import mmap
+import asyncio
+from zlib import crc32
+from time import monotonic
+from datetime import datetime
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, NamedTuple, Optional
+
+# Returned by LRUTTLCache.get when a key is absent, so `None` can be cached too
+MISSING = object()
+
+
+class CacheInvalidations(object):
+    """
+    Hook through which LRUTTLCache shares invalidations with the other
+    worker processes. Every key has a generation: invalidating a key
+    publishes a new generation, and a cached entry is only served while the
+    generation it was loaded under is still the current one.
+    """
+
+    def generation(self, key: Hashable) -> int:
+        raise NotImplementedError
+
+    def publish(self, *keys: Hashable) -> None:
+        raise NotImplementedError
+
+
+class SharedGenerations(CacheInvalidations):
+    """
+    CacheInvalidations for the worker processes of one host: a memory-mapped
+    file of `slots` 64-bit counters, keys hashed onto them. Two keys sharing
+    a slot only cost each other extra misses. A generation check is a memory
+    read, no I/O and no syscall.
+    """
+
+    def __init__(self, path: str, slots: int = 65536):
+        self.path = path
+        self.slots = slots
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            size = slots * 8
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self._map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        self._counters = memoryview(self._map).cast("Q")
+
+    def _slot(self, key: Hashable) -> int:
+        # crc32, not hash(): str hashes are salted differently in every process
+        return crc32(str(key).encode()) % self.slots
+
+    def generation(self, key: Hashable) -> int:
+        return self._counters[self._slot(key)]
+
+    def publish(self, *keys: Hashable) -> None:
+        # not atomic across processes, but two racing writers still both move the counter off
+        # the value any reader of pre-commit state was stamped with, which is all that matters
+        for slot in {self._slot(key) for key in keys}:
+            self._counters[slot] = (self._counters[slot] + 1) & 0xFFFFFFFFFFFFFFFF
+
+
+class LRUTTLCache(object):
+    """
+    Bounded in-process LRU cache whose entries also expire after `ttl` seconds.
+    Every worker process has its own copy. Given `shared` invalidations,
+    invalidating a key here also drops it from the other workers' copies;
+    without, a write made through another worker is seen here once the
+    entry expires. Not thread safe by design: it is used from the event loop
+    only.
+    """
+
+    def __init__(self, name: str, max_entries: int, ttl: float, shared: Optional[CacheInvalidations] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.shared = shared
+        self._entries: OrderedDict[Hashable, tuple[float, int, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self.remote_invalidations = 0
+
+    def __len__(self): return len(self._entries)
+
+    def stamp(self, key: Hashable) -> int:
+        """
+        The generation to pass to set() for a value about to be loaded: take
+        it before the load, so an invalidation published meanwhile by another
+        worker makes the value stale instead of being missed.
+        """
+        return self.shared.generation(key) if self.shared is not None else 0
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, generation, value = entry
+            if expires_at <= monotonic():
+                self.expirations += 1
+            elif self.shared is not None and generation != self.shared.generation(key):
+                self.remote_invalidations += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._entries[key]
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, stamp: Optional[int] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.max_entries <= 0:
+            return
+        self._store(key, value, ttl, self.stamp(key) if stamp is None else stamp)
+
+    def invalidate(self, *keys: Hashable) -> None:
+        for key in keys:
+            if self._entries.pop(key, None) is not None:
+                self.invalidations += 1
+        if self.shared is not None and keys:
+            self.shared.publish(*keys)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+            "remote_invalidations": self.remote_invalidations,
+        }
+
+    def _store(self, key: Hashable, value: Any, ttl: float, generation: int) -> None:
+        self._entries[key] = (monotonic() + ttl, generation, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+class _LeaderCancelled(Exception):
+    """Set on a SingleFlight call whose leader was cancelled: its followers run the call themselves."""
+
+
+class SingleFlight(object):
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    coroutine, everyone arriving while it is in flight awaits the same result
+    (or exception). Nothing is kept once the call completes. When the leader
+    is cancelled (e.g. its client went away) the cancellation stays its own:
+    one of the followers runs the call again and the others wait on that.
+    """
+
+    def __init__(self):
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def __len__(self): return len(self._inflight)
+
+    async def do(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            future = self._inflight.get(key)
+            if future is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except _LeaderCancelled:
+                continue
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.leaders += 1
+        try:
+            result = await factory()
+        except asyncio.CancelledError:
+            future.set_exception(_LeaderCancelled())
+            future.exception()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # followers re-raise it; don't warn when there are none
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._inflight), "leaders": self.leaders, "coalesced": self.coalesced}
+
+
+# ---------- detached, immutable copies of cached rows ----------
+class WalletSnapshot(NamedTuple):
+    wallet_id: str
+    user_id: str
+    name: Optional[str]
+    public_address: Optional[str]
+    network: Optional[str]
+    force_testnet: bool
+    validated_by_blockchain: bool
+    created_at: datetime
+    updated_at: datetime
+
+    @classmethod
+    def from_wallet(cls, wallet) -> "WalletSnapshot":
+        return cls(
+            wallet_id=wallet.wallet_id,
+            user_id=wallet.user_id,
+            name=wallet.name,
+            public_address=wallet.public_address,
+            network=wallet.network,
+            force_testnet=wallet.force_testnet,
+            validated_by_blockchain=wallet.validated_by_blockchain,
+            created_at=wallet.created_at,
+            updated_at=wallet.updated_at
+        )
+
+
+class UserSnapshot(NamedTuple):
+    user_id: str
+    name: str
+    username: str
+    active: bool
+    updated_at: datetime
+    wallets: tuple[WalletSnapshot, ...]
+
+    @classmethod
+    def from_user(cls, user) -> "UserSnapshot":
+        return cls(
+            user_id=user.user_id,
+            name=user.name,
+            username=user.username,
+            active=user.active,
+            updated_at=user.updated_at,
+            wallets=tuple(WalletSnapshot.from_wallet(wallet) for wallet in user.wallets)
+        )
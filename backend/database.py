@@ -1,47 +1,263 @@
 from __future__ import annotations
-from typing import Annotated, Generator, Optional
+import os
+import asyncio
+import tempfile
+from hashlib import sha256
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime, timedelta
+from contextvars import ContextVar
+from typing import Annotated, Generator, Generic, Optional, TypeVar
 from decouple import config as EnvConfig
 from fastapi import Depends
-from sqlmodel import SQLModel, Session, select, create_engine, update, delete
+from uuid import uuid4
+from sqlmodel import SQLModel, Session, select, create_engine, update, delete, insert, and_, tuple_, func
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import inspect, text
 from sqlalchemy.orm import sessionmaker
-from backend.tables import Wallet, User
-from utils import sm_get_secret_data, Singleton, timestamp_update, Logger
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateTable, CreateIndex
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from backend.tables import Wallet, User, WalletValidationJob, ApiKey, SchemaVersion, IdempotencyKey
+from backend.cache import LRUTTLCache, SharedGenerations, UserSnapshot, WalletSnapshot, MISSING
+from utils import Singleton, timestamp_update, Logger
+from services.metrics import InstrumentedAsyncQueuePool, instrument_engine
+from backend.query_profiler import instrument_queries
+from services.secret_store import connect_with_secret, USERNAME_PLACEHOLDER, PASSWORD_PLACEHOLDER
 
 logger = Logger("backend.database")
 
 # ---------- URL & engine ----------
 if EnvConfig("LOCAL", default="0") == "1":
     # SQLite for local dev
-    database_url = "sqlite:///local.db"
+    local_db_path = EnvConfig("LOCAL_DB_PATH", default="local.db")
+    database_url = f"sqlite:///{local_db_path}"
+    async_database_url = f"sqlite+aiosqlite:///{local_db_path}"
     engine = create_engine(
         database_url,
         echo=False,
         connect_args={"check_same_thread": False},  # needed for SQLite in threaded servers
     )
+    async_engine = create_async_engine(async_database_url, echo=False, poolclass=InstrumentedAsyncQueuePool)
 else:
-    # Postgres via AWS Secrets Manager
-    data = sm_get_secret_data("database")  # expects username/password in the secret
-    # Example: DATABASE_URL="%(username)s:%(password)s@db-host:5432/appdb"
-    db_info = EnvConfig("DATABASE_URL") % (data["username"], data["password"], data["username"])
+    # Postgres via AWS Secrets Manager. The credentials are not read here:
+    # connect_with_secret() fills them in for every new connection, from a
+    # cached secret that follows rotations.
+    # Example: DATABASE_URL="%s:%s@db-host:5432/%s" (username, password, username)
+    db_info = EnvConfig("DATABASE_URL") % (USERNAME_PLACEHOLDER, PASSWORD_PLACEHOLDER, USERNAME_PLACEHOLDER)
     # If your format is different, adapt the %-formatting above accordingly.
     database_url = f"postgresql+psycopg2://{db_info}?sslmode=require"
-    engine = create_engine(
-        database_url,
-        echo=False,
+    async_database_url = f"postgresql+asyncpg://{db_info}"
+    pool_options = dict(
         pool_pre_ping=True,
         pool_size=int(EnvConfig("DB_POOL_SIZE", default="10")),
         max_overflow=int(EnvConfig("DB_MAX_OVERFLOW", default="20")),
         pool_recycle=int(EnvConfig("DB_POOL_RECYCLE", default="300")),
         pool_timeout=int(EnvConfig("DB_POOL_TIMEOUT", default="10")),
     )
+    engine = create_engine(database_url, echo=False, **pool_options)
+    # asyncpg takes `ssl` as a connect argument instead of libpq's `sslmode`
+    async_engine = create_async_engine(
+        async_database_url, echo=False, connect_args={"ssl": "require"}, poolclass=InstrumentedAsyncQueuePool,
+        **pool_options
+    )
+    connect_with_secret(engine)
+    connect_with_secret(async_engine)
+instrument_engine(async_engine)
+instrument_queries(async_engine)
+instrument_queries(engine)
+
+
+def _discard_inherited_pools() -> None:
+    # a forked child (e.g. a preloading process manager) must not reuse the
+    # parent's pooled connections: drop them without closing the parent's sockets
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+
+os.register_at_fork(after_in_child=_discard_inherited_pools)
 
 # One session factory for the whole service
 SessionLocal = sessionmaker(bind=engine, class_=Session, expire_on_commit=False)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, class_=AsyncSession, expire_on_commit=False)
+
+# ---------- read-through cache for user/wallet lookups ----------
+# Staleness of a cached read is bounded by CACHE_TTL_SECONDS; writes through
+# AsyncDbConnectionPool invalidate the affected keys right away, in every
+# worker: with WEB_WORKERS > 1 invalidations go through a generation file
+# all of them map (CACHE_INVALIDATION_FILE, by default one per server
+# process, i.e. per parent of the workers, in the temp directory).
+def _shared_invalidations() -> Optional[SharedGenerations]:
+    path = EnvConfig("CACHE_INVALIDATION_FILE", default="")
+    if not path and int(EnvConfig("WEB_WORKERS", default="1")) > 1:
+        path = os.path.join(tempfile.gettempdir(), f"wallets-cache-{os.getppid()}.gen")
+    return SharedGenerations(path) if path else None
+
+entity_cache = LRUTTLCache(
+    name="entities",
+    max_entries=int(EnvConfig("CACHE_MAX_ENTRIES", default="10000")),
+    ttl=float(EnvConfig("CACHE_TTL_SECONDS", default="30")),
+    shared=_shared_invalidations(),
+)
+
+def user_cache_key(user_id: str) -> str: return f"user:{user_id}"
+def user_wallets_cache_key(user_id: str) -> str: return f"user_wallets:{user_id}"
+def wallet_cache_key(wallet_id: str) -> str: return f"wallet:{wallet_id}"
+
+# ---------- keyset pagination over a user's wallets ----------
+# UserWalletObject field name -> wallets_tbl column
+USER_WALLET_COLUMNS = {
+    "wallet_name": Wallet.name,
+    "wallet_id": Wallet.wallet_id,
+    "created_at": Wallet.created_at,
+    "public_address": Wallet.public_address,
+    "network": Wallet.network,
+    "force_testnet": Wallet.force_testnet,
+    "blockchain_validated": Wallet.validated_by_blockchain,
+}
+
+def encode_wallet_cursor(created_at: datetime, wallet_id: str) -> str:
+    """Opaque cursor pointing right after the (created_at, wallet_id) key."""
+    return urlsafe_b64encode(f"{created_at.isoformat()}|{wallet_id}".encode()).decode().rstrip("=")
+
+def decode_wallet_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        created_at, wallet_id = urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), wallet_id
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+# ---------- schema bootstrap ----------
+# fingerprint: create_all only when the DDL changed since the last boot
+# always:      create_all on every boot
+# off:         never (the schema is managed elsewhere)
+SCHEMA_BOOTSTRAP = EnvConfig("SCHEMA_BOOTSTRAP", default="fingerprint")
+SCHEMA_NAME = "wallets-service"
+# Postgres advisory lock serializing the bootstrap of processes booting together
+SCHEMA_LOCK_ID = int.from_bytes(sha256(SCHEMA_NAME.encode()).digest()[:8], "big", signed=True)
+SCHEMA_BOOTSTRAP_ATTEMPTS = 5
+# indexes made unique after their table shipped: create_all leaves an existing
+# index alone, so a non-unique one is rebuilt by upgrade_unique_indexes().
+# Rows sharing a key are reduced to the first one in the given order.
+UNIQUE_INDEX_UPGRADES = {
+    "ix_api_keys_tbl_key_content": (ApiKey.active.desc(), ApiKey.updated_at.desc()),
+}
+# read through the Core table: an ORM select would configure every mapper at
+# boot, which costs more than the create_all it is meant to skip
+schema_versions = SchemaVersion.__table__
+
+def schema_fingerprint(dialect) -> str:
+    """sha256 of the CREATE TABLE / CREATE INDEX statements of every table, compiled for `dialect`."""
+    ddl = []
+    for table in SQLModel.metadata.sorted_tables:
+        ddl.append(str(CreateTable(table).compile(dialect=dialect)))
+        ddl.extend(str(CreateIndex(index).compile(dialect=dialect))
+                   for index in sorted(table.indexes, key=lambda index: index.name))
+    # databases bootstrapped before an upgrade was added get it on their next boot
+    ddl.extend(f"upgrade {name}" for name in sorted(UNIQUE_INDEX_UPGRADES))
+    return sha256("\n".join(ddl).encode()).hexdigest()
+
+def upgrade_unique_indexes(connection) -> list[str]:
+    """
+    Rebuilds the UNIQUE_INDEX_UPGRADES indexes that exist but are not
+    unique, removing duplicate rows first. Runs on a sync connection inside
+    the bootstrap transaction. Returns the names of the rebuilt indexes.
+    """
+    inspector = inspect(connection)
+    upgraded = []
+    for table in SQLModel.metadata.sorted_tables:
+        indexes = [index for index in table.indexes if index.name in UNIQUE_INDEX_UPGRADES]
+        if not indexes:
+            continue
+        existing = {index["name"]: index for index in inspector.get_indexes(table.name)}
+        for index in indexes:
+            found = existing.get(index.name)
+            if found is None or found["unique"]:
+                continue
+            columns = list(index.columns)
+            primary_key = list(table.primary_key.columns)[0]
+            duplicates = connection.execute(
+                select(*columns).group_by(*columns).having(func.count() > 1)
+            ).all()
+            for values in duplicates:
+                ids = connection.execute(
+                    select(primary_key)
+                    .where(and_(*(column == value for column, value in zip(columns, values))))
+                    .order_by(*UNIQUE_INDEX_UPGRADES[index.name], primary_key)
+                ).scalars().all()
+                connection.execute(delete(table).where(primary_key.in_(ids[1:])))
+                logger.warning("%s: kept %s, removed %s rows sharing its key", index.name, ids[0], len(ids) - 1)
+            index.drop(connection)
+            index.create(connection)
+            upgraded.append(index.name)
+            logger.info("index %s rebuilt as unique", index.name)
+    return upgraded
+
+def _stored_fingerprint(connection) -> Optional[str]:
+    # checked with the inspector: on Postgres a failed SELECT would abort the transaction
+    if not inspect(connection).has_table(SchemaVersion.__tablename__):
+        return None
+    return connection.execute(
+        select(schema_versions.c.fingerprint).where(schema_versions.c.name == SCHEMA_NAME)
+    ).scalar_one_or_none()
+
+async def applied_schema_fingerprint() -> Optional[str]:
+    try:
+        async with async_engine.connect() as conn:
+            result = await conn.execute(
+                select(schema_versions.c.fingerprint).where(schema_versions.c.name == SCHEMA_NAME)
+            )
+            return result.scalar_one_or_none()
+    except DBAPIError:
+        # first boot: there is no schema_version_tbl yet
+        return None
 
 # ---------- helpers for app startup / FastAPI DI ----------
 def create_db_and_tables() -> None:
     SQLModel.metadata.create_all(engine)
 
+async def create_db_and_tables_async() -> bool:
+    """
+    Runs create_all, unless the fingerprint stored by the previous run matches
+    the current models: then booting costs one primary key lookup instead of
+    inspecting every table. Like create_all itself this only ever adds
+    missing tables and indexes. Returns whether create_all ran.
+    """
+    if SCHEMA_BOOTSTRAP == "off":
+        return False
+    fingerprint = schema_fingerprint(async_engine.dialect)
+    if SCHEMA_BOOTSTRAP != "always" and await applied_schema_fingerprint() == fingerprint:
+        logger.debug("schema fingerprint %s unchanged, create_all skipped", fingerprint[:12])
+        return False
+    for attempt in range(SCHEMA_BOOTSTRAP_ATTEMPTS):
+        try:
+            return await _bootstrap_schema(fingerprint)
+        except DBAPIError as e:
+            # no advisory lock (SQLite): a process booting at the same time created
+            # some tables first; go again, create_all skips the ones that exist now
+            if attempt + 1 == SCHEMA_BOOTSTRAP_ATTEMPTS:
+                raise
+            logger.warning("schema bootstrap raced another process, retrying: %r", e)
+            await asyncio.sleep(0.1 * (attempt + 1))
+            if SCHEMA_BOOTSTRAP != "always" and await applied_schema_fingerprint() == fingerprint:
+                return False
+
+async def _bootstrap_schema(fingerprint: str) -> bool:
+    async with async_engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            # workers and replicas booting together take turns; the lock is
+            # released with the transaction, and whoever waited re-checks
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": SCHEMA_LOCK_ID})
+            if SCHEMA_BOOTSTRAP != "always" and await conn.run_sync(_stored_fingerprint) == fingerprint:
+                logger.debug("schema fingerprint %s applied by another process", fingerprint[:12])
+                return False
+        await conn.run_sync(SQLModel.metadata.create_all)
+        await conn.run_sync(upgrade_unique_indexes)
+        await conn.execute(delete(schema_versions).where(schema_versions.c.name == SCHEMA_NAME))
+        await conn.execute(insert(schema_versions).values(
+            name=SCHEMA_NAME, fingerprint=fingerprint, applied_at=timestamp_update()
+        ))
+    logger.info("schema created/updated, fingerprint %s", fingerprint[:12])
+    return True
+
 def get_session() -> Generator[Session, None, None]:
     """FastAPI dependency — yields a bound Session per request."""
     session = SessionLocal()
@@ -56,20 +272,59 @@ def get_session() -> Generator[Session, None, None]:
 
 SessionDep = Annotated[Session, Depends(get_session)]
 
+# ---------- Request scoped sessions ----------
+SessionT = TypeVar("SessionT")
+
+
+class RequestScopedSession(Generic[SessionT]):
+    """
+    Holds the currently open session in a ContextVar.
+    Every request (asyncio task / thread) runs in its own context, so the
+    pool singletons can be shared while each caller keeps its own session,
+    pooled connection and transaction. Nested scopes are stacked and restored
+    in LIFO order.
+    """
+
+    def __init__(self, name: str):
+        self._current: ContextVar[Optional[SessionT]] = ContextVar(f"{name}_session", default=None)
+        self._tokens: ContextVar[tuple] = ContextVar(f"{name}_session_tokens", default=())
+
+    def get(self) -> Optional[SessionT]:
+        return self._current.get()
+
+    def push(self, session: SessionT) -> SessionT:
+        token = self._current.set(session)
+        self._tokens.set(self._tokens.get() + (token,))
+        return session
+
+    def pop(self) -> None:
+        tokens = self._tokens.get()
+        if not tokens:
+            return
+        self._tokens.set(tokens[:-1])
+        self._current.reset(tokens[-1])
+
+
 # ---------- Optional context-managed pool for manual usage ----------
 class DbConnectionPool(metaclass=Singleton):
     """
     Lightweight context manager that opens/closes a *bound* Session.
+    The session lives in a RequestScopedSession, so concurrent callers never
+    share or close each other's session.
     Usage:
         with dbpool as conn:
             conn.find_user("alice")
     """
-    _session: Optional[Session] = None
+    _scope: RequestScopedSession[Session] = RequestScopedSession("db")
+
+    @property
+    def _session(self) -> Optional[Session]:
+        return self._scope.get()
 
     def __enter__(self) -> "DbConnectionPool":
         logger.debug("Opening database connection pool")
-        self._session = SessionLocal()
-        logger.debug(f"Database connection pool opened {self._session}")
+        self._scope.push(SessionLocal())
+        logger.debug("Database connection pool opened %s", self._session)
         return self
 
     def __exit__(self, exc_type, exc, tb):
@@ -86,10 +341,12 @@ class DbConnectionPool(metaclass=Singleton):
                 self._session.rollback()
         finally:
             logger.debug("Closing database connection")
-            self._session.close()
-            logger.debug("Database connection pool closed")
-            self._session = None
-            logger.debug(f"DbConnectionPool._session={self._session}")
+            try:
+                self._session.close()
+            finally:
+                self._scope.pop()
+                logger.debug("Database connection pool closed")
+            logger.debug("DbConnectionPool._session=%s", self._session)
 
 
     # ---- CRUD helpers (SQLModel style) ----
@@ -101,7 +358,7 @@ class DbConnectionPool(metaclass=Singleton):
         return self._session.exec(select(Wallet)).all()
 
     def find(self, resource: str, user_id: str = None, wallet_id: str = None) -> Optional[Wallet]:
-        logger.debug(f"call find_user, params({user_id=}, {wallet_id=})")
+        logger.debug("call find_user, params(user_id=%r, wallet_id=%r)", user_id, wallet_id)
         if self._session is None:
             logger.error("Session not opened. Use 'with dbpool as conn:'")
             raise RuntimeError("Session not opened. Use 'with dbpool as conn:'")
@@ -126,12 +383,15 @@ class DbConnectionPool(metaclass=Singleton):
                    public_address: str,
                    validated_by_blockchain: bool
        ) -> Wallet:
-        logger.debug(f"call add_user, params({user_id=}, {name=}, {network=}, {force_testnet=}, {public_address=}, {validated_by_blockchain=})")
+        logger.debug(
+            "call add_user, params(user_id=%r, name=%r, network=%r, force_testnet=%r, public_address=%r, validated_by_blockchain=%r)",
+            user_id, name, network, force_testnet, public_address, validated_by_blockchain
+        )
         if self._session is None:
             logger.error("Session not opened. Use 'with dbpool as conn:'")
             raise RuntimeError("Session not opened. Use 'with dbpool as conn:'")
         stamp = timestamp_update()
-        logger.debug(f"creating user with timestamp={stamp}")
+        logger.debug("creating user with timestamp=%s", stamp)
         user = self.find('user', user_id=user_id)
         if not user:
             raise ValueError(f"User with id={user_id} not found")
@@ -144,7 +404,7 @@ class DbConnectionPool(metaclass=Singleton):
             user_id=user.user_id,
             user=user
         )
-        logger.debug(f"user={user}")
+        logger.debug("user=%s", user)
         user.wallets.append(wallet)
         user.updated_at = timestamp_update()
         self._session.add(wallet)
@@ -155,7 +415,7 @@ class DbConnectionPool(metaclass=Singleton):
         return user
 
     def update(self, resource: str, user: User = None, wallet: Wallet = None) -> User | Wallet:
-        logger.debug(f"call update_user, user={user}")
+        logger.debug("call update_user, user=%s", user)
         try:
             if self._session is None:
                 logger.error("Session not opened. Use 'with dbpool as conn:'")
@@ -183,12 +443,12 @@ class DbConnectionPool(metaclass=Singleton):
             self._session.flush()
             return user
         except Exception as e:
-            logger.error(f"call update_user, end with error : {e}")
+            logger.error("call update_user, end with error : %s", e)
             raise e
 
     def delete_wallet(self, wallet_id: str) -> bool:
         try:
-            logger.debug(f"call delete_wallet, params({wallet_id=})")
+            logger.debug("call delete_wallet, params(wallet_id=%r)", wallet_id)
             if self._session is None:
                 logger.error("Session not opened. Use 'with dbpool as conn:'")
                 raise RuntimeError("Session not opened. Use 'with dbpool as conn:'")
@@ -205,8 +465,555 @@ class DbConnectionPool(metaclass=Singleton):
             self._session.flush()
             return True
         except Exception as e:
-            logger.error(f"call delete_wallet, end with error : {e}")
+            logger.error("call delete_wallet, end with error : %s", e)
             return False
 
 
 dbpool = DbConnectionPool()
+
+
+# ---------- Async variant of the context-managed pool ----------
+class AsyncDbConnectionPool(metaclass=Singleton):
+    """
+    Async counterpart of DbConnectionPool, backed by the async engine so the
+    event loop is never blocked on a database round-trip. Each request/task
+    gets its own session through a RequestScopedSession.
+    Usage:
+        async with async_dbpool as conn:
+            await conn.find('user', user_id="...")
+    """
+    _scope: RequestScopedSession[AsyncSession] = RequestScopedSession("async_db")
+    # admission control (services.admission) installs itself here: enter() may
+    # take a slot for the outermost session of a request, held until it closes
+    gate = None
+
+    @property
+    def _session(self) -> Optional[AsyncSession]:
+        return self._scope.get()
+
+    async def __aenter__(self) -> "AsyncDbConnectionPool":
+        logger.debug("Opening async database session")
+        admitted = self._session is None and self.gate is not None and await self.gate.enter()
+        try:
+            session = AsyncSessionLocal()
+        except BaseException:
+            if admitted:
+                self.gate.release()
+            raise
+        if admitted:
+            session.info["admission_slot"] = True
+        self._scope.push(session)
+        logger.debug("Async database session opened %s", self._session)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        logger.debug("Closing async database session")
+        if self._session is None:
+            logger.debug("Async database session already closed")
+            return
+        try:
+            if exc is None:
+                logger.debug("Committing database changes")
+                await self._session.commit()
+            else:
+                logger.debug("Rolling back database changes")
+                await self._session.rollback()
+        finally:
+            session = self._session
+            # drop anything a concurrent reader cached between our write and commit
+            entity_cache.invalidate(*session.info.pop("invalidate", ()))
+            logger.debug("Closing database connection")
+            try:
+                await session.close()
+            finally:
+                # even when close() fails: the slot and the scope are this context's to give back
+                if session.info.pop("admission_slot", False):
+                    self.gate.release()
+                self._scope.pop()
+                logger.debug("Async database session closed")
+
+    def _require_session(self) -> AsyncSession:
+        if self._session is None:
+            logger.error("Session not opened. Use 'async with async_dbpool as conn:'")
+            raise RuntimeError("Session not opened. Use 'async with async_dbpool as conn:'")
+        return self._session
+
+    def _invalidate(self, user_id: str = None, wallet_id: str = None) -> None:
+        keys = []
+        if user_id:
+            keys.extend((user_cache_key(user_id), user_wallets_cache_key(user_id)))
+        if wallet_id:
+            keys.append(wallet_cache_key(wallet_id))
+        entity_cache.invalidate(*keys)
+        self._require_session().info.setdefault("invalidate", set()).update(keys)
+
+    # ---- CRUD helpers (SQLModel style) ----
+    async def all_wallets(self):
+        logger.debug("call all_wallets")
+        session = self._require_session()
+        return (await session.exec(select(Wallet))).all()
+
+    async def find(self,
+                   resource: str,
+                   user_id: str = None,
+                   wallet_id: str = None,
+                   cached: bool = False
+       ) -> Optional[User | Wallet | UserSnapshot | WalletSnapshot]:
+        """
+        Looks up a user (with its wallets) or a wallet.
+        With `cached=True` the lookup is read-through `entity_cache` and returns
+        a detached, read-only UserSnapshot/WalletSnapshot instead of an ORM
+        object; use it only on read paths.
+        """
+        logger.debug(
+            "call find, params(resource=%r, user_id=%r, wallet_id=%r, cached=%r)",
+            resource, user_id, wallet_id, cached
+        )
+        session = self._require_session()
+        if resource == "wallet":
+            resource = Wallet
+        elif resource == "user":
+            resource = User
+        else:
+            raise ValueError(f"Unknown resource: {resource}")
+        if user_id:
+            statement = select(resource).where(resource.user_id == user_id)
+        elif wallet_id:
+            statement = select(resource).where(resource.wallet_id == wallet_id)
+        else:
+            raise ValueError("Either user_id or wallet_id must be provided")
+        if not cached:
+            return (await session.exec(statement)).unique().first()
+        if resource is User and user_id:
+            key = user_cache_key(user_id)
+        elif resource is Wallet and wallet_id:
+            key = wallet_cache_key(wallet_id)
+        else:
+            raise ValueError("Cached lookups are keyed by user_id for users and wallet_id for wallets")
+        snapshot = entity_cache.get(key)
+        if snapshot is not MISSING:
+            return snapshot
+        stamp = entity_cache.stamp(key)
+        found = (await session.exec(statement)).unique().first()
+        if found is None:
+            return None
+        snapshot = UserSnapshot.from_user(found) if resource is User else WalletSnapshot.from_wallet(found)
+        entity_cache.set(key, snapshot, stamp=stamp)
+        return snapshot
+
+    async def find_user_wallets(self, user_id: str, cached: bool = False) -> Optional[tuple]:
+        """
+        Lean read path for a user's wallet listing: one indexed LEFT JOIN from
+        users_tbl to wallets_tbl selecting only the UserWalletObject columns
+        (plus updated_at, the version of each row).
+        Returns plain rows (no ORM entities, no identity map), `()` for a user
+        without wallets and None when the user does not exist. Ownership of a
+        wallet is simply `wallet_id in {row.wallet_id for row in rows}`.
+        """
+        logger.debug("call find_user_wallets, params(user_id=%r, cached=%r)", user_id, cached)
+        session = self._require_session()
+        key = user_wallets_cache_key(user_id)
+        if cached:
+            rows = entity_cache.get(key)
+            if rows is not MISSING:
+                return rows
+        stamp = entity_cache.stamp(key)
+        statement = (
+            select(
+                User.user_id,
+                Wallet.wallet_id,
+                Wallet.name,
+                Wallet.created_at,
+                Wallet.public_address,
+                Wallet.network,
+                Wallet.force_testnet,
+                Wallet.validated_by_blockchain,
+                Wallet.updated_at,
+            )
+            .select_from(User)
+            .outerjoin(Wallet, Wallet.user_id == User.user_id)
+            .where(User.user_id == user_id)
+            .order_by(Wallet.created_at, Wallet.wallet_id)
+        )
+        result = (await session.exec(statement)).all()
+        if not result:
+            return None
+        rows = tuple(row for row in result if row.wallet_id is not None)
+        if cached:
+            entity_cache.set(key, rows, stamp=stamp)
+        return rows
+
+    async def find_user_wallets_version(self, user_id: str) -> Optional[tuple]:
+        """
+        Cheap version of find_user_wallets(): (users.updated_at, wallet count,
+        max(wallets.updated_at)) from one aggregate over the user_id index.
+        Any write to the user's wallets changes at least one of them. None when
+        the user does not exist.
+        """
+        session = self._require_session()
+        statement = (
+            select(User.updated_at, func.count(Wallet.wallet_id), func.max(Wallet.updated_at))
+            .select_from(User)
+            .outerjoin(Wallet, Wallet.user_id == User.user_id)
+            .where(User.user_id == user_id)
+            .group_by(User.user_id, User.updated_at)
+        )
+        row = (await session.exec(statement)).first()
+        return tuple(row) if row else None
+
+    async def find_user_wallets_page(self,
+                                     user_id: str,
+                                     limit: int,
+                                     cursor: Optional[str] = None,
+                                     fields: Optional[list[str]] = None,
+                                     network: Optional[str] = None,
+                                     validated_by_blockchain: Optional[bool] = None
+       ) -> Optional[tuple[list[dict], Optional[str]]]:
+        """
+        Keyset page of a user's wallets ordered by (created_at, wallet_id).
+        Field projection and the network/validated filters are pushed into the
+        single LEFT JOIN statement, and the cursor turns into a row-value
+        comparison, so page N costs the same as page 1.
+        Returns (wallets, next_cursor), or None when the user does not exist.
+        """
+        logger.debug(
+            "call find_user_wallets_page, params(user_id=%r, limit=%r, cursor=%r, fields=%r, network=%r, validated_by_blockchain=%r)",
+            user_id, limit, cursor, fields, network, validated_by_blockchain
+        )
+        session = self._require_session()
+        fields = fields or list(USER_WALLET_COLUMNS)
+        unknown = set(fields) - set(USER_WALLET_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown fields: {sorted(unknown)}")
+        join_on = [Wallet.user_id == User.user_id]
+        if network is not None:
+            join_on.append(Wallet.network == network)
+        if validated_by_blockchain is not None:
+            join_on.append(Wallet.validated_by_blockchain == validated_by_blockchain)
+        if cursor:
+            join_on.append(tuple_(Wallet.created_at, Wallet.wallet_id) > tuple_(*decode_wallet_cursor(cursor)))
+        statement = (
+            select(
+                Wallet.wallet_id.label("_key_wallet_id"),
+                Wallet.created_at.label("_key_created_at"),
+                *(USER_WALLET_COLUMNS[field].label(field) for field in fields)
+            )
+            .select_from(User)
+            .outerjoin(Wallet, and_(*join_on))
+            .where(User.user_id == user_id)
+            .order_by(Wallet.created_at, Wallet.wallet_id)
+            .limit(limit + 1)
+        )
+        rows = (await session.exec(statement)).all()
+        if not rows:
+            return None
+        rows = [row for row in rows if row._key_wallet_id is not None]
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = encode_wallet_cursor(rows[-1]._key_created_at, rows[-1]._key_wallet_id)
+        wallets = []
+        for row in rows:
+            wallet = {field: getattr(row, field) for field in fields}
+            if "created_at" in wallet:
+                wallet["created_at"] = wallet["created_at"].isoformat()
+            wallets.append(wallet)
+        return wallets, next_cursor
+
+    async def add_wallet(self,
+                         user_id: str,
+                         name: str,
+                         network: str,
+                         force_testnet: bool,
+                         public_address: str,
+                         validated_by_blockchain: bool,
+                         enqueue_validation: bool = False
+       ) -> User:
+        logger.debug(
+            "call add_wallet, params(user_id=%r, name=%r, network=%r, force_testnet=%r, public_address=%r, validated_by_blockchain=%r, enqueue_validation=%r)",
+            user_id, name, network, force_testnet, public_address, validated_by_blockchain, enqueue_validation
+        )
+        session = self._require_session()
+        stamp = timestamp_update()
+        user = await self.find('user', user_id=user_id)
+        if not user:
+            raise ValueError(f"User with id={user_id} not found")
+        wallet = Wallet(
+            name=f"wallet-{name}-{stamp}",
+            public_address=public_address,
+            network=network,
+            force_testnet=force_testnet,
+            validated_by_blockchain=validated_by_blockchain,
+            user_id=user.user_id,
+            user=user
+        )
+        user.updated_at = stamp
+        session.add(wallet)
+        session.add(user)
+        if enqueue_validation:
+            session.add(WalletValidationJob(
+                wallet_id=wallet.wallet_id,
+                user_id=user.user_id,
+                public_address=public_address,
+                network=network
+            ))
+        await session.flush()   # assign PKs
+        await session.refresh(user)
+        self._invalidate(user_id=user.user_id)
+        return user
+
+    async def add_wallets(self, user_id: str, wallets: list[dict], enqueue_validation: bool = False) -> list[str]:
+        """
+        Inserts many wallets for one user with a single multi-row INSERT and
+        bumps users_tbl.updated_at once. Each item carries the add_wallet
+        keyword arguments except user_id. Returns the new wallet ids in order.
+        """
+        logger.debug("call add_wallets, params(user_id=%r, len(wallets)=%r)", user_id, len(wallets))
+        session = self._require_session()
+        if not wallets:
+            return []
+        stamp = timestamp_update()
+        rows = [
+            dict(
+                wallet_id=uuid4().hex,
+                name=f"wallet-{wallet['name']}-{stamp}",
+                public_address=wallet["public_address"],
+                network=wallet["network"],
+                force_testnet=wallet["force_testnet"],
+                validated_by_blockchain=wallet["validated_by_blockchain"],
+                user_id=user_id,
+                created_at=stamp,
+                updated_at=stamp,
+            )
+            for wallet in wallets
+        ]
+        await session.exec(insert(Wallet).values(rows))
+        if enqueue_validation:
+            await session.exec(insert(WalletValidationJob).values([
+                dict(
+                    job_id=uuid4().hex,
+                    wallet_id=row["wallet_id"],
+                    user_id=user_id,
+                    public_address=row["public_address"],
+                    network=row["network"],
+                    attempts=0,
+                    available_at=stamp,
+                    created_at=stamp,
+                )
+                for row in rows
+            ]))
+        await session.exec(update(User).where(User.user_id == user_id).values(updated_at=stamp))
+        self._invalidate(user_id=user_id)
+        return [row["wallet_id"] for row in rows]
+
+    async def delete_wallets(self, user_id: str, wallet_ids: list[str]) -> set[str]:
+        """
+        Deletes the given wallets owned by `user_id` with one
+        `DELETE ... WHERE wallet_id IN (...)` and bumps users_tbl.updated_at
+        once. Ids that do not exist or belong to someone else are left alone.
+        Returns the ids that were actually deleted.
+        """
+        logger.debug("call delete_wallets, params(user_id=%r, len(wallet_ids)=%r)", user_id, len(wallet_ids))
+        session = self._require_session()
+        if not wallet_ids:
+            return set()
+        await session.exec(delete(WalletValidationJob).where(
+            WalletValidationJob.user_id == user_id, WalletValidationJob.wallet_id.in_(set(wallet_ids))
+        ))
+        statement = (
+            delete(Wallet)
+            .where(Wallet.user_id == user_id, Wallet.wallet_id.in_(set(wallet_ids)))
+            .returning(Wallet.wallet_id)
+        )
+        deleted = set((await session.exec(statement)).scalars().all())
+        if deleted:
+            await session.exec(update(User).where(User.user_id == user_id).values(updated_at=timestamp_update()))
+        self._invalidate(user_id=user_id)
+        for wallet_id in deleted:
+            self._invalidate(wallet_id=wallet_id)
+        return deleted
+
+    # ---- background validation queue ----
+    async def claim_validation_jobs(self, limit: int, lease: float) -> list[WalletValidationJob]:
+        """
+        Claims up to `limit` due jobs with `SELECT ... FOR UPDATE SKIP LOCKED`,
+        so concurrent workers (and processes) never pick the same rows, and
+        leases them by pushing available_at `lease` seconds ahead. The claim is
+        committed right away; a job whose worker dies is retried once the
+        lease runs out.
+        """
+        session = self._require_session()
+        now = timestamp_update()
+        statement = (
+            select(WalletValidationJob)
+            .where(WalletValidationJob.available_at <= now)
+            .order_by(WalletValidationJob.available_at)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        jobs = list((await session.exec(statement)).all())
+        if jobs:
+            # re-checking available_at keeps the claim exclusive where SKIP LOCKED is a no-op (SQLite)
+            leased = set((await session.exec(
+                update(WalletValidationJob)
+                .where(WalletValidationJob.job_id.in_([job.job_id for job in jobs]),
+                       WalletValidationJob.available_at <= now)
+                .values(available_at=now + timedelta(seconds=lease), attempts=WalletValidationJob.attempts + 1)
+                .returning(WalletValidationJob.job_id)
+            )).scalars().all())
+            jobs = [job for job in jobs if job.job_id in leased]
+        await session.commit()
+        return jobs
+
+    async def complete_validation_jobs(self, jobs: list[WalletValidationJob], validated_wallet_ids: list[str]) -> None:
+        """Marks the validated wallets in one UPDATE and removes the finished jobs in one DELETE."""
+        session = self._require_session()
+        if validated_wallet_ids:
+            await session.exec(
+                update(Wallet)
+                .where(Wallet.wallet_id.in_(validated_wallet_ids))
+                .values(validated_by_blockchain=True, updated_at=timestamp_update())
+            )
+        if jobs:
+            await session.exec(delete(WalletValidationJob).where(WalletValidationJob.job_id.in_([job.job_id for job in jobs])))
+        for job in jobs:
+            self._invalidate(user_id=job.user_id, wallet_id=job.wallet_id)
+
+    async def validation_queue_stats(self) -> dict:
+        session = self._require_session()
+        depth, oldest = (await session.exec(
+            select(func.count(WalletValidationJob.job_id), func.min(WalletValidationJob.created_at))
+        )).one()
+        lag = (timestamp_update() - oldest).total_seconds() if oldest else 0.0
+        return {"depth": depth, "lag_seconds": lag}
+
+    # ---- api keys ----
+    async def find_api_key(self, key_hash: str) -> Optional[tuple[str, str]]:
+        """(api_key_id, user_id) of the active key with this hash, through the unique key_content index."""
+        session = self._require_session()
+        statement = (
+            select(ApiKey.api_key_id, ApiKey.user_id)
+            .where(ApiKey.key_content == key_hash, ApiKey.active == True)  # noqa: E712
+        )
+        row = (await session.exec(statement)).first()
+        return (row.api_key_id, row.user_id) if row else None
+
+    async def issue_api_key(self, user_id: str, key_hash: str) -> str:
+        """Stores a new active key hash for the user, replacing the previous key. Returns the api_key_id."""
+        session = self._require_session()
+        await session.exec(delete(ApiKey).where(ApiKey.user_id == user_id))
+        api_key = ApiKey(user_id=user_id, key_content=key_hash, active=True)
+        session.add(api_key)
+        await session.flush()
+        self._invalidate(user_id=user_id)
+        return api_key.api_key_id
+
+    async def touch_api_keys(self, last_used: dict[str, datetime]) -> None:
+        """Write-behind of api_keys_tbl.last_used: one executemany UPDATE by primary key for the whole batch."""
+        session = self._require_session()
+        if last_used:
+            await session.execute(
+                update(ApiKey),
+                [{"api_key_id": api_key_id, "last_used": stamp} for api_key_id, stamp in last_used.items()]
+            )
+
+    # ---- idempotency keys ----
+    async def claim_idempotency_key(self, key_id: str, user_id: str, request_hash: str,
+                                    lease: float) -> Optional[IdempotencyKey]:
+        """
+        Claims the key for a request about to run, as a pending row leased for
+        `lease` seconds. Returns None once claimed, else the live row that
+        holds the key (a stored response, or a request still being handled).
+        An expired row is replaced. A concurrent claim of the same key makes
+        the INSERT fail with IntegrityError, at flush or commit.
+        """
+        session = self._require_session()
+        now = timestamp_update()
+        row = (await session.exec(select(IdempotencyKey).where(IdempotencyKey.key_id == key_id))).first()
+        if row is not None:
+            if row.expires_at > now:
+                return row
+            await session.exec(delete(IdempotencyKey).where(IdempotencyKey.key_id == key_id,
+                                                            IdempotencyKey.expires_at <= now))
+        session.add(IdempotencyKey(key_id=key_id, user_id=user_id, request_hash=request_hash,
+                                   created_at=now, expires_at=now + timedelta(seconds=lease)))
+        await session.flush()
+        return None
+
+    async def complete_idempotency_key(self, key_id: str, status_code: int, response_body: str,
+                                       expires_at: datetime) -> None:
+        """Stores the response of a claimed key, replayed until `expires_at`."""
+        session = self._require_session()
+        await session.exec(
+            update(IdempotencyKey)
+            .where(IdempotencyKey.key_id == key_id)
+            .values(status_code=status_code, response_body=response_body, expires_at=expires_at)
+        )
+
+    async def release_idempotency_key(self, key_id: str) -> None:
+        """Drops a pending claim whose request failed, so a retry runs it again."""
+        session = self._require_session()
+        await session.exec(delete(IdempotencyKey).where(IdempotencyKey.key_id == key_id,
+                                                        IdempotencyKey.status_code == 0))
+
+    async def purge_expired_idempotency_keys(self) -> int:
+        session = self._require_session()
+        result = await session.exec(delete(IdempotencyKey).where(IdempotencyKey.expires_at <= timestamp_update()))
+        return result.rowcount
+
+    async def update(self, resource: str, user: User = None, wallet: Wallet = None) -> User | Wallet:
+        logger.debug("call update, params(resource=%r, user=%r, wallet=%r)", resource, user, wallet)
+        try:
+            session = self._require_session()
+            if resource == "wallet":
+                resource = Wallet
+            elif resource == "user":
+                resource = User
+            else:
+                raise ValueError(f"Unknown resource: {resource}")
+            if user:
+                user.updated_at = timestamp_update()
+                values = {field: getattr(user, field) for field in user.model_fields_set}
+                values["updated_at"] = user.updated_at
+                statement = update(resource).where(resource.user_id == user.user_id).values(values)
+            elif wallet:
+                wallet.updated_at = timestamp_update()
+                values = {field: getattr(wallet, field) for field in wallet.model_fields_set}
+                values["updated_at"] = wallet.updated_at
+                statement = update(resource).where(resource.wallet_id == wallet.wallet_id).values(values)
+            else:
+                raise ValueError("Either user or wallet must be provided")
+            await session.exec(statement)
+            self._invalidate(user_id=user.user_id if user else None, wallet_id=wallet.wallet_id if wallet else None)
+            if wallet:
+                owner_id = (await session.exec(select(Wallet.user_id).where(Wallet.wallet_id == wallet.wallet_id))).first()
+                self._invalidate(user_id=owner_id)
+            await session.commit()
+            entity_cache.invalidate(*session.info.pop("invalidate", ()))
+            return user or wallet
+        except Exception as e:
+            logger.error("call update, end with error : %s", e)
+            raise e
+
+    async def delete_wallet(self, wallet_id: str) -> bool:
+        try:
+            logger.debug("call delete_wallet, params(wallet_id=%r)", wallet_id)
+            session = self._require_session()
+            wallet = await self.find('wallet', wallet_id=wallet_id)
+            if not wallet:
+                raise ValueError(f"Wallet with id={wallet_id} not found")
+            user = await self.find('user', user_id=wallet.user_id)
+            if wallet not in user.wallets:
+                raise ValueError(f"Wallet with id={wallet_id} is not associated with user {user.user_id}")
+            await session.exec(delete(WalletValidationJob).where(WalletValidationJob.wallet_id == wallet_id))
+            await session.exec(delete(Wallet).where(Wallet.wallet_id == wallet_id))
+            self._invalidate(user_id=user.user_id, wallet_id=wallet_id)
+            await session.commit()
+            entity_cache.invalidate(*session.info.pop("invalidate", ()))
+            return True
+        except Exception as e:
+            logger.error("call delete_wallet, end with error : %s", e)
+            return False
+
+
+async_dbpool = AsyncDbConnectionPool()
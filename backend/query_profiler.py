@@ -0,0 +1,154 @@
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Optional
+from decouple import config as EnvConfig
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+from services.metrics import registry, Histogram, Counter
+from utils import Logger
+
+logger = Logger("backend.query_profiler")
+
+SQL_PROFILING = EnvConfig("SQL_PROFILING", default="1") == "1"
+SLOW_QUERY_MS = float(EnvConfig("SLOW_QUERY_MS", default="200"))
+# the same statement this many times in one request is reported as a likely N+1
+SQL_REPEAT_THRESHOLD = int(EnvConfig("SQL_REPEAT_THRESHOLD", default="3"))
+SQL_SLOWEST_KEPT = int(EnvConfig("SQL_SLOWEST_KEPT", default="3"))
+SERVER_TIMING = EnvConfig("SERVER_TIMING", default="0") == "1"
+
+db_queries_per_request = registry.register(Histogram(
+    "http_request_db_queries", "SQL statements executed per request", ("route",),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55)))
+db_time_per_request = registry.register(Histogram(
+    "http_request_db_seconds", "Time spent in SQL statements per request", ("route",)))
+db_slow_queries = registry.register(Counter(
+    "db_slow_queries_total", "Statements slower than SLOW_QUERY_MS"))
+db_repeated_statements = registry.register(Counter(
+    "db_repeated_statements_total", "Requests running one statement SQL_REPEAT_THRESHOLD times or more", ("route",)))
+
+
+def _shorten(statement: str, limit: int = 200) -> str:
+    statement = " ".join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + "..."
+
+
+class QueryStats(object):
+    """SQL statements run on behalf of one request."""
+    __slots__ = ("count", "total", "statements", "slowest")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        # statement -> [executions, seconds]
+        self.statements: dict[str, list] = {}
+        # [(seconds, statement)], slowest first
+        self.slowest: list[tuple[float, str]] = []
+
+    def record(self, statement: str, elapsed: float) -> None:
+        self.count += 1
+        self.total += elapsed
+        entry = self.statements.get(statement)
+        if entry is None:
+            self.statements[statement] = [1, elapsed]
+        else:
+            entry[0] += 1
+            entry[1] += elapsed
+        if len(self.slowest) < SQL_SLOWEST_KEPT or elapsed > self.slowest[-1][0]:
+            self.slowest.append((elapsed, statement))
+            self.slowest.sort(key=lambda item: item[0], reverse=True)
+            del self.slowest[SQL_SLOWEST_KEPT:]
+
+    def repeated(self) -> list[tuple[str, int]]:
+        """Statements executed SQL_REPEAT_THRESHOLD times or more (same SQL, any parameters)."""
+        return [(statement, executions) for statement, (executions, _) in self.statements.items()
+                if executions >= SQL_REPEAT_THRESHOLD]
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.total * 1000:.2f};desc="{self.count} queries"'
+
+
+# stats of the request being served; the ContextVar follows the request into
+# SQLAlchemy's greenlets, so the cursor events below see it
+_current: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current_query_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+def instrument_queries(engine) -> None:
+    """Times every statement of `engine` (sync or async) from the cursor execute events."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = perf_counter() - conn.info["query_started"].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.record(statement, elapsed)
+        if elapsed * 1000 >= SLOW_QUERY_MS:
+            db_slow_queries.inc()
+            logger.warning("slow query %.1fms: %s", elapsed * 1000, _shorten(statement))
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        # after_cursor_execute is not called for failed statements
+        connection = exception_context.connection
+        if connection is not None and connection.info.get("query_started"):
+            connection.info["query_started"].pop()
+
+
+class QueryProfilingMiddleware:
+    """
+    Pure ASGI middleware collecting the SQL statements of each request: query
+    count, DB time, slowest statements and statements repeated within the
+    request (likely N+1). The summary is logged, recorded in /metrics and,
+    with SERVER_TIMING=1, sent back in a `Server-Timing: db;dur=...` header.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not SQL_PROFILING:
+            await self.app(scope, receive, send)
+            return
+        stats = QueryStats()
+        token = _current.set(stats)
+
+        async def send_wrapper(message: Message) -> None:
+            if SERVER_TIMING and message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("Server-Timing", stats.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            self.report(scope, stats)
+
+    @staticmethod
+    def report(scope: Scope, stats: QueryStats) -> None:
+        route = scope.get("route_path", "unmatched")
+        db_queries_per_request.observe(stats.count, route)
+        if not stats.count:
+            return
+        db_time_per_request.observe(stats.total, route)
+        repeated = stats.repeated()
+        if repeated:
+            db_repeated_statements.inc(route)
+            logger.warning(
+                "%s %s: %s queries in %.1fms, repeated statements (possible N+1): %s",
+                scope["method"], route, stats.count, stats.total * 1000,
+                "; ".join(f"{executions}x {_shorten(statement)}" for statement, executions in repeated)
+            )
+        logger.debug(
+            "%s %s: %s queries in %.1fms, slowest: %s",
+            scope["method"], route, stats.count, stats.total * 1000,
+            "; ".join(f"{elapsed * 1000:.1f}ms {_shorten(statement, 80)}" for elapsed, statement in stats.slowest)
+        )
@@ -39,7 +39,8 @@ class ApiKey(SQLModel, table=True):
     __tablename__ = "api_keys_tbl"
     api_key_id: str = Field(default_factory=lambda: uuid4().hex, primary_key=True)
     active: bool = Field(index=True, default=False)
-    key_content: str = Field(index=True, max_length=320)
+    # sha256 hex digest of the key, the raw key is only shown once when issued
+    key_content: str = Field(index=True, unique=True, max_length=320)
     last_used: Optional[datetime] = Field(index=True, default=None)
     created_at: datetime = Field(index=True, default_factory=timestamp_update)
     updated_at: datetime = Field(index=True, default_factory=timestamp_update)
@@ -123,3 +124,40 @@ class Broadcast(SQLModel, table=True):
     updated_at: Optional[datetime] = Field(default=None, index=True)
     txid: str = Field(default=None, index=True, unique=True, nullable=True)
     status: str = Field(default=None, index=True, nullable=True)
+
+
+class WalletValidationJob(SQLModel, table=True):
+    __tablename__ = "wallet_validation_jobs_tbl"
+    job_id: str = Field(default_factory=lambda: uuid4().hex, primary_key=True)
+    wallet_id: str = Field(foreign_key="wallets_tbl.wallet_id", index=True, unique=True)
+    user_id: str = Field(foreign_key="users_tbl.user_id", index=True)
+    public_address: str = Field(max_length=128)
+    network: Optional[str] = Field(default=None)
+    attempts: int = Field(default=0)
+    available_at: datetime = Field(default_factory=timestamp_update, index=True)
+    created_at: datetime = Field(default_factory=timestamp_update, index=True)
+
+
+class SchemaVersion(SQLModel, table=True):
+    """Fingerprint of the DDL that was last applied, so boots with an unchanged schema skip create_all."""
+    __tablename__ = "schema_version_tbl"
+    name: str = Field(primary_key=True)
+    fingerprint: str = Field(max_length=64)
+    applied_at: datetime = Field(default_factory=timestamp_update)
+
+
+class IdempotencyKey(SQLModel, table=True):
+    """
+    Outcome of a POST sent with an Idempotency-Key header, replayed to retries
+    of the same request. status_code 0 marks a request still being handled:
+    until expires_at (its lease) the key belongs to the worker that claimed it.
+    """
+    __tablename__ = "idempotency_keys_tbl"
+    # sha256 of user_id + the client's key, so keys never collide across users
+    key_id: str = Field(primary_key=True, max_length=64)
+    user_id: str = Field(foreign_key="users_tbl.user_id", index=True)
+    request_hash: str = Field(max_length=64)
+    status_code: int = Field(default=0)
+    response_body: Optional[str] = Field(default=None)
+    created_at: datetime = Field(default_factory=timestamp_update)
+    expires_at: datetime = Field(index=True)
@@ -0,0 +1,93 @@
+"""
+Micro-benchmark of the offline address syntax check (services/address_format.py).
+Generates random well-formed addresses of every supported kind, plus
+corrupted and wrong-network variants, and reports the per-call cost of
+address_format_error() and of the bulk address_format_errors() (best of 5
+runs each). The bulk mode only saves the per-item network lookup and
+repeated items, so expect it on par with single calls, not faster by much.
+
+Usage:
+    python -m benchmarks.bench_address_format --count 20000
+"""
+import os
+import random
+import argparse
+from time import perf_counter
+from services.address_format import address_format_error, address_format_errors, encode_base58check, \
+    encode_segwit_address
+
+KNOWN_VALID = [
+    ("1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2", "bitcoin", False),
+    ("3J98t1WpEZ73CNmQviecrnyiWrnqRhWNLy", "bitcoin", False),
+    ("bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4", "bitcoin", False),
+    ("BC1QW508D6QEJXTDG4Y5R3ZARVARY0C5XW7KV8F3T4", "bitcoin", False),
+    ("bc1p5d7rjq7g6rdk2yhzks9smlaqtedr4dekq08ge8ztwac72sfr9rusxg3297", "bitcoin", False),
+]
+KNOWN_INVALID = [
+    ("1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN3", "bitcoin", False),   # checksum
+    ("1BvBMSEYstWetqTFn5Au4m4GFg7xJaNVN2", "bitcoin", True),    # mainnet prefix on testnet
+    ("bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t5", "bitcoin", False),   # checksum
+    ("bc1qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4", "testnet", False),   # wrong hrp
+    ("bc1Qw508d6qejxtdg4y5r3zarvary0c5xw7kv8f3t4", "bitcoin", False),   # mixed case
+    ("addr-1", "bitcoin", False),
+]
+
+
+def random_address(testnet: bool) -> str:
+    hrp, p2pkh, p2sh = ("tb", 0x6f, 0xc4) if testnet else ("bc", 0x00, 0x05)
+    kind = random.randrange(4)
+    if kind == 0:
+        return encode_base58check(bytes([p2pkh]) + os.urandom(20))
+    if kind == 1:
+        return encode_base58check(bytes([p2sh]) + os.urandom(20))
+    if kind == 2:
+        return encode_segwit_address(hrp, 0, os.urandom(random.choice((20, 32))))
+    return encode_segwit_address(hrp, 1, os.urandom(32))
+
+
+def corrupt(address: str) -> str:
+    index = random.randrange(4, len(address))
+    return address[:index] + ("q" if address[index] != "q" else "p") + address[index + 1:]
+
+
+def make_items(count: int) -> list[tuple[str, str, bool]]:
+    items = []
+    for _ in range(count):
+        testnet = random.random() < 0.3
+        address = random_address(testnet)
+        roll = random.random()
+        if roll < 0.1:
+            address = corrupt(address)
+        elif roll < 0.15:
+            testnet = not testnet
+        items.append((address, "bitcoin", testnet))
+    return items
+
+
+def timed(label: str, count: int, func, repeat: int = 5) -> None:
+    """Best of `repeat` runs: the least disturbed by the rest of the machine."""
+    elapsed = float("inf")
+    for _ in range(repeat):
+        started = perf_counter()
+        func()
+        elapsed = min(elapsed, perf_counter() - started)
+    print(f"{label:>8}: {count / elapsed:10.0f} addresses/s  {elapsed / count * 1e6:6.2f} us/address")
+
+
+def main(count: int):
+    for item in KNOWN_VALID:
+        assert address_format_error(*item) is None, item
+    for item in KNOWN_INVALID:
+        assert address_format_error(*item) is not None, item
+    items = make_items(count)
+    rejected = sum(error is not None for error in address_format_errors(items))
+    print(f"{count} addresses, {rejected} rejected")
+    timed("single", count, lambda: [address_format_error(*item) for item in items])
+    timed("bulk", count, lambda: address_format_errors(items))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--count", type=int, default=20000)
+    args = parser.parse_args()
+    main(count=args.count)
@@ -0,0 +1,77 @@
+"""
+Per-request authentication overhead of the wallet routes.
+
+- before: the token verified by test_authorization_token and once more by the
+          handler's get_current_user_session() (two jwt.decode calls)
+- cold:   verified once per request, principal kept on request.state
+- warm:   same, with the verified-token cache hit by a returning client
+
+Usage:
+    python -m benchmarks.bench_auth --requests 20000 --clients 100
+"""
+import os
+import asyncio
+import argparse
+from time import time, perf_counter
+os.environ.setdefault("LOCAL", "1")
+os.environ.setdefault("TOKEN_KEY", "00112233445566778899aabbccddeeff")
+import jwt
+from starlette.requests import Request
+from security.tokenization import ALGORITHM, SECRET_KEY, decode_jwt, get_current_user_session, token_cache
+
+
+def make_request(token: str) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/wallets",
+        "headers": [(b"authorization", f"Bearer {token}".encode())],
+    })
+
+
+async def old_get_current_user_session(request: Request):
+    if 'docs' in request.url.path or 'openapi.json' in request.url.path:
+        return None
+    return await decode_jwt(request.headers.get('Authorization').split(' ')[1])
+
+
+async def before(token: str) -> str:
+    request = make_request(token)
+    await old_get_current_user_session(request)
+    return await old_get_current_user_session(request)
+
+
+async def after(token: str) -> str:
+    request = make_request(token)
+    # decorator + handler, as on every protected route
+    await get_current_user_session(request)
+    return await get_current_user_session(request)
+
+
+async def timed(label: str, handler, tokens: list[str], requests: int, clear: bool = False) -> None:
+    started = perf_counter()
+    for index in range(requests):
+        if clear:
+            token_cache.clear()
+        await handler(tokens[index % len(tokens)])
+    elapsed = perf_counter() - started
+    print(f"{label:>7}: {elapsed / requests * 1e6:7.2f} us/request")
+
+
+async def main(requests: int, clients: int):
+    expires = int(time()) + 1800
+    tokens = [jwt.encode({"sub": f"user-{index}", "exp": expires}, SECRET_KEY, algorithm=ALGORITHM)
+              for index in range(clients)]
+    await timed("before", before, tokens, requests)
+    await timed("cold", after, tokens, requests, clear=True)
+    token_cache.clear()
+    await timed("warm", after, tokens, requests)
+    print(token_cache.stats())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--clients", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main(requests=args.requests, clients=args.clients))
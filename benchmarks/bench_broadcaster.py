@@ -0,0 +1,89 @@
+"""
+Broadcaster client throughput against the local stub, served from its own
+process over a real localhost socket. Latencies are measured from the moment
+the burst of calls is issued, i.e. what concurrent requests would observe.
+
+- blocking: a shared requests.Session called from the event loop (the old client)
+- async:    the pooled httpx.AsyncClient based Broadcaster
+
+Usage:
+    python -m benchmarks.bench_broadcaster --calls 200 --latency-ms 20
+"""
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import requests
+import subprocess
+from time import perf_counter
+from statistics import quantiles
+from services.broadcaster import broadcaster
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def blocking_call(session: requests.Session, url: str, index: int):
+    response = session.post(url, params={"address": f"addr-{index}", "network": "bitcoin"},
+                            headers={"Authorization": "Bearer bench"})
+    response.raise_for_status()
+    return response.json()
+
+
+async def async_call(index: int):
+    return await broadcaster.test_wallet(address=f"addr-{index}", network="bitcoin", auth_token="bench")
+
+
+async def timed(call, started: float) -> float:
+    await call
+    return perf_counter() - started
+
+
+async def run(name: str, make_call, calls: int):
+    started = perf_counter()
+    latencies = await asyncio.gather(*(timed(make_call(index), started) for index in range(calls)))
+    elapsed = perf_counter() - started
+    p50, p95, p99 = (q * 1000 for q in (quantiles(latencies, n=100)[i] for i in (49, 94, 98)))
+    print(f"{name:>9}: {calls / elapsed:8.1f} calls/s  p50={p50:7.1f}ms p95={p95:7.1f}ms p99={p99:7.1f}ms")
+
+
+def start_stub(port: int, latency_ms: float) -> subprocess.Popen:
+    stub = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.broadcaster_stub", "--port", str(port), "--latency-ms", str(latency_ms)
+    ])
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return stub
+        except OSError:
+            time.sleep(0.05)
+    stub.kill()
+    raise RuntimeError("broadcaster stub did not start")
+
+
+async def main(calls: int, latency_ms: float):
+    port = free_port()
+    stub = start_stub(port, latency_ms)
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        with requests.Session() as session:
+            await run("blocking", lambda index: blocking_call(session, f"{base_url}/wallets/status", index), calls)
+        await broadcaster.configure(base_url=base_url)
+        await run("async", async_call, calls)
+    finally:
+        await broadcaster.aclose()
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    asyncio.run(main(calls=args.calls, latency_ms=args.latency_ms))
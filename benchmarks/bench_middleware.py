@@ -0,0 +1,92 @@
+"""
+Throughput of the path allowlist in front of a trivial endpoint, driving the
+ASGI stack directly (no sockets) so only the middleware cost is measured.
+
+- none:     no allowlist
+- old:      the previous BaseHTTPMiddleware looping over one regex per route
+- asgi:     the pure ASGI PathWhitelistMiddleware with one combined matcher
+
+Each variant serves an allowed path (the last route declared) and a
+forbidden one.
+
+Usage:
+    python -m benchmarks.bench_middleware --requests 20000 --routes 30
+"""
+import os
+import asyncio
+import argparse
+from time import perf_counter
+from json import loads, dumps
+os.environ.setdefault("LOCAL", "1")
+os.environ.setdefault("TOKEN_KEY", "00112233445566778899aabbccddeeff")
+from starlette.applications import Starlette
+from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.responses import PlainTextResponse, JSONResponse
+from starlette.routing import Route
+from utils import build_allowlist_from_routes
+from app import PathWhitelistMiddleware
+
+
+async def endpoint(request):
+    return PlainTextResponse("ok")
+
+
+def make_app(routes: int) -> Starlette:
+    return Starlette(routes=[Route(f"/resource-{index}/{{item_id}}", endpoint) for index in range(routes)])
+
+
+def old_middleware(app: Starlette):
+    allowed_paths = build_allowlist_from_routes(app)
+
+    class OldPathWhitelistMiddleware(BaseHTTPMiddleware):
+        async def dispatch(self, request, call_next):
+            path = request.url.path
+            if request.method.upper() == "OPTIONS":
+                return await call_next(request)
+            for allowed in allowed_paths:
+                if (isinstance(allowed, str) and path == allowed) or \
+                   (hasattr(allowed, "match") and allowed.match(path)):
+                    return await call_next(request)
+            return JSONResponse(content=loads(dumps({"message": "Forbidden path"})), status_code=403)
+
+    return OldPathWhitelistMiddleware
+
+
+async def serve(app: Starlette, path: str, requests: int) -> float:
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"", "headers": [],
+        "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+    }
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    started = perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return perf_counter() - started
+
+
+async def main(requests: int, routes: int):
+    allowed, forbidden = f"/resource-{routes - 1}/abc", "/not-a-route"
+    for name in ("none", "old", "asgi"):
+        app = make_app(routes)
+        if name == "old":
+            app.add_middleware(old_middleware(app))
+        elif name == "asgi":
+            app.add_middleware(PathWhitelistMiddleware)
+        for label, path in (("allowed", allowed), ("forbidden", forbidden)):
+            elapsed = await serve(app, path, requests)
+            print(f"{name:>5} {label:>9}: {requests / elapsed:9.0f} req/s  {elapsed / requests * 1e6:7.1f} us/req")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--routes", type=int, default=30)
+    args = parser.parse_args()
+    asyncio.run(main(requests=args.requests, routes=args.routes))
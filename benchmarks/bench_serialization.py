@@ -0,0 +1,97 @@
+"""
+Serialization cost of a WalletsResponse body for 1 to 10k wallets.
+
+- pydantic: UserWalletObject/WalletsResponse models, validated and encoded the
+            way FastAPI does for a response_model (the old path)
+- fast:     models.serialization.render_wallets() without the fragment cache
+- cached:   render_wallets() with every fragment already cached
+
+Usage:
+    python -m benchmarks.bench_serialization --sizes 1,10,100,1000,10000
+"""
+import os
+import argparse
+from uuid import uuid4
+from typing import NamedTuple
+from datetime import datetime
+from time import perf_counter
+from importlib.util import find_spec
+os.environ.setdefault("LOCAL", "1")
+from fastapi.encoders import jsonable_encoder
+from starlette.responses import JSONResponse
+from models.responses import WalletsResponse, UserWalletObject
+from models import serialization
+
+
+class Row(NamedTuple):
+    user_id: str
+    wallet_id: str
+    name: str
+    created_at: datetime
+    public_address: str
+    network: str
+    force_testnet: bool
+    validated_by_blockchain: bool
+    updated_at: datetime
+
+
+def make_rows(user_id: str, count: int) -> list[Row]:
+    now = datetime.utcnow()
+    return [
+        Row(user_id, uuid4().hex, f"wallet-{index}-{now}", now, f"bc1q{uuid4().hex}", "bitcoin", False, True, now)
+        for index in range(count)
+    ]
+
+
+def pydantic_path(user_id: str, rows: list[Row]) -> bytes:
+    response = WalletsResponse(user_id=user_id, user_wallets=[
+        UserWalletObject(
+            wallet_name=row.name,
+            wallet_id=row.wallet_id,
+            network=row.network,
+            blockchain_validated=row.validated_by_blockchain,
+            public_address=row.public_address,
+            created_at=row.created_at.isoformat(),
+            force_testnet=row.force_testnet
+        )
+        for row in rows
+    ])
+    # FastAPI re-validates the returned model against response_model before encoding it
+    validated = WalletsResponse.model_validate(response.model_dump())
+    return JSONResponse(content=jsonable_encoder(validated)).body
+
+
+def fast_path(user_id: str, rows: list[Row]) -> bytes:
+    return serialization.wallets_response(user_id, rows).body
+
+
+def timed(func, user_id: str, rows: list[Row], repeat: int) -> float:
+    started = perf_counter()
+    for _ in range(repeat):
+        func(user_id, rows)
+    return (perf_counter() - started) / repeat * 1000
+
+
+def main(sizes: list[int]):
+    user_id = uuid4().hex
+    print(f"encoder: {'orjson' if find_spec('orjson') else 'json'}")
+    print(f"{'wallets':>8} {'pydantic':>10} {'fast':>10} {'cached':>10}   (ms per response)")
+    for size in sizes:
+        rows = make_rows(user_id, size)
+        repeat = max(3, 20000 // size)
+        assert serialization.json_dumps(jsonable_encoder(WalletsResponse.model_validate_json(fast_path(user_id, rows)))) \
+            == fast_path(user_id, rows)
+        slow = timed(pydantic_path, user_id, rows, repeat)
+        serialization.FRAGMENT_CACHE_ENABLED = False
+        fast = timed(fast_path, user_id, rows, repeat)
+        serialization.FRAGMENT_CACHE_ENABLED = True
+        fast_path(user_id, rows)
+        cached = timed(fast_path, user_id, rows, repeat)
+        print(f"{size:>8} {slow:>10.3f} {fast:>10.3f} {cached:>10.3f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,10,100,1000,10000")
+    args = parser.parse_args()
+    main(sizes=[int(size) for size in args.sizes.split(",")])
@@ -0,0 +1,111 @@
+"""
+Cold start cost of the service, each sample in a fresh interpreter:
+
+- import:  `import app` (and whether boto3 was loaded by it), next to what
+           importing boto3 alone costs
+- bootstrap: the create_db_and_tables_async() call the startup handler
+           makes, on a new SQLite database (create_all runs), on an existing
+           one with SCHEMA_BOOTSTRAP=fingerprint (the stored fingerprint
+           matches, create_all is skipped) and with SCHEMA_BOOTSTRAP=always
+           (create_all on every boot). Includes opening the first connection,
+           which every mode pays.
+- first 200: from launching `python main_app.py` (plain HTTP, one worker) to
+           the first 200 response, in the same three cases. Interpreter and
+           uvicorn startup dominate it: its spread hides the bootstrap
+           difference on a local SQLite file, where create_all reflects
+           without any network round trip.
+
+Usage:
+    python -m benchmarks.bench_startup --repeat 5
+"""
+import os
+import sys
+import tempfile
+import argparse
+import statistics
+import subprocess
+from os.path import abspath, dirname, join
+from time import perf_counter, sleep
+
+import httpx
+from benchmarks import local_stack  # noqa: F401  (LOCAL/TOKEN_KEY defaults for the child processes)
+
+ROOT_DIR = dirname(dirname(abspath(__file__)))
+
+IMPORT_APP = (
+    "import sys; from time import perf_counter; started = perf_counter(); import app; "
+    "print(perf_counter() - started, 'boto3' in sys.modules)"
+)
+IMPORT_BOTO3 = "from time import perf_counter; started = perf_counter(); import boto3; print(perf_counter() - started)"
+BOOTSTRAP = (
+    "import asyncio; from time import perf_counter; "
+    "from backend.database import create_db_and_tables_async, async_engine\n"
+    "async def main():\n"
+    "    started = perf_counter(); ran = await create_db_and_tables_async(); elapsed = perf_counter() - started\n"
+    "    await async_engine.dispose(); print(elapsed, ran)\n"
+    "asyncio.run(main())"
+)
+SCENARIOS = (
+    ("new database (create_all)", "fingerprint", True),
+    ("existing database, fingerprint", "fingerprint", False),
+    ("existing database, always", "always", False),
+)
+
+
+def run_python(code: str, env: dict) -> list[str]:
+    output = subprocess.run([sys.executable, "-c", code], env=env, cwd=ROOT_DIR, check=True,
+                            capture_output=True, text=True).stdout
+    return output.split()
+
+
+def bootstrap_time(env: dict) -> float:
+    """Seconds create_db_and_tables_async() takes in a fresh interpreter."""
+    return float(run_python(BOOTSTRAP, dict(env, LOG_LEVEL="WARNING"))[0])
+
+
+def time_to_first_200(env: dict, port: int, timeout: float = 60.0) -> float:
+    env = dict(env, SERVER_PORT=str(port), SERVER_HOST="127.0.0.1", SERVER_TLS="0", LOG_LEVEL="WARNING")
+    started = perf_counter()
+    server = subprocess.Popen([sys.executable, "main_app.py"], env=env, cwd=ROOT_DIR)
+    try:
+        while perf_counter() - started < timeout:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/robots.txt").status_code == 200:
+                    return perf_counter() - started
+            except httpx.TransportError:
+                pass
+            sleep(0.005)
+        raise TimeoutError(f"no 200 within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main(repeat: int, port: int):
+    env = dict(os.environ)
+    imports = [run_python(IMPORT_APP, env) for _ in range(repeat)]
+    boto3_alone = statistics.median(float(run_python(IMPORT_BOTO3, env)[0]) for _ in range(repeat))
+    print(f"import app: {statistics.median(float(seconds) for seconds, _ in imports) * 1000:8.1f} ms "
+          f"(boto3 loaded: {imports[0][1]}; importing boto3 alone: {boto3_alone * 1000:.1f} ms)")
+
+    for name, measure in (("bootstrap", bootstrap_time), ("first 200", lambda env: time_to_first_200(env, port))):
+        print(f"{name:>34} {'median ms':>10} {'min ms':>8}")
+        for label, bootstrap, fresh in SCENARIOS:
+            samples = []
+            database = join(tempfile.mkdtemp(prefix="wallets-startup-"), "startup.db")
+            if not fresh:
+                # first boot creates the schema and stores its fingerprint
+                bootstrap_time(dict(env, LOCAL_DB_PATH=database))
+            for index in range(repeat):
+                if fresh:
+                    database = join(tempfile.mkdtemp(prefix="wallets-startup-"), "startup.db")
+                samples.append(measure(dict(env, LOCAL_DB_PATH=database, SCHEMA_BOOTSTRAP=bootstrap)))
+            print(f"{label:>34} {statistics.median(samples) * 1000:>10.1f} {min(samples) * 1000:>8.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+    main(repeat=args.repeat, port=args.port)
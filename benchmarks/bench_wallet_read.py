@@ -0,0 +1,99 @@
+"""
+Compares the GET /wallets read paths against a throw-away local SQLite database:
+
+- orm:        find('user') with joined wallets/api_key + find('wallet') +
+              check_association + a UserWalletObject per wallet (the old path)
+- projection: find_user_wallets() single LEFT JOIN selecting only the
+              UserWalletObject columns, ownership checked on the rows
+
+Caching is disabled for both so every iteration hits the database.
+
+Usage:
+    python -m benchmarks.bench_wallet_read --sizes 1 100 10000
+"""
+import os
+import asyncio
+import argparse
+import tempfile
+from os.path import join
+from time import perf_counter
+
+os.environ.setdefault("LOCAL", "1")
+os.environ.setdefault("LOCAL_DB_PATH", join(tempfile.mkdtemp(prefix="wallets-bench-"), "bench.db"))
+
+from utils import check_association  # noqa: E402
+from backend.tables import User, Wallet  # noqa: E402
+from models.responses import UserWalletObject, WalletsResponse  # noqa: E402
+from backend.database import async_dbpool, async_engine, AsyncSessionLocal, create_db_and_tables_async  # noqa: E402
+
+
+async def seed_user(wallets: int) -> tuple[str, str]:
+    async with AsyncSessionLocal() as session:
+        user = User(name=f"bench-{wallets}", username=f"bench-{wallets}", signed_password="-")
+        session.add(user)
+        await session.flush()
+        user_wallets = [
+            Wallet(name=f"w-{i}", public_address=f"addr-{i}", network="bitcoin", user_id=user.user_id)
+            for i in range(wallets)
+        ]
+        session.add_all(user_wallets)
+        await session.commit()
+        return user.user_id, user_wallets[-1].wallet_id
+
+
+def to_response(user_id: str, wallets) -> WalletsResponse:
+    return WalletsResponse(user_id=user_id, user_wallets=[
+        UserWalletObject(
+            wallet_name=wallet.name,
+            wallet_id=wallet.wallet_id,
+            network=wallet.network,
+            blockchain_validated=wallet.validated_by_blockchain,
+            public_address=wallet.public_address,
+            created_at=wallet.created_at.isoformat(),
+            force_testnet=wallet.force_testnet
+        )
+        for wallet in wallets
+    ])
+
+
+async def orm_path(user_id: str, wallet_id: str) -> WalletsResponse:
+    async with async_dbpool as conn:
+        user = await conn.find('user', user_id=user_id)
+        wallet = await conn.find('wallet', wallet_id=wallet_id)
+        assert check_association(user=user, wallet=wallet)
+        return to_response(user.user_id, user.wallets)
+
+
+async def projection_path(user_id: str, wallet_id: str) -> WalletsResponse:
+    async with async_dbpool as conn:
+        rows = await conn.find_user_wallets(user_id=user_id)
+    assert any(row.wallet_id == wallet_id for row in rows)
+    return to_response(user_id, rows)
+
+
+async def measure(path, user_id: str, wallet_id: str, iterations: int) -> float:
+    await path(user_id, wallet_id)  # warm up
+    started = perf_counter()
+    for _ in range(iterations):
+        await path(user_id, wallet_id)
+    return (perf_counter() - started) / iterations * 1000
+
+
+async def main(sizes: list[int], budget: int):
+    await create_db_and_tables_async()
+    print(f"{'wallets':>8} {'orm ms':>10} {'projection ms':>14} {'speedup':>8}")
+    for size in sizes:
+        user_id, wallet_id = await seed_user(size)
+        iterations = max(3, budget // size)
+        orm_ms = await measure(orm_path, user_id, wallet_id, iterations)
+        projection_ms = await measure(projection_path, user_id, wallet_id, iterations)
+        print(f"{size:>8} {orm_ms:>10.3f} {projection_ms:>14.3f} {orm_ms / projection_ms:>7.2f}x")
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--budget", type=int, default=20000, help="approximate wallets read per path and size")
+    args = parser.parse_args()
+    asyncio.run(main(sizes=args.sizes, budget=args.budget))
@@ -0,0 +1,102 @@
+"""
+Throughput of `python main_app.py` (plain HTTP) as WEB_WORKERS grows, on the
+local stack: one shared SQLite database seeded up front and minted JWTs.
+
+The default mix only reads (GET /wallets): SQLite serializes writes, so
+write-heavy mixes measure its lock rather than the workers. Mixes with
+POSTs need a broadcaster, e.g. `python -m benchmarks.broadcaster_stub`
+and --broadcaster-url http://127.0.0.1:8900.
+
+Usage:
+    python -m benchmarks.bench_workers --workers 1 2 4 --requests 4000 --concurrency 64
+"""
+import os
+import sys
+import signal
+import asyncio
+import argparse
+import subprocess
+from time import perf_counter
+from os.path import abspath, dirname
+
+from benchmarks import local_stack
+from benchmarks import loadtest
+import httpx  # noqa: E402
+
+ROOT_DIR = dirname(dirname(abspath(__file__)))
+
+
+async def wait_until_ready(url: str, timeout: float = 30.0) -> None:
+    deadline = perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while perf_counter() < deadline:
+            try:
+                await client.get("/robots.txt")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise TimeoutError(f"server on {url} did not start within {timeout}s")
+
+
+def start_server(workers: int, port: int, broadcaster_url: str) -> subprocess.Popen:
+    env = dict(os.environ, WEB_WORKERS=str(workers), SERVER_PORT=str(port), SERVER_HOST="127.0.0.1",
+               SERVER_TLS="0", LOG_LEVEL="WARNING")
+    if broadcaster_url:
+        env["BROADCASTER_URL"] = broadcaster_url
+    return subprocess.Popen([sys.executable, "main_app.py"], env=env, cwd=ROOT_DIR)
+
+
+def stop_server(server: subprocess.Popen) -> None:
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+async def measure(workers: int, args, user_ids: list[str], traffic: list[dict]) -> dict:
+    url = f"http://127.0.0.1:{args.port}"
+    server = start_server(workers, args.port, args.broadcaster_url)
+    try:
+        await wait_until_ready(url)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=url, timeout=30, limits=limits) as client:
+            runner = loadtest.Runner(client, user_ids)
+            await runner.load_wallets()
+            await runner.run(traffic[:args.concurrency * 4], args.concurrency, paced=False)  # warm every worker up
+            runner.samples.clear()
+            elapsed = await runner.run(traffic, args.concurrency, paced=False)
+        return loadtest.report(runner.samples, elapsed)["total"]
+    finally:
+        stop_server(server)
+
+
+async def main(args):
+    from backend.database import create_db_and_tables_async, async_engine
+    # created once here, not raced by the workers' startup
+    await create_db_and_tables_async()
+    user_ids = await local_stack.seed_users(args.users, wallets_per_user=args.wallets_per_user)
+    await async_engine.dispose()
+    traffic = loadtest.generate_traffic(args.requests, args.users, loadtest.parse_mix(args.mix), seed=1)
+    print(f"cpus: {os.cpu_count()}, concurrency: {args.concurrency}, mix: {args.mix}")
+    print(f"{'workers':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'speedup':>8}")
+    single = None
+    for workers in args.workers:
+        stats = await measure(workers, args, user_ids, traffic)
+        single = single or stats["throughput"]
+        print(f"{workers:>8} {stats['throughput']:>9.1f} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} "
+              f"{stats['p99_ms']:>8.2f} {stats['errors']:>7} {stats['throughput'] / single:>7.2f}x")
+    await async_engine.dispose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--wallets-per-user", type=int, default=5)
+    parser.add_argument("--mix", default="get=1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--broadcaster-url", default="")
+    asyncio.run(main(parser.parse_args()))
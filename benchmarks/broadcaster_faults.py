@@ -0,0 +1,139 @@
+"""
+Fault-injection harness for the Broadcaster resilience layer.
+
+Drives test_wallet() against the in-process broadcaster stub while injecting
+latency and errors, and checks the expected behaviour of each scenario:
+
+- healthy:   every call succeeds, nothing is retried
+- flaky:     30% of responses are 503s, retries keep the success rate high
+- outage:    every response is a 503, the circuit opens and calls fail fast
+- recovery:  after the reset timeout a half-open probe closes the circuit
+- cancelled probe: a half-open probe that is cancelled frees its slot, the
+             next call probes and closes the circuit
+- slow tail: 10% of responses take 400ms, hedging cuts the p95
+
+Usage:
+    python -m benchmarks.broadcaster_faults
+"""
+import sys
+import asyncio
+from time import perf_counter
+from statistics import quantiles
+from dataclasses import dataclass, field
+from benchmarks import broadcaster_stub
+from services.broadcaster import broadcaster
+from services.resilience import CircuitBreaker, CircuitOpenError, RetryBudget
+
+
+@dataclass
+class Outcome:
+    ok: int = 0
+    failed: int = 0
+    rejected: int = 0
+    latencies: list = field(default_factory=list)
+
+    def percentile(self, n: int) -> float:
+        return quantiles(self.latencies, n=100)[n - 1] * 1000 if len(self.latencies) > 1 else 0.0
+
+
+def reset(hedge_after: float = 0.0, reset_timeout: float = 30.0, **stub):
+    broadcaster_stub.settings.__init__(**stub)
+    broadcaster_stub.calls.update(total=0, errors=0)
+    broadcaster.hedge_after = hedge_after
+    broadcaster.backoff_base, broadcaster.backoff_cap = 0.01, 0.05
+    broadcaster.breaker = CircuitBreaker(name="broadcaster", failure_threshold=5, reset_timeout=reset_timeout)
+    broadcaster.retry_budget = RetryBudget(ratio=0.5, min_per_second=10)
+
+
+async def drive(calls: int, concurrency: int = 10) -> Outcome:
+    outcome = Outcome()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int):
+        async with semaphore:
+            started = perf_counter()
+            try:
+                await broadcaster.test_wallet(address=f"addr-{index}", network="bitcoin", auth_token="faults")
+                outcome.ok += 1
+            except CircuitOpenError:
+                outcome.rejected += 1
+            except Exception:
+                outcome.failed += 1
+            outcome.latencies.append(perf_counter() - started)
+
+    await asyncio.gather(*(one(index) for index in range(calls)))
+    return outcome
+
+
+def report(name: str, outcome: Outcome, checks: dict[str, bool]) -> bool:
+    print(f"{name:>16}: ok={outcome.ok:<4} failed={outcome.failed:<4} rejected={outcome.rejected:<4} "
+          f"p50={outcome.percentile(50):6.1f}ms p95={outcome.percentile(95):6.1f}ms p99={outcome.percentile(99):6.1f}ms "
+          f"remote_calls={broadcaster_stub.calls['total']:<4} breaker={broadcaster.breaker.state}")
+    for check, passed in checks.items():
+        if not passed:
+            print(f"{'':>18}FAILED: {check}")
+    return all(checks.values())
+
+
+async def main() -> int:
+    await broadcaster.configure(base_url="http://stub", transport=broadcaster_stub.transport())
+    results = []
+
+    reset(latency=0.005)
+    healthy = await drive(200)
+    results.append(report("healthy", healthy, {
+        "all calls succeed": healthy.ok == 200,
+        "no retries": broadcaster_stub.calls["total"] == 200,
+    }))
+
+    reset(latency=0.005, error_rate=0.3)
+    flaky = await drive(200)
+    results.append(report("flaky", flaky, {"retries keep >= 90% success": flaky.ok >= 180}))
+
+    reset(latency=0.005, error_rate=1.0, reset_timeout=0.5)
+    outage = await drive(200)
+    results.append(report("outage", outage, {
+        "circuit opened": broadcaster.breaker.state != CircuitBreaker.CLOSED,
+        "most calls rejected without a remote call": outage.rejected >= 150,
+        "remote calls bounded": broadcaster_stub.calls["total"] < 60,
+    }))
+
+    await asyncio.sleep(0.6)
+    broadcaster_stub.settings.error_rate = 0.0
+    recovery = await drive(20, concurrency=1)
+    results.append(report("recovery", recovery, {
+        "half-open probe closed the circuit": broadcaster.breaker.state == CircuitBreaker.CLOSED,
+        "calls succeed again": recovery.ok == 20,
+    }))
+
+    reset(latency=0.005, error_rate=1.0, reset_timeout=0.2)
+    await drive(20)
+    await asyncio.sleep(0.3)
+    broadcaster_stub.settings.error_rate, broadcaster_stub.settings.latency = 0.0, 0.5
+    probe = asyncio.create_task(broadcaster.test_wallet(address="probe", network="bitcoin", auth_token="faults"))
+    await asyncio.sleep(0.05)
+    probe.cancel()
+    await asyncio.gather(probe, return_exceptions=True)
+    broadcaster_stub.settings.latency = 0.005
+    after_cancel = await drive(20, concurrency=1)
+    results.append(report("cancelled probe", after_cancel, {
+        "next call probed and closed the circuit": broadcaster.breaker.state == CircuitBreaker.CLOSED,
+        "calls succeed again": after_cancel.ok == 20,
+    }))
+
+    reset(latency=0.005, slow_rate=0.1, slow_latency=0.4)
+    unhedged = await drive(200)
+    results.append(report("slow tail", unhedged, {}))
+
+    reset(latency=0.005, slow_rate=0.1, slow_latency=0.4, hedge_after=0.03)
+    hedged = await drive(200)
+    results.append(report("slow tail hedged", hedged, {
+        "hedging lowers p95": hedged.percentile(95) < unhedged.percentile(95) / 2,
+    }))
+
+    await broadcaster.aclose()
+    return 0 if all(results) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
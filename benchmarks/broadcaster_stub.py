@@ -0,0 +1,78 @@
+"""
+Local stand-in for broadcast.yoursbtc.com, so the Broadcaster client can be
+exercised with no network.
+
+In process (no sockets):
+    await broadcaster.configure(base_url="http://stub", transport=broadcaster_stub.transport())
+Over a real socket:
+    python -m benchmarks.broadcaster_stub --port 8900 --latency-ms 20
+    BROADCASTER_URL=http://127.0.0.1:8900 ...
+
+Addresses starting with `invalid` are reported as not ok by the mempool.
+"""
+import random
+import asyncio
+import argparse
+import httpx
+from dataclasses import dataclass
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+@dataclass
+class StubSettings:
+    latency: float = 0.0            # seconds added to every response
+    error_rate: float = 0.0         # share of requests answered with a 503
+    slow_rate: float = 0.0          # share of requests that take `slow_latency` instead
+    slow_latency: float = 0.0
+    invalid_prefix: str = "invalid"
+
+
+settings = StubSettings()
+calls = {"total": 0, "errors": 0}
+
+
+async def wallet_status(request: Request):
+    calls["total"] += 1
+    if not request.headers.get("Authorization", "").startswith("Bearer "):
+        return JSONResponse({"message": "Unauthorized"}, status_code=401)
+    if settings.slow_rate and random.random() < settings.slow_rate:
+        await asyncio.sleep(settings.slow_latency)
+    elif settings.latency:
+        await asyncio.sleep(settings.latency)
+    if settings.error_rate and random.random() < settings.error_rate:
+        calls["errors"] += 1
+        return JSONResponse({"message": "Service unavailable"}, status_code=503)
+    address = request.query_params.get("address", "")
+    ok = bool(address) and not address.startswith(settings.invalid_prefix)
+    return JSONResponse({
+        "address": address,
+        "network": request.query_params.get("network"),
+        "results": {"mempool": {"ok": ok}}
+    })
+
+
+app = Starlette(routes=[Route("/wallets/status", wallet_status, methods=["POST"])])
+
+
+def transport() -> httpx.ASGITransport:
+    return httpx.ASGITransport(app=app)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-latency-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    settings.latency = args.latency_ms / 1000
+    settings.error_rate = args.error_rate
+    settings.slow_rate = args.slow_rate
+    settings.slow_latency = args.slow_latency_ms / 1000
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,291 @@
+"""
+Load test of the four wallet routes (POST, PUT, GET and DELETE /wallets)
+against the local stack of benchmarks.local_stack: SQLite, the fake
+broadcaster and minted JWTs. Requests go through the ASGI app in process, or
+to a running server with --url (seeded through the same LOCAL_DB_PATH).
+
+Traffic is either generated from a weighted mix or replayed from a recorded
+JSONL file, one request per line:
+
+    {"op": "post", "user": 3}
+    {"op": "get", "user": 3, "wallet": 0, "at": 0.125}
+
+`user` indexes the seeded users, `wallet` the user's current wallets (modulo
+their count; get/put/delete fall back to a post when the user has none) and
+the optional `at` is the offset in seconds the request is sent at with
+--paced. --record writes the generated traffic in that format.
+
+Reported per route and overall: throughput, p50/p95/p99 latency, status
+codes and DB queries per request (from the Server-Timing header).
+--save writes the report as JSON; --baseline compares against a saved
+report and exits with 1 on regressions beyond --tolerance.
+
+Usage:
+    python -m benchmarks.loadtest --requests 2000 --concurrency 20 --mix get=70,post=10,put=10,delete=10
+    python -m benchmarks.loadtest --record traffic.jsonl --save baseline.json
+    python -m benchmarks.loadtest --replay traffic.jsonl --baseline baseline.json
+"""
+import sys
+import json
+import random
+import asyncio
+import argparse
+from time import perf_counter
+from collections import Counter
+from typing import Optional
+
+from benchmarks import local_stack  # sets LOCAL/LOCAL_DB_PATH/TOKEN_KEY before the service is imported
+import httpx  # noqa: E402
+
+OPERATIONS = ("post", "put", "get", "delete")
+DEFAULT_MIX = "get=70,post=10,put=10,delete=10"
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for item in mix.split(","):
+        op, _, weight = item.partition("=")
+        if op not in OPERATIONS:
+            raise ValueError(f"unknown operation {op!r}, expected one of {OPERATIONS}")
+        weights[op] = float(weight or 1)
+    return weights
+
+
+def generate_traffic(requests: int, users: int, mix: dict[str, float], seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    ops, weights = zip(*mix.items())
+    traffic = []
+    for _ in range(requests):
+        op = rng.choices(ops, weights)[0]
+        entry = {"op": op, "user": rng.randrange(users)}
+        if op != "post":
+            entry["wallet"] = rng.randrange(1000)
+        traffic.append(entry)
+    return traffic
+
+
+def load_traffic(path: str) -> list[dict]:
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def save_traffic(path: str, traffic: list[dict]) -> None:
+    with open(path, "w") as file:
+        file.writelines(json.dumps(entry) + "\n" for entry in traffic)
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))]
+
+
+def query_count(response: httpx.Response) -> Optional[int]:
+    # Server-Timing: db;dur=1.23;desc="4 queries"
+    timing = response.headers.get("server-timing", "")
+    _, found, rest = timing.partition('desc="')
+    return int(rest.split(" ", 1)[0]) if found else None
+
+
+class Sample(object):
+    __slots__ = ("op", "status", "latency", "queries")
+
+    def __init__(self, op: str, status: int, latency: float, queries: Optional[int]):
+        self.op = op
+        self.status = status
+        self.latency = latency
+        self.queries = queries
+
+
+class Runner(object):
+    def __init__(self, client: httpx.AsyncClient, user_ids: list[str]):
+        self.client = client
+        self.user_ids = user_ids
+        self.headers = {user_id: local_stack.auth_headers(user_id) for user_id in user_ids}
+        self.wallets: dict[str, list[str]] = {}
+        self.samples: list[Sample] = []
+
+    async def load_wallets(self) -> None:
+        for user_id in self.user_ids:
+            self.wallets[user_id] = await local_stack.user_wallet_ids(user_id)
+
+    async def send(self, entry: dict) -> None:
+        user_id = self.user_ids[entry["user"] % len(self.user_ids)]
+        headers, wallets = self.headers[user_id], self.wallets[user_id]
+        op = entry["op"] if wallets else "post"
+        wallet_id = wallets[entry.get("wallet", 0) % len(wallets)] if wallets else None
+        if op == "delete":
+            # no other request of this run targets the wallet from now on
+            wallets.remove(wallet_id)
+        started = perf_counter()
+        try:
+            if op == "post":
+                response = await self.client.post("/wallets", headers=headers, json={
+                    "public_address": local_stack.random_address(), "wallet_name": "load"})
+            elif op == "put":
+                response = await self.client.put("/wallets", headers=headers, json={
+                    "wallet_id": wallet_id, "name": "renamed", "public_address": local_stack.random_address()})
+            elif op == "get":
+                response = await self.client.get("/wallets", headers=headers, params={"wallet_id": wallet_id})
+            else:
+                response = await self.client.delete("/wallets", headers=headers, params={"wallet_id": wallet_id})
+        except httpx.HTTPError:
+            self.samples.append(Sample(op, 0, perf_counter() - started, None))
+            return
+        latency = perf_counter() - started
+        if op == "post" and response.status_code == 200:
+            known = set(wallets)
+            wallets.extend(wallet["wallet_id"] for wallet in response.json()["user_wallets"]
+                           if wallet["wallet_id"] not in known)
+        self.samples.append(Sample(op, response.status_code, latency, query_count(response)))
+
+    async def run(self, traffic: list[dict], concurrency: int, paced: bool) -> float:
+        queue: asyncio.Queue = asyncio.Queue()
+        for entry in traffic:
+            queue.put_nowait(entry)
+        started = perf_counter()
+
+        async def worker():
+            while not queue.empty():
+                entry = queue.get_nowait()
+                if paced and "at" in entry:
+                    delay = started + entry["at"] - perf_counter()
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                await self.send(entry)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return perf_counter() - started
+
+
+def summarize(samples: list[Sample], elapsed: float) -> dict:
+    latencies = sorted(sample.latency * 1000 for sample in samples)
+    queries = [sample.queries for sample in samples if sample.queries is not None]
+    return {
+        "requests": len(samples),
+        "throughput": len(samples) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "errors": sum(1 for sample in samples if sample.status == 0 or sample.status >= 500),
+        "queries_per_request": sum(queries) / len(queries) if queries else None,
+        "status": dict(Counter(str(sample.status) for sample in samples)),
+    }
+
+
+def report(samples: list[Sample], elapsed: float) -> dict:
+    return {
+        "total": summarize(samples, elapsed),
+        "ops": {op: summarize([sample for sample in samples if sample.op == op], elapsed)
+                for op in OPERATIONS if any(sample.op == op for sample in samples)},
+    }
+
+
+def print_report(result: dict) -> None:
+    print(f"{'route':>8} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'queries':>8} {'errors':>7}  status")
+    for name, stats in (*result["ops"].items(), ("total", result["total"])):
+        queries = stats["queries_per_request"]
+        print(f"{name:>8} {stats['requests']:>9} {stats['throughput']:>9.1f} {stats['p50_ms']:>8.2f} "
+              f"{stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} {'-' if queries is None else f'{queries:.2f}':>8} "
+              f"{stats['errors']:>7}  {stats['status']}")
+
+
+def regressions(result: dict, baseline: dict, tolerance: float, query_tolerance: float) -> list[str]:
+    """
+    Overall throughput below, or p95/p99 latency above, the baseline by more
+    than `tolerance` (a ratio); per route, queries per request above the
+    baseline by more than `query_tolerance` or a higher error rate. Per-route
+    latency is not compared: with a few hundred samples its tail is noise.
+    """
+    found = []
+    current, previous = result["total"], baseline["total"]
+    if current["throughput"] < previous["throughput"] * (1 - tolerance):
+        found.append(f"total: throughput {current['throughput']:.1f} < {previous['throughput']:.1f} req/s")
+    for key in ("p95_ms", "p99_ms"):
+        if current[key] > previous[key] * (1 + tolerance):
+            found.append(f"total: {key} {current[key]:.2f} > {previous[key]:.2f}")
+    for name, current in result["ops"].items():
+        previous = baseline["ops"].get(name)
+        if previous is None:
+            continue
+        if current["queries_per_request"] is not None and previous["queries_per_request"] is not None \
+                and current["queries_per_request"] > previous["queries_per_request"] + query_tolerance:
+            found.append(f"{name}: queries per request {current['queries_per_request']:.2f} > "
+                         f"{previous['queries_per_request']:.2f}")
+        if current["errors"] / max(1, current["requests"]) > previous["errors"] / max(1, previous["requests"]):
+            found.append(f"{name}: errors {current['errors']}/{current['requests']} > "
+                         f"{previous['errors']}/{previous['requests']}")
+    return found
+
+
+async def main(args) -> int:
+    if args.replay:
+        traffic = load_traffic(args.replay)
+    else:
+        traffic = generate_traffic(args.requests, args.users, parse_mix(args.mix), args.seed)
+    if args.record:
+        save_traffic(args.record, traffic)
+    users = max(entry["user"] for entry in traffic) + 1
+
+    async def run(client: httpx.AsyncClient) -> dict:
+        user_ids = await local_stack.seed_users(users, wallets_per_user=args.wallets_per_user)
+        runner = Runner(client, user_ids)
+        await runner.load_wallets()
+        if args.warmup:
+            await runner.run(traffic[:args.warmup], args.concurrency, paced=False)
+            await runner.load_wallets()
+            runner.samples.clear()
+        elapsed = await runner.run(traffic, args.concurrency, paced=args.paced)
+        return report(runner.samples, elapsed)
+
+    if args.url:
+        from backend.database import create_db_and_tables_async, async_engine
+        await create_db_and_tables_async()
+        async with httpx.AsyncClient(base_url=args.url, timeout=30) as client:
+            result = await run(client)
+        await async_engine.dispose()
+    else:
+        async with local_stack.running_app(broadcaster_latency=args.broadcaster_latency_ms / 1000) as app:
+            # failing endpoints are counted as 500s instead of aborting the run
+            transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=30) as client:
+                result = await run(client)
+
+    result["settings"] = {"requests": len(traffic), "users": users, "concurrency": args.concurrency,
+                          "source": args.replay or args.mix, "target": args.url or "asgi"}
+    print_report(result)
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(result, file, indent=2)
+    if args.baseline:
+        with open(args.baseline) as file:
+            found = regressions(result, json.load(file), args.tolerance, args.query_tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            return 1
+        print(f"no regression against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--wallets-per-user", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weights per route, e.g. get=70,post=10,put=10,delete=10")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=0, help="first N requests sent once before measuring")
+    parser.add_argument("--broadcaster-latency-ms", type=float, default=0.0)
+    parser.add_argument("--url", help="running server to load instead of the in-process app")
+    parser.add_argument("--record", help="write the generated traffic to this JSONL file")
+    parser.add_argument("--replay", help="replay traffic from this JSONL file")
+    parser.add_argument("--paced", action="store_true", help="send replayed requests at their `at` offsets")
+    parser.add_argument("--save", help="write the report to this JSON file (a baseline)")
+    parser.add_argument("--baseline", help="fail on regressions against this saved report")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed throughput/latency change ratio")
+    parser.add_argument("--query-tolerance", type=float, default=0.25, help="allowed extra queries per request")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,82 @@
+"""
+The service wired to local stand-ins, for load tests and benchmarks:
+
+- a throw-away SQLite database (LOCAL=1, LOCAL_DB_PATH in a temp dir)
+- the in-process fake broadcaster from benchmarks.broadcaster_stub
+- JWTs minted with TOKEN_KEY, like the auth service would
+
+Import this module before anything from the service: it sets the
+environment the service reads at import time (existing variables win).
+
+    from benchmarks import local_stack
+    async with local_stack.running_app() as app:
+        user_ids = await local_stack.seed_users(10, wallets_per_user=5)
+        headers = local_stack.auth_headers(user_ids[0])
+"""
+import os
+import tempfile
+from os.path import join
+from time import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+os.environ.setdefault("LOCAL", "1")
+os.environ.setdefault("LOCAL_DB_PATH", join(tempfile.mkdtemp(prefix="wallets-local-"), "local.db"))
+os.environ.setdefault("TOKEN_KEY", "00112233445566778899aabbccddeeff")
+# query counts per request come back in the Server-Timing header
+os.environ.setdefault("SERVER_TIMING", "1")
+
+import jwt  # noqa: E402
+from benchmarks import broadcaster_stub  # noqa: E402
+from services.address_format import encode_base58check  # noqa: E402
+
+
+def mint_token(user_id: str, ttl: int = 3600) -> str:
+    """An HS256 access token for `user_id`, signed with TOKEN_KEY."""
+    payload = {"sub": user_id, "exp": int(time()) + ttl}
+    return jwt.encode(payload, bytes.fromhex(os.environ["TOKEN_KEY"]), algorithm="HS256")
+
+
+def auth_headers(user_id: str, ttl: int = 3600) -> dict:
+    return {"Authorization": f"Bearer {mint_token(user_id, ttl)}"}
+
+
+def random_address() -> str:
+    """A well-formed mainnet P2PKH address, accepted by the offline format check and the fake broadcaster."""
+    return encode_base58check(b"\x00" + os.urandom(20))
+
+
+async def seed_users(count: int, wallets_per_user: int = 0, prefix: str = "load") -> list[str]:
+    """Inserts users (and wallets) straight into the database, returns the user ids."""
+    from backend.tables import User, Wallet
+    from backend.database import AsyncSessionLocal
+    async with AsyncSessionLocal() as session:
+        users = [User(name=f"{prefix}-{index}", username=f"{prefix}-{index}-{os.urandom(4).hex()}",
+                      signed_password="-") for index in range(count)]
+        session.add_all(users)
+        await session.flush()
+        session.add_all([
+            Wallet(name=f"wallet-{prefix}-{index}", public_address=random_address(), network="bitcoin",
+                   validated_by_blockchain=True, user_id=user.user_id)
+            for user in users for index in range(wallets_per_user)
+        ])
+        await session.commit()
+        return [user.user_id for user in users]
+
+
+async def user_wallet_ids(user_id: str) -> list[str]:
+    from backend.database import async_dbpool
+    async with async_dbpool as conn:
+        rows = await conn.find_user_wallets(user_id=user_id)
+    return [row.wallet_id for row in rows or ()]
+
+
+@asynccontextmanager
+async def running_app(broadcaster_latency: float = 0.0) -> AsyncIterator:
+    """The FastAPI app with its startup/shutdown handlers run, calling the fake broadcaster."""
+    from app import app
+    from services.broadcaster import broadcaster
+    broadcaster_stub.settings.latency = broadcaster_latency
+    async with app.router.lifespan_context(app):
+        await broadcaster.configure(base_url="http://stub", transport=broadcaster_stub.transport())
+        yield app
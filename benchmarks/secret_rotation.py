@@ -0,0 +1,111 @@
+"""
+Checks that rotating the database credentials goes through the connect hook
+(services.secret_store.connect_with_secret) without blocking the event loop.
+An async SQLite engine plays the database: its connect accepts one password
+at a time and refuses the others like asyncpg does. The secret lives in an
+InMemorySecretStore whose fetches take FETCH_LATENCY seconds.
+
+- the first connection fetches the secret once
+- after a rotation (new password in the store and in the database) the
+  first connection is refused fast, without waiting on the store, and
+  starts a background refresh
+- once the refresh lands, new connections use the rotated password
+
+Usage:
+    python -m benchmarks.secret_rotation
+"""
+import sys
+import asyncio
+from time import perf_counter
+from sqlalchemy import text
+from sqlalchemy.pool import NullPool
+from sqlalchemy.ext.asyncio import create_async_engine
+from services.secret_store import secrets_provider, connect_with_secret, InMemorySecretStore
+
+SECRET_ID = "wallets/database"
+FETCH_LATENCY = 0.5
+
+
+class InvalidPasswordError(Exception):
+    """Named like asyncpg's, which is what the connect hook recognises."""
+
+
+class Database(object):
+    """The password the database currently accepts, and the connections it refused."""
+
+    def __init__(self, password: str):
+        self.password = password
+        self.refused = 0
+
+    def attach(self, engine) -> None:
+        dialect = engine.sync_engine.dialect
+        connect = dialect.connect
+
+        def checked_connect(*cargs, user=None, password=None, **cparams):
+            if password != self.password:
+                self.refused += 1
+                raise InvalidPasswordError(f'password authentication failed for user "{user}"')
+            return connect(*cargs, **cparams)
+
+        dialect.connect = checked_connect
+
+
+async def loop_lag(stop: asyncio.Event) -> float:
+    """Longest delay of a 10ms tick while the checks run: how long the event loop was blocked."""
+    worst = 0.0
+    while not stop.is_set():
+        started = perf_counter()
+        await asyncio.sleep(0.01)
+        worst = max(worst, perf_counter() - started - 0.01)
+    return worst
+
+
+async def connect(engine) -> bool:
+    try:
+        async with engine.connect() as connection:
+            await connection.execute(text("select 1"))
+        return True
+    except Exception as e:
+        if type(e.__cause__ or e).__name__ != "InvalidPasswordError" and "password" not in str(e):
+            raise
+        return False
+
+
+async def main() -> int:
+    store = InMemorySecretStore({SECRET_ID: {"username": "wallets", "password": "first"}}, latency=FETCH_LATENCY)
+    secrets_provider.configure(store)
+    database = Database(password="first")
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=NullPool)
+    connect_with_secret(engine, secret_name=SECRET_ID)
+    database.attach(engine)
+    # the service reads the secret once at startup, off the event loop
+    await asyncio.to_thread(secrets_provider.get, SECRET_ID)
+
+    stop = asyncio.Event()
+    lag = asyncio.create_task(loop_lag(stop))
+    checks = []
+    checks.append(("connects with the cached secret", await connect(engine) and store.fetches == 1))
+
+    store.put(SECRET_ID, {"username": "wallets", "password": "second"})
+    database.password = "second"
+    started = perf_counter()
+    refused = not await connect(engine)
+    elapsed = perf_counter() - started
+    checks.append((f"refused after the rotation in {elapsed * 1000:.1f}ms", refused and elapsed < FETCH_LATENCY))
+
+    await asyncio.sleep(FETCH_LATENCY * 2)
+    checks.append(("connects with the rotated secret", await connect(engine) and store.fetches == 2))
+    stop.set()
+    worst_lag = await lag
+    checks.append((f"event loop blocked for at most {worst_lag * 1000:.1f}ms", worst_lag < FETCH_LATENCY / 2))
+
+    secrets_provider.stop()
+    await engine.dispose()
+    for name, ok in checks:
+        print(f"{name}: {'ok' if ok else 'FAILED'}")
+    print(f"secret fetches: {store.fetches}, connections refused: {database.refused}, {secrets_provider.stats()}")
+    return 0 if all(ok for _, ok in checks) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,102 @@
+"""
+Concurrency stress run for the request scoped AsyncDbConnectionPool.
+
+Runs hundreds of overlapping create/get/delete wallet flows against a throw-away
+local SQLite database and checks that every task kept its own session for the
+whole flow, only ever saw its own user's wallets, and that no pooled
+connection leaked once everything finished.
+
+Usage:
+    python -m benchmarks.stress_sessions --tasks 300
+"""
+import os
+import sys
+import asyncio
+import argparse
+import tempfile
+from os.path import join
+
+os.environ.setdefault("LOCAL", "1")
+os.environ.setdefault("LOCAL_DB_PATH", join(tempfile.mkdtemp(prefix="wallets-stress-"), "stress.db"))
+
+from backend.tables import User  # noqa: E402
+from backend.database import async_dbpool, async_engine, AsyncSessionLocal, create_db_and_tables_async  # noqa: E402
+
+
+async def seed_users(count: int) -> list[str]:
+    async with AsyncSessionLocal() as session:
+        users = [User(name=f"stress-{i}", username=f"stress-{i}", signed_password="-") for i in range(count)]
+        session.add_all(users)
+        await session.commit()
+        return [user.user_id for user in users]
+
+
+async def wallet_flow(user_id: str, index: int) -> list[str]:
+    errors = []
+
+    def check(condition: bool, message: str):
+        if not condition:
+            errors.append(f"task {index}: {message}")
+
+    async with async_dbpool as conn:
+        session = conn._session
+        user = await conn.add_wallet(
+            user_id=user_id,
+            name=f"stress-{index}",
+            network="bitcoin",
+            force_testnet=False,
+            public_address=f"addr-{index}",
+            validated_by_blockchain=True
+        )
+        await asyncio.sleep(0)
+        check(conn._session is session, "session changed after add_wallet")
+        wallet_id = next(wallet.wallet_id for wallet in user.wallets if wallet.public_address == f"addr-{index}")
+
+    async with async_dbpool as conn:
+        session = conn._session
+        user = await conn.find('user', user_id=user_id)
+        await asyncio.sleep(0)
+        check(conn._session is session, "session changed after find('user')")
+        check(all(wallet.user_id == user_id for wallet in user.wallets), "saw another user's wallet")
+        wallet = await conn.find('wallet', wallet_id=wallet_id)
+        check(wallet is not None and wallet.user_id == user_id, "wallet lookup returned a foreign wallet")
+
+    async with async_dbpool as conn:
+        session = conn._session
+        deleted = await conn.delete_wallet(wallet_id=wallet_id)
+        check(conn._session is session, "session changed after delete_wallet")
+        check(deleted, "wallet was not deleted")
+
+    check(async_dbpool._session is None, "session leaked outside of the context manager")
+    return errors
+
+
+async def main(tasks: int, users: int) -> int:
+    await create_db_and_tables_async()
+    user_ids = await seed_users(users)
+    results = await asyncio.gather(
+        *(wallet_flow(user_ids[i % users], i) for i in range(tasks)),
+        return_exceptions=True
+    )
+    errors = []
+    for result in results:
+        if isinstance(result, BaseException):
+            errors.append(repr(result))
+        else:
+            errors.extend(result)
+    checked_out = async_engine.pool.checkedout()
+    if checked_out:
+        errors.append(f"{checked_out} pooled connections still checked out")
+    await async_engine.dispose()
+    for error in errors:
+        print(error)
+    print(f"{tasks} overlapping flows, {len(errors)} errors")
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tasks", type=int, default=300)
+    parser.add_argument("--users", type=int, default=25)
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(tasks=args.tasks, users=args.users)))
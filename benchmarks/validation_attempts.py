@@ -0,0 +1,59 @@
+"""
+Checks how often the background validation queue retries a wallet whose
+validation keeps failing: with VALIDATION_MAX_ATTEMPTS=n the job is claimed
+exactly n times, then dropped (the wallet stays unvalidated). Runs the
+worker's run_once() by hand against a throw-away local SQLite database and
+a broadcaster stub answering every call with a 503.
+
+Usage:
+    python -m benchmarks.validation_attempts
+"""
+import sys
+import asyncio
+from benchmarks import local_stack
+from benchmarks import broadcaster_stub
+from backend.tables import WalletValidationJob, Wallet
+from backend.database import async_dbpool, async_engine, create_db_and_tables_async, AsyncSessionLocal
+from services.broadcaster import broadcaster
+from services.validation_worker import validation_workers
+from sqlmodel import select
+
+
+async def claims_until_done(max_attempts: int, user_id: str) -> tuple[int, bool, bool]:
+    """(claims that picked the job up, whether the job is gone, whether the wallet got validated)"""
+    async with async_dbpool as conn:
+        [wallet] = await conn.add_wallets(user_id=user_id, enqueue_validation=True, wallets=[dict(
+            name=f"attempts-{max_attempts}", network="bitcoin", force_testnet=False,
+            public_address=local_stack.random_address(), validated_by_blockchain=False
+        )])
+    validation_workers.max_attempts = max_attempts
+    validation_workers.lease = 0.05
+    claims = 0
+    for _ in range(max_attempts + 3):
+        claims += await validation_workers.run_once()
+        await asyncio.sleep(0.1)  # past the lease: a job left behind is due again
+    async with AsyncSessionLocal() as session:
+        job = (await session.exec(select(WalletValidationJob).where(WalletValidationJob.wallet_id == wallet))).first()
+        validated = (await session.exec(select(Wallet.validated_by_blockchain).where(Wallet.wallet_id == wallet))).one()
+    return claims, job is None, validated
+
+
+async def main() -> int:
+    await create_db_and_tables_async()
+    [user_id] = await local_stack.seed_users(1)
+    broadcaster_stub.settings.error_rate = 1.0
+    await broadcaster.configure(base_url="http://stub", transport=broadcaster_stub.transport())
+    passed = True
+    for max_attempts in (1, 3):
+        claims, dropped, validated = await claims_until_done(max_attempts, user_id)
+        ok = claims == max_attempts and dropped and not validated
+        passed &= ok
+        print(f"VALIDATION_MAX_ATTEMPTS={max_attempts}: claimed {claims}x, dropped={dropped}, "
+              f"validated={validated} {'ok' if ok else 'FAILED'}")
+    await broadcaster.aclose()
+    await async_engine.dispose()
+    return 0 if passed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main()))
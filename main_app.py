@@ -1,30 +1,75 @@
 import uvicorn
-import asyncio
-import logging
+from importlib.util import find_spec
+from decouple import config
 from utils import get_server_certificate, Logger
 
 logger = Logger("main_app")
 
+SERVER_HOST = config("SERVER_HOST", default="0.0.0.0")
+SERVER_PORT = int(config("SERVER_PORT", default="443"))
+SERVER_TLS = config("SERVER_TLS", default="1") == "1"
+WEB_WORKERS = int(config("WEB_WORKERS", default="1"))
+# seconds in-flight requests get to finish on SIGTERM before connections are closed
+GRACEFUL_SHUTDOWN_TIMEOUT = int(config("GRACEFUL_SHUTDOWN_TIMEOUT", default="30"))
+KEEPALIVE_TIMEOUT = int(config("KEEPALIVE_TIMEOUT", default="5"))
+SERVER_ACCESS_LOG = config("SERVER_ACCESS_LOG", default="0") == "1"
+LOG_LEVEL = config("LOG_LEVEL", default="INFO").lower()
+# connections the database lets this service open, across all workers
+DB_MAX_CONNECTIONS = int(config("DB_MAX_CONNECTIONS", default="90"))
+
+
+def check_db_connection_budget(workers: int) -> int:
+    """
+    Every worker process owns its own pool of up to DB_POOL_SIZE +
+    DB_MAX_OVERFLOW connections; refuses to start when all of them together
+    could exceed DB_MAX_CONNECTIONS. Returns the worst-case connection count.
+    The defaults mirror backend.database, which is not imported here so the
+    engine is only ever created inside the workers.
+    """
+    if config("LOCAL", default="0") == "1":
+        return 0
+    per_worker = int(config("DB_POOL_SIZE", default="10")) + int(config("DB_MAX_OVERFLOW", default="20"))
+    needed = workers * per_worker
+    if needed > DB_MAX_CONNECTIONS:
+        raise ValueError(
+            f"{workers} workers x {per_worker} pooled connections (DB_POOL_SIZE + DB_MAX_OVERFLOW) = {needed} "
+            f"exceeds DB_MAX_CONNECTIONS={DB_MAX_CONNECTIONS}"
+        )
+    return needed
+
 
 def run_app():
     logger.info("============ Starting server ============")
-    key, pem = get_server_certificate()
-    logger.debug(f"Loading server certificate from {pem}")
-    config = {
+    connections = check_db_connection_budget(WEB_WORKERS)
+    server_config = {
+        # an import string: each worker process imports the app, and with it
+        # creates its own engine and pool after the process is started
         "app": "app:app",
-        "host": "0.0.0.0",
-        "port": 443,
+        "host": SERVER_HOST,
+        "port": SERVER_PORT,
+        "workers": WEB_WORKERS,
+        "loop": "uvloop" if find_spec("uvloop") else "asyncio",
+        "http": "httptools" if find_spec("httptools") else "h11",
         "server_header": False,
-        "log_level": logging.DEBUG,
-        "ssl_certfile": pem,
-        "ssl_keyfile": key
+        "log_level": LOG_LEVEL,
+        "access_log": SERVER_ACCESS_LOG,
+        "timeout_keep_alive": KEEPALIVE_TIMEOUT,
+        "timeout_graceful_shutdown": GRACEFUL_SHUTDOWN_TIMEOUT,
     }
-    logger.debug(f"Starting server with {config=}")
-    app_config = uvicorn.Config(**config)
-    logger.debug(f"Starting server with {app_config=}")
-    server = uvicorn.Server(config=app_config)
-    logger.debug(f"asyncio run {server=}")
-    asyncio.run(server.serve())
+    if SERVER_TLS:
+        key, pem = get_server_certificate()
+        logger.debug("Loading server certificate from %s", pem)
+        server_config.update(ssl_certfile=pem, ssl_keyfile=key)
+    logger.info(
+        "Starting %s worker(s) on %s:%s (loop=%s, http=%s, tls=%s, up to %s DB connections)",
+        WEB_WORKERS, SERVER_HOST, SERVER_PORT, server_config["loop"], server_config["http"], SERVER_TLS,
+        connections or "n/a"
+    )
+    logger.debug("Starting server with config=%r", server_config)
+    # uvicorn.run sets the configured event loop up, and with workers > 1
+    # supervises the processes: SIGTERM stops accepting connections, lets
+    # in-flight requests finish, then runs the app's shutdown handlers
+    uvicorn.run(**server_config)
 
 
 if __name__ == '__main__':
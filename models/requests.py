@@ -24,3 +24,14 @@ class UpdateWalletInfoRequest(BaseRequest):
     public_address: str                     =   Field(..., alias="public_address")
     validated_by_blockchain: Optional[bool] =   Field(default=False, alias="validated_by_blockchain")
     def __repr__(self): return f"<UpdateWalletInfoRequest %r>" % self.tojson()
+
+
+class CreateWalletsBatchRequest(BaseRequest):
+    wallets: list[CreateWalletRequest]      =   Field(..., alias="wallets", min_length=1, max_length=500)
+    def tojson(self): return {"wallets": [wallet.tojson() for wallet in self.wallets]}
+    def __repr__(self): return f"<CreateWalletsBatchRequest %r>" % self.tojson()
+
+
+class DeleteWalletsBatchRequest(BaseRequest):
+    wallet_ids: list[str]                   =   Field(..., alias="wallet_ids", min_length=1, max_length=500)
+    def __repr__(self): return f"<DeleteWalletsBatchRequest %r>" % self.tojson()
@@ -1,10 +1,9 @@
 from typing import Optional
-from json import loads, dumps
 from pydantic import BaseModel, Field
 
 
 class BaseResponse(BaseModel):
-    def tojson(self): return loads(dumps(self.__dict__))
+    def tojson(self): return self.model_dump(mode="json")
 
 
 class UserWalletObject(BaseResponse):
@@ -15,7 +14,7 @@ class UserWalletObject(BaseResponse):
     network: str                                =   Field(..., alias="network")
     force_testnet: bool                         =   Field(..., alias="force_testnet")
     blockchain_validated: bool                  =   Field(..., alias="blockchain_validated")
-    def __repr__(self): return f"<UserWalletObject %e>" % self.tojson()
+    def __repr__(self): return f"<UserWalletObject %r>" % self.tojson()
 
 
 class WalletsResponse(BaseResponse):
@@ -24,7 +23,29 @@ class WalletsResponse(BaseResponse):
     def __repr__(self): return f"<WalletsResponse %r>" % self.tojson()
 
 
+class WalletsPageResponse(BaseResponse):
+    user_id: str                                =    Field(..., alias="user_id")
+    user_wallets: list[dict]                    =    Field(..., alias="user_wallets")
+    next_cursor: Optional[str]                  =    Field(default=None, alias="next_cursor")
+    def __repr__(self): return f"<WalletsPageResponse %r>" % self.tojson()
+
+
 class WalletDeletedResponse(BaseResponse):
     wallet_id: str                              =   Field(..., alias="wallet_id")
     deleted: bool                               =   Field(default=False, alias="deleted")
     def __repr__(self): return f"<WalletDeletedResponse %r>" % self.tojson()
+
+
+class BatchItemResult(BaseResponse):
+    index: int                                  =   Field(..., alias="index")
+    wallet_id: Optional[str]                    =   Field(default=None, alias="wallet_id")
+    public_address: Optional[str]               =   Field(default=None, alias="public_address")
+    ok: bool                                    =   Field(default=False, alias="ok")
+    detail: Optional[str]                       =   Field(default=None, alias="detail")
+    def __repr__(self): return f"<BatchItemResult %r>" % self.tojson()
+
+
+class WalletsBatchResponse(BaseResponse):
+    user_id: str                                =   Field(..., alias="user_id")
+    results: list[BatchItemResult]              =   Field(..., alias="results")
+    def __repr__(self): return f"<WalletsBatchResponse %r>" % self.tojson()
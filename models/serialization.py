@@ -0,0 +1,97 @@
+import json
+from hashlib import sha256
+from typing import Any, Iterable, Optional
+from importlib.util import find_spec
+from decouple import config
+from starlette.responses import JSONResponse
+from backend.cache import LRUTTLCache, MISSING
+from utils import Logger
+
+if find_spec("orjson") is not None:
+    import orjson
+
+    def json_dumps(content: Any) -> bytes:
+        return orjson.dumps(content)
+else:
+    # orjson is pinned in requirements.txt: this fallback is for bare dev environments
+    Logger("models.serialization").warning("orjson is not installed, responses are serialized with json")
+
+    def json_dumps(content: Any) -> bytes:
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed, compact stdlib json otherwise."""
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            # already serialized, e.g. by render_wallets()
+            return content
+        return json_dumps(content)
+
+
+# serialized UserWalletObject fragments, keyed by (wallet_id, updated_at): any
+# write bumps wallets_tbl.updated_at, so an outdated fragment is never hit again
+# and just ages out of the LRU
+fragment_cache = LRUTTLCache(
+    name="wallet_fragments",
+    max_entries=int(config("WALLET_FRAGMENT_CACHE_MAX_ENTRIES", default="50000")),
+    ttl=float(config("WALLET_FRAGMENT_CACHE_TTL", default="3600")),
+)
+FRAGMENT_CACHE_ENABLED = config("WALLET_FRAGMENT_CACHE", default="1") == "1"
+
+
+def wallet_fragment(row) -> bytes:
+    """One UserWalletObject as JSON, from a find_user_wallets() row."""
+    return json_dumps({
+        "wallet_name": row.name,
+        "wallet_id": row.wallet_id,
+        "created_at": row.created_at.isoformat(),
+        "public_address": row.public_address,
+        "network": row.network,
+        "force_testnet": row.force_testnet,
+        "blockchain_validated": row.validated_by_blockchain,
+    })
+
+
+def cached_wallet_fragment(row) -> bytes:
+    key = (row.wallet_id, row.updated_at)
+    fragment = fragment_cache.get(key)
+    if fragment is MISSING:
+        fragment = wallet_fragment(row)
+        fragment_cache.set(key, fragment)
+    return fragment
+
+
+def render_wallets(user_id: str, rows: Iterable) -> bytes:
+    """
+    The WalletsResponse body for rows read from the DB. The rows are trusted,
+    so they are not validated again through pydantic: fragments are joined
+    straight into the response bytes.
+    """
+    fragment = cached_wallet_fragment if FRAGMENT_CACHE_ENABLED else wallet_fragment
+    return b"".join((
+        b'{"user_id":', json_dumps(user_id), b',"user_wallets":[',
+        b",".join(fragment(row) for row in rows),
+        b"]}",
+    ))
+
+
+def wallets_response(user_id: str, rows: Iterable, **kwargs) -> FastJSONResponse:
+    return FastJSONResponse(content=render_wallets(user_id, rows), **kwargs)
+
+
+# ---------- conditional requests ----------
+def version_etag(*parts: Any) -> str:
+    """Strong ETag for a resource version, e.g. find_user_wallets_version() plus the query that was served."""
+    return '"' + sha256("|".join(map(str, parts)).encode()).hexdigest()[:32] + '"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (RFC 9110 weak comparison: W/ prefixes are ignored)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return etag in (candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates)
@@ -0,0 +1,116 @@
+import asyncio
+from hashlib import sha256
+from secrets import token_urlsafe
+from typing import Optional
+from decouple import config
+from utils import Logger, Singleton, timestamp_update
+from backend.cache import LRUTTLCache, SingleFlight, MISSING
+from backend.database import async_dbpool
+
+logger = Logger("security.api_keys")
+
+API_KEY_HEADER = "X-API-Key"
+API_KEY_PREFIX = "ysk_"
+
+
+def hash_api_key(raw_key: str) -> str:
+    """Keys are random 256-bit tokens, a plain sha256 is enough to store them (no salt/KDF needed)."""
+    return sha256(raw_key.encode()).hexdigest()
+
+
+def generate_api_key() -> str:
+    return API_KEY_PREFIX + token_urlsafe(32)
+
+
+class ApiKeyAuthenticator(metaclass=Singleton):
+    """
+    Resolves `X-API-Key` headers to users for machine-to-machine clients.
+    Lookups go through the unique key_content index and are cached: known keys
+    for API_KEY_CACHE_TTL, unknown/inactive ones for API_KEY_NEGATIVE_TTL so a
+    client retrying a bad key does not hit the DB on every request.
+    Concurrent lookups of the same key are coalesced. last_used is recorded
+    in memory and written behind every API_KEY_FLUSH_INTERVAL seconds in one
+    batched UPDATE (and on shutdown).
+    """
+
+    def __init__(self):
+        super(ApiKeyAuthenticator, self).__init__()
+        self.positive_ttl = float(config("API_KEY_CACHE_TTL", default="60"))
+        self.negative_ttl = float(config("API_KEY_NEGATIVE_TTL", default="10"))
+        self.flush_interval = float(config("API_KEY_FLUSH_INTERVAL", default="30"))
+        self.cache = LRUTTLCache(
+            name="api_keys",
+            max_entries=int(config("API_KEY_CACHE_MAX_ENTRIES", default="10000")),
+            ttl=self.positive_ttl,
+        )
+        self._lookups = SingleFlight()
+        self._last_used: dict[str, object] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self.flushed = 0
+
+    async def authenticate(self, raw_key: str) -> Optional[str]:
+        """The user id owning `raw_key`, or None when the key is unknown or inactive."""
+        if not raw_key:
+            return None
+        key_hash = hash_api_key(raw_key)
+        entry = self.cache.get(key_hash)
+        if entry is MISSING:
+            entry = await self._lookups.do(key_hash, lambda: self._lookup(key_hash))
+        if entry is None:
+            return None
+        api_key_id, user_id = entry
+        self._last_used[api_key_id] = timestamp_update()
+        return user_id
+
+    async def _lookup(self, key_hash: str) -> Optional[tuple[str, str]]:
+        async with async_dbpool as conn:
+            entry = await conn.find_api_key(key_hash)
+        self.cache.set(key_hash, entry, ttl=self.positive_ttl if entry else self.negative_ttl)
+        return entry
+
+    async def issue(self, user_id: str) -> str:
+        """Creates (or rotates) the user's key and returns the raw key, which is not stored anywhere."""
+        raw_key = generate_api_key()
+        async with async_dbpool as conn:
+            await conn.issue_api_key(user_id=user_id, key_hash=hash_api_key(raw_key))
+        # the previous key may still be cached as valid
+        self.cache.clear()
+        return raw_key
+
+    async def flush(self) -> int:
+        if not self._last_used:
+            return 0
+        pending, self._last_used = self._last_used, {}
+        try:
+            async with async_dbpool as conn:
+                await conn.touch_api_keys(pending)
+        except Exception as e:
+            logger.error("cannot write api key last_used: %r", e)
+            # keep the newest stamp of each key for the next flush
+            self._last_used = {**pending, **self._last_used}
+            return 0
+        self.flushed += len(pending)
+        return len(pending)
+
+    async def _flush_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_periodically(), name="api-key-last-used")
+
+    async def stop(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            await asyncio.gather(self._flusher, return_exceptions=True)
+            self._flusher = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), **self._lookups.stats(), "pending_last_used": len(self._last_used),
+                "flushed": self.flushed}
+
+
+api_keys = ApiKeyAuthenticator()
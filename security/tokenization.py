@@ -1,8 +1,12 @@
 import jwt
+from time import time
+from hashlib import sha256
 from fastapi import HTTPException, status, Request
 from functools import wraps
 from decouple import config
 from utils import Logger
+from backend.cache import LRUTTLCache, MISSING
+from security.api_keys import api_keys, API_KEY_HEADER
 
 logger = Logger("security.tokenization")
 
@@ -10,37 +14,68 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 SECRET_KEY = bytes.fromhex(config("TOKEN_KEY"))
 
+# verified tokens, keyed by the digest of the whole token (signature included)
+# so a hit is the exact token that was verified; entries never outlive `exp`
+TOKEN_CACHE_TTL = float(config("TOKEN_CACHE_TTL", default="300"))
+token_cache = LRUTTLCache(
+    name="tokens",
+    max_entries=int(config("TOKEN_CACHE_MAX_ENTRIES", default="10000")),
+    ttl=TOKEN_CACHE_TTL,
+)
+
 
 def test_authorization_token(func):
     @wraps(func)
     async def wrapper(*args, **kwargs):
-        logger.debug(f"call test_authorization_token, on {func.__name__}")
+        logger.debug("call test_authorization_token, on %s", func.__name__)
         request = kwargs.get('request')  # Get the request object from kwargs
-        if not request or "Authorization" not in request.headers:
-            logger.error(f"call test_authorization_token, on {func.__name__} , {request=} or Authorization header missing")
+        if not request or ("Authorization" not in request.headers and API_KEY_HEADER not in request.headers):
+            logger.error(
+                "call test_authorization_token, on %s , request=%r or Authorization header missing",
+                func.__name__, request
+            )
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authorization header missing")
-        authorization: str = request.headers.get('Authorization')
+        authorization: str = request.headers.get('Authorization', request.headers.get(API_KEY_HEADER))
         if not authorization:
-            logger.error(f"call test_authorization_token, on {func.__name__} , Authorization header is empty")
+            logger.error("call test_authorization_token, on %s , Authorization header is empty", func.__name__)
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Authorization header is empty")
         try:
             # Extract the token from the Authorization header
             user_id = await get_current_user_session(request)
             if not user_id:
-                logger.error(f"call test_authorization_token, on {func.__name__} , Invalid token")
+                logger.error("call test_authorization_token, on %s , Invalid token", func.__name__)
                 raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-            logger.debug(f"call test_authorization_token, on {func.__name__} , Token is valid")
+            logger.debug("call test_authorization_token, on %s , Token is valid", func.__name__)
             return await func(*args, **kwargs)
         except jwt.ExpiredSignatureError:
-            logger.error(f"call test_authorization_token, on {func.__name__} , Token has expired")
+            logger.error("call test_authorization_token, on %s , Token has expired", func.__name__)
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has expired")
         except jwt.PyJWTError:
-            logger.error(f"call test_authorization_token, on {func.__name__} , Invalid token")
+            logger.error("call test_authorization_token, on %s , Invalid token", func.__name__)
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
     return wrapper
 
 
-async def decode_jwt(token):
+def get_bearer_token(request: Request) -> str:
+    """The token of the `Authorization: Bearer <token>` header, parsed once per request."""
+    token = getattr(request.state, "auth_token", None)
+    if token is None:
+        parts = request.headers.get('Authorization', '').split(' ')
+        if len(parts) != 2 or not parts[1]:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        token = request.state.auth_token = parts[1]
+    return token
+
+
+async def decode_jwt_cached(token: str):
+    """decode_jwt() behind token_cache: hot clients skip the HMAC verification."""
+    key = sha256(token.encode()).digest()
+    cached = token_cache.get(key)
+    if cached is not MISSING:
+        user_id, expires_at = cached
+        if expires_at is None or expires_at > time():
+            return user_id
+        token_cache.invalidate(key)
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except jwt.ExpiredSignatureError:
@@ -48,19 +83,46 @@ async def decode_jwt(token):
     except jwt.PyJWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
     user_id = payload.get("sub")
+    expires_at = payload.get("exp")
+    ttl = TOKEN_CACHE_TTL if expires_at is None else min(TOKEN_CACHE_TTL, expires_at - time())
+    if user_id and ttl > 0:
+        token_cache.set(key, (user_id, expires_at), ttl=ttl)
     return user_id
 
 
-async def get_current_user_session(request: Request):
-    if 'docs' in request.url.path or 'openapi.json' in request.url.path:
-        return None
-    if 'Authorization' not in request.headers:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing AuthHeaders")
-    token = request.headers.get('Authorization').split(' ')[1]
+async def decode_jwt(token):
     try:
-        # return the user_id
-        return await decode_jwt(token)
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token has expired")
     except jwt.PyJWTError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    user_id = payload.get("sub")
+    return user_id
+
+
+async def get_current_user_session(request: Request):
+    """
+    The user id of the request, from the bearer JWT or else the X-API-Key
+    header. The credentials are verified on the first call (normally by
+    test_authorization_token) and the principal is kept on request.state, so
+    handlers calling this again get it for free.
+    """
+    user_id = getattr(request.state, "user_id", None)
+    if user_id is not None:
+        return user_id
+    if 'docs' in request.url.path or 'openapi.json' in request.url.path:
+        return None
+    if 'Authorization' not in request.headers:
+        if API_KEY_HEADER not in request.headers:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Missing AuthHeaders")
+        user_id = await api_keys.authenticate(request.headers.get(API_KEY_HEADER))
+        if not user_id:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid API key")
+        request.state.user_id = user_id
+        return user_id
+    token = get_bearer_token(request)
+    # return the user_id
+    user_id = await decode_jwt_cached(token)
+    request.state.user_id = user_id
+    return user_id
@@ -0,0 +1,196 @@
+from hashlib import sha256
+from typing import Iterable, Optional
+from decouple import config
+from utils import Logger
+
+logger = Logger("services.address_format")
+
+# ---------- networks ----------
+# network name -> (base58 version bytes, bech32 human readable part)
+MAINNET = (frozenset((0x00, 0x05)), "bc")
+TESTNET = (frozenset((0x6f, 0xc4)), "tb")
+REGTEST = (frozenset((0x6f, 0xc4)), "bcrt")
+NETWORKS = {
+    "bitcoin": MAINNET,
+    "mainnet": MAINNET,
+    "testnet": TESTNET,
+    "testnet3": TESTNET,
+    "testnet4": TESTNET,
+    "signet": TESTNET,
+    "regtest": REGTEST,
+}
+
+ENABLED = config("ADDRESS_PREVALIDATION", default="1") == "1"
+
+# ---------- base58check (P2PKH / P2SH) ----------
+B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+B58_INDEX = {char: index for index, char in enumerate(B58_ALPHABET)}
+
+
+def decode_base58check(address: str) -> Optional[bytes]:
+    """Returns version byte + payload, or None when the encoding or checksum is wrong."""
+    num = 0
+    for char in address:
+        index = B58_INDEX.get(char)
+        if index is None:
+            return None
+        num = num * 58 + index
+    pad = len(address) - len(address.lstrip("1"))
+    raw = b"\x00" * pad + num.to_bytes((num.bit_length() + 7) // 8, "big")
+    if len(raw) < 5:
+        return None
+    data, checksum = raw[:-4], raw[-4:]
+    if sha256(sha256(data).digest()).digest()[:4] != checksum:
+        return None
+    return data
+
+
+def encode_base58check(data: bytes) -> str:
+    raw = data + sha256(sha256(data).digest()).digest()[:4]
+    num = int.from_bytes(raw, "big")
+    chars = []
+    while num:
+        num, rest = divmod(num, 58)
+        chars.append(B58_ALPHABET[rest])
+    pad = len(raw) - len(raw.lstrip(b"\x00"))
+    return "1" * pad + "".join(reversed(chars))
+
+
+# ---------- bech32 / bech32m (BIP-173, BIP-350) ----------
+BECH32_CHARSET = "qpzry9x8gf2tvdw0s3jn54khce6mua7l"
+BECH32_INDEX = {char: index for index, char in enumerate(BECH32_CHARSET)}
+BECH32_CONST = 1
+BECH32M_CONST = 0x2bc830a3
+BECH32_GEN = (0x3b6a57b2, 0x26508e6d, 0x1ea119fa, 0x3d4233dd, 0x2a1462b3)
+# generator xor for every value of the 5 top bits, one lookup per character instead of 5 branches
+BECH32_TABLE = tuple(
+    ((top & 1) and BECH32_GEN[0]) ^ ((top & 2) and BECH32_GEN[1]) ^ ((top & 4) and BECH32_GEN[2])
+    ^ ((top & 8) and BECH32_GEN[3]) ^ ((top & 16) and BECH32_GEN[4])
+    for top in range(32)
+)
+
+
+def _bech32_polymod(values: Iterable[int]) -> int:
+    chk = 1
+    for value in values:
+        chk = (chk & 0x1ffffff) << 5 ^ value ^ BECH32_TABLE[chk >> 25]
+    return chk
+
+
+def _hrp_expand(hrp: str) -> list[int]:
+    return [ord(char) >> 5 for char in hrp] + [0] + [ord(char) & 31 for char in hrp]
+
+
+def _convert_bits(data: Iterable[int], from_bits: int, to_bits: int, pad: bool) -> Optional[list[int]]:
+    acc = bits = 0
+    out = []
+    max_value = (1 << to_bits) - 1
+    for value in data:
+        acc = (acc << from_bits) | value
+        bits += from_bits
+        while bits >= to_bits:
+            bits -= to_bits
+            out.append((acc >> bits) & max_value)
+    if pad:
+        if bits:
+            out.append((acc << (to_bits - bits)) & max_value)
+    elif bits >= from_bits or (acc << (to_bits - bits)) & max_value:
+        return None
+    return out
+
+
+def decode_segwit_address(address: str, hrp: str) -> Optional[tuple[int, bytes]]:
+    """Returns (witness version, witness program), or None when the address is not valid for `hrp`."""
+    if len(address) > 90 or (address.lower() != address and address.upper() != address):
+        return None
+    address = address.lower()
+    separator = address.rfind("1")
+    if separator < 1 or separator + 7 > len(address) or address[:separator] != hrp:
+        return None
+    try:
+        data = [BECH32_INDEX[char] for char in address[separator + 1:]]
+    except KeyError:
+        return None
+    const = _bech32_polymod(_hrp_expand(hrp) + data)
+    if const not in (BECH32_CONST, BECH32M_CONST):
+        return None
+    version = data[0]
+    program = _convert_bits(data[1:-6], 5, 8, False)
+    if version > 16 or program is None or not 2 <= len(program) <= 40:
+        return None
+    # v0 must use bech32 and have a 20 (P2WPKH) or 32 (P2WSH) byte program, v1+ must use bech32m
+    if version == 0 and (const != BECH32_CONST or len(program) not in (20, 32)):
+        return None
+    if version != 0 and const != BECH32M_CONST:
+        return None
+    return version, bytes(program)
+
+
+def encode_segwit_address(hrp: str, version: int, program: bytes) -> str:
+    data = [version] + _convert_bits(program, 8, 5, True)
+    const = BECH32_CONST if version == 0 else BECH32M_CONST
+    polymod = _bech32_polymod(_hrp_expand(hrp) + data + [0] * 6) ^ const
+    checksum = [(polymod >> 5 * (5 - i)) & 31 for i in range(6)]
+    return hrp + "1" + "".join(BECH32_CHARSET[value] for value in data + checksum)
+
+
+# ---------- validation ----------
+def _network_params(network: str, force_testnet: bool) -> Optional[tuple[frozenset, str]]:
+    """(base58 versions, bech32 hrp) accepted for `network`, None for a network without local rules."""
+    params = NETWORKS.get((network or "bitcoin").lower())
+    if force_testnet and params is MAINNET:
+        params = TESTNET
+    return params
+
+
+def _format_error(address: str, versions: frozenset, hrp: str) -> Optional[str]:
+    if not address or len(address) < 14 or len(address) > 90:
+        return "bad length"
+    if address[:len(hrp) + 1].lower() == hrp + "1":
+        return None if decode_segwit_address(address, hrp) else "bad bech32 address"
+    data = decode_base58check(address)
+    if data is None:
+        return "bad base58check encoding"
+    if len(data) != 21:
+        return "bad payload length"
+    if data[0] not in versions:
+        return "wrong network prefix"
+    return None
+
+
+def address_format_error(address: str, network: str = "bitcoin", force_testnet: bool = False) -> Optional[str]:
+    """
+    Offline syntax check of a bitcoin address for `network` (testnet prefixes
+    when force_testnet is set). Returns the reason the address is malformed,
+    or None when it is well-formed or the network has no local rules (the
+    broadcaster stays the judge of whether the wallet actually exists).
+    """
+    params = _network_params(network, force_testnet)
+    return None if params is None else _format_error(address, *params)
+
+
+def is_valid_address_format(address: str, network: str = "bitcoin", force_testnet: bool = False) -> bool:
+    return address_format_error(address, network, force_testnet) is None
+
+
+def address_format_errors(items: Iterable[tuple[str, str, bool]]) -> list[Optional[str]]:
+    """
+    Bulk mode for batch imports: one result per (address, network,
+    force_testnet) item. The rules of each distinct network are looked up
+    once and repeated items are checked once; every other address is still
+    checked on its own, as hashlib and int arithmetic offer nothing to
+    batch in pure Python.
+    """
+    params_of: dict[tuple[str, bool], Optional[tuple[frozenset, str]]] = {}
+    seen: dict[tuple, Optional[str]] = {}
+    results = []
+    for item in items:
+        error = seen.get(item, item)
+        if error is item:
+            address, network, force_testnet = item
+            key = (network, force_testnet)
+            params = params_of[key] if key in params_of \
+                else params_of.setdefault(key, _network_params(network, force_testnet))
+            error = seen[item] = None if params is None else _format_error(address, *params)
+        results.append(error)
+    return results
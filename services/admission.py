@@ -0,0 +1,234 @@
+import asyncio
+from time import monotonic
+from contextvars import ContextVar
+from collections import OrderedDict
+from decouple import config
+from starlette.types import ASGIApp, Scope, Receive, Send
+from starlette.exceptions import HTTPException
+from utils import Logger, Singleton
+from backend.database import async_engine, async_dbpool
+from security.api_keys import hash_api_key
+from security.tokenization import decode_jwt_cached
+from services.metrics import registry, Counter, Gauge
+
+logger = Logger("services.admission")
+
+
+# ---------- per-user token buckets ----------
+class RateLimiter(metaclass=Singleton):
+    """
+    Token bucket per caller: RATE_LIMIT_PER_SECOND sustained, bursts of up to
+    RATE_LIMIT_BURST. Callers are keyed by JWT subject (or API key hash).
+    The buckets live in this worker process, at most RATE_LIMIT_MAX_KEYS of
+    them (least recently used dropped first): with WEB_WORKERS > 1 a caller
+    spread over the workers gets up to WEB_WORKERS times the limit.
+    RATE_LIMIT_PER_SECOND=0 disables the limit.
+    """
+
+    def __init__(self):
+        super(RateLimiter, self).__init__()
+        self.rate = float(config("RATE_LIMIT_PER_SECOND", default="20"))
+        self.burst = float(config("RATE_LIMIT_BURST", default="40"))
+        self.max_keys = int(config("RATE_LIMIT_MAX_KEYS", default="100000"))
+        # key -> (tokens, updated_at)
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self.limited = 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def take(self, key: str) -> float:
+        """Takes one token: 0 when the request may go on, else the Retry-After in seconds."""
+        now = monotonic()
+        tokens, updated_at = self._buckets.pop(key, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated_at) * self.rate)
+        wait = 0.0
+        if tokens >= 1.0:
+            tokens -= 1.0
+        else:
+            wait = (1.0 - tokens) / self.rate
+            self.limited += 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> dict:
+        return {"rate": self.rate, "burst": self.burst, "buckets": len(self._buckets), "limited": self.limited}
+
+
+# ---------- admission control ----------
+def pool_capacity(pool) -> int:
+    """Connections the pool can hand out at once: pool_size + max_overflow."""
+    if not hasattr(pool, "size"):
+        return 0
+    overflow = getattr(pool, "_max_overflow", 0)
+    return pool.size() + max(0, overflow)
+
+
+# set by AdmissionMiddleware while a DB-bound request runs: only its sessions take slots
+_db_bound_request: ContextVar[bool] = ContextVar("admission_db_bound_request", default=False)
+
+
+class AdmissionController(metaclass=Singleton):
+    """
+    Caps the DB sessions of requests open at once to what the connection pool
+    can serve (ADMISSION_MAX_IN_FLIGHT, default pool_size + max_overflow). A
+    slot is taken when AsyncDbConnectionPool opens a request's session and
+    given back when it closes, so requests waiting on the broadcaster (or on
+    another request's idempotency key) hold none. Up to ADMISSION_MAX_QUEUE
+    more wait at most ADMISSION_QUEUE_TIMEOUT seconds for a slot; beyond that
+    requests are shed right away instead of queueing on the pool for
+    DB_POOL_TIMEOUT seconds.
+    """
+
+    def __init__(self):
+        super(AdmissionController, self).__init__()
+        self.enabled = config("ADMISSION_CONTROL", default="1") == "1"
+        self.capacity = int(config("ADMISSION_MAX_IN_FLIGHT", default="0")) or pool_capacity(async_engine.pool) or 20
+        self.max_waiting = int(config("ADMISSION_MAX_QUEUE", default="0")) or self.capacity
+        self.queue_timeout = float(config("ADMISSION_QUEUE_TIMEOUT", default="0.5"))
+        self.retry_after = int(config("ADMISSION_RETRY_AFTER", default="1"))
+        self._slots = asyncio.Semaphore(self.capacity)
+        self.in_flight = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+
+    async def enter(self) -> bool:
+        """
+        Called by AsyncDbConnectionPool before it opens a session: takes a
+        slot when the session belongs to a DB-bound request (True, release()
+        once it is closed), raises a 503 when the request has to be shed.
+        Sessions of background tasks are not counted (False).
+        """
+        if not self.enabled or not _db_bound_request.get():
+            return False
+        if not await self.acquire():
+            admission_rejections.inc("overloaded")
+            raise HTTPException(status_code=503, detail="Service overloaded, retry later",
+                                headers={"Retry-After": str(self.retry_after)})
+        return True
+
+    async def acquire(self) -> bool:
+        """Takes a slot; False when the request has to be shed."""
+        if self._slots.locked():
+            if self.waiting >= self.max_waiting:
+                self.shed += 1
+                return False
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                self.shed += 1
+                return False
+            finally:
+                self.waiting -= 1
+        else:
+            await self._slots.acquire()
+        self.in_flight += 1
+        self.admitted += 1
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self) -> dict:
+        return {"capacity": self.capacity, "in_flight": self.in_flight, "waiting": self.waiting,
+                "admitted": self.admitted, "shed": self.shed}
+
+
+rate_limiter = RateLimiter()
+admission = AdmissionController()
+async_dbpool.gate = admission
+
+registry.register(Gauge("admission_in_flight", "DB sessions of requests open",
+                        function=lambda: {(): admission.in_flight}))
+registry.register(Gauge("admission_waiting", "Requests waiting for a DB session slot",
+                        function=lambda: {(): admission.waiting}))
+registry.register(Gauge("admission_capacity", "DB sessions of requests open at once (ADMISSION_MAX_IN_FLIGHT)",
+                        function=lambda: {(): admission.capacity}))
+registry.register(Gauge("rate_limit_buckets", "Token buckets tracked by this worker",
+                        function=lambda: {(): len(rate_limiter)}))
+admission_rejections = registry.register(Counter(
+    "admission_rejections_total", "Requests refused before reaching the DB", ("reason",)))
+
+
+class AdmissionMiddleware:
+    """
+    Pure ASGI middleware in front of the DB-bound routes (ADMISSION_PATH_PREFIXES,
+    matched on the route template PathWhitelistMiddleware leaves in
+    scope["route_path"]): per-user rate limit first (429 with Retry-After),
+    then marks the request so AdmissionController gates each of its DB
+    sessions (503 with Retry-After). The JWT verified to find the subject is
+    kept on the request state, so the route does not verify it again.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.prefixes = tuple(config("ADMISSION_PATH_PREFIXES", default="/wallets").split(","))
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["method"] == "OPTIONS" \
+                or not scope.get("route_path", "").startswith(self.prefixes):
+            await self.app(scope, receive, send)
+            return
+        if rate_limiter.enabled:
+            subject = await self.subject(scope)
+            wait = rate_limiter.take(subject) if subject else 0.0
+            if wait:
+                admission_rejections.inc("rate_limited")
+                await self.reject(send, 429, "Too many requests", retry_after=wait)
+                return
+        token = _db_bound_request.set(True)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _db_bound_request.reset(token)
+
+    @staticmethod
+    async def subject(scope: Scope):
+        """Rate limit key: the verified JWT subject, else the API key hash. None for anonymous requests."""
+        authorization = api_key = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                authorization = value.decode("latin-1")
+            elif name == b"x-api-key":
+                api_key = value.decode("latin-1")
+        if authorization:
+            parts = authorization.split(" ")
+            if len(parts) != 2 or not parts[1]:
+                return None
+            try:
+                user_id = await decode_jwt_cached(parts[1])
+            except HTTPException:
+                # rejected with 401 by the route
+                return None
+            if user_id:
+                state = scope.setdefault("state", {})
+                state["auth_token"], state["user_id"] = parts[1], user_id
+                return f"user:{user_id}"
+            return None
+        if api_key:
+            # no DB lookup here: an unknown key gets its 401 from the route
+            return "key:" + hash_api_key(api_key)[:32]
+        return None
+
+    @staticmethod
+    async def reject(send: Send, status_code: int, detail: str, retry_after: float) -> None:
+        body = b'{"detail":"' + detail.encode() + b'"}'
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, int(retry_after + 0.999))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
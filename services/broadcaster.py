@@ -1,29 +1,228 @@
-import requests
+import asyncio
+import httpx
+from time import perf_counter
+from typing import Optional
+from importlib.util import find_spec
+from decouple import config
 from utils import Logger, Singleton
+from backend.cache import LRUTTLCache, SingleFlight, MISSING
+from services.resilience import CircuitBreaker, CircuitOpenError, RetryBudget, backoff_delay
+from services.metrics import broadcaster_request_duration, broadcaster_calls
 
 logger = Logger("services.broadcaster")
 
+
 class Broadcaster(metaclass=Singleton):
+    """
+    Client for the broadcast service, built on one pooled httpx.AsyncClient.
+    Connections are kept alive and reused, auth headers are sent per request
+    (never stored on the shared client), connect/read timeouts are separate,
+    and at most BROADCASTER_MAX_CONCURRENCY calls are in flight at once.
+    HTTP/2 is used when enabled and the `h2` package is installed.
+    validate_wallet() puts a TTL cache of outcomes (separate positive and
+    negative TTLs) and single-flight coalescing in front of test_wallet().
+    test_wallet() itself goes through a circuit breaker (fail fast while the
+    service is down, half-open probing to recover), retries transient errors
+    with jittered backoff within a retry budget, and can hedge slow calls.
+    """
 
-    base_url = "https://broadcast.yoursbtc.com"
+    base_url = config("BROADCASTER_URL", default="https://broadcast.yoursbtc.com")
+    # used when there is no caller JWT to forward (background workers, API-key clients)
+    service_token = config("BROADCASTER_SERVICE_TOKEN", default="")
 
     headers = {"Content-Type": "application/json"}
 
     def __init__(self):
         super(Broadcaster, self).__init__()
-        self._session = requests.Session()
+        self.connect_timeout = float(config("BROADCASTER_CONNECT_TIMEOUT", default="2"))
+        self.read_timeout = float(config("BROADCASTER_READ_TIMEOUT", default="5"))
+        self.max_connections = int(config("BROADCASTER_MAX_CONNECTIONS", default="20"))
+        self.max_keepalive = int(config("BROADCASTER_MAX_KEEPALIVE", default="20"))
+        self.max_concurrency = int(config("BROADCASTER_MAX_CONCURRENCY", default="20"))
+        self.http2 = config("BROADCASTER_HTTP2", default="0") == "1" and find_spec("h2") is not None
+        self._transport: Optional[httpx.AsyncBaseTransport] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.positive_ttl = float(config("VALIDATION_POSITIVE_TTL", default="3600"))
+        self.negative_ttl = float(config("VALIDATION_NEGATIVE_TTL", default="60"))
+        self.validation_cache = LRUTTLCache(
+            name="validations",
+            max_entries=int(config("VALIDATION_CACHE_MAX_ENTRIES", default="50000")),
+            ttl=self.positive_ttl,
+        )
+        self._validations = SingleFlight()
+        self.fail_fast = config("BROADCASTER_FAIL_FAST", default="1") == "1"
+        self.max_retries = int(config("BROADCASTER_MAX_RETRIES", default="2"))
+        self.backoff_base = float(config("BROADCASTER_BACKOFF_BASE", default="0.05"))
+        self.backoff_cap = float(config("BROADCASTER_BACKOFF_CAP", default="1"))
+        self.hedge_after = float(config("BROADCASTER_HEDGE_AFTER", default="0"))
+        self.breaker = CircuitBreaker(
+            name="broadcaster",
+            failure_threshold=int(config("BROADCASTER_BREAKER_FAILURES", default="5")),
+            reset_timeout=float(config("BROADCASTER_BREAKER_RESET", default="30")),
+            half_open_max_calls=int(config("BROADCASTER_BREAKER_PROBES", default="1")),
+        )
+        self.retry_budget = RetryBudget(
+            ratio=float(config("BROADCASTER_RETRY_RATIO", default="0.2")),
+            min_per_second=float(config("BROADCASTER_RETRY_MIN_PER_SECOND", default="1")),
+        )
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers=self.headers,
+                http2=self.http2,
+                transport=self._transport,
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=30
+                ),
+            )
+        return self._client
+
+    async def configure(self, base_url: str = None, transport: httpx.AsyncBaseTransport = None):
+        """Points the client somewhere else, e.g. the local stub in benchmarks/broadcaster_stub.py."""
+        await self.aclose()
+        if base_url:
+            self.base_url = base_url
+        self._transport = transport
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def _post_status(self, address: str, network: str, auth_token: str) -> dict:
+        async with self._semaphore:
+            started = perf_counter()
+            try:
+                response = await self.client.post(
+                    "/wallets/status",
+                    params={"address": address, "network": network},
+                    headers={"Authorization": f"Bearer {auth_token}"}
+                )
+            except Exception as e:
+                broadcaster_request_duration.observe(perf_counter() - started, e.__class__.__name__)
+                raise
+            broadcaster_request_duration.observe(perf_counter() - started, f"{response.status_code // 100}xx")
+        response.raise_for_status()
+        return response.json()
+
+    async def _hedged_post_status(self, address: str, network: str, auth_token: str) -> dict:
+        """
+        Sends a second, identical request when the first has not answered
+        within BROADCASTER_HEDGE_AFTER seconds and returns whichever succeeds
+        first. Hedges are paid for from the retry budget.
+        """
+        if self.hedge_after <= 0:
+            return await self._post_status(address, network, auth_token)
+        pending = {asyncio.ensure_future(self._post_status(address, network, auth_token))}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_after)
+            if not done and self.retry_budget.try_spend():
+                logger.debug("hedging test_wallet for address=%r", address)
+                pending.add(asyncio.ensure_future(self._post_status(address, network, auth_token)))
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # retrieve every exception, even next to a success, so none is reported as never retrieved
+                outcomes = [(task, task.exception()) for task in done]
+                for task, task_error in outcomes:
+                    if task_error is None:
+                        return task.result()
+                    error = task_error
+            raise error
+        finally:
+            # the caller may be cancelled while waiting: no request outlives it, holding a connection slot
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code == 429 or error.response.status_code >= 500
+        return isinstance(error, httpx.TransportError)
 
     async def test_wallet(self, address: str, network: str, auth_token: str):
+        probe = None
+        if self.fail_fast:
+            try:
+                probe = self.breaker.before_call()
+            except CircuitOpenError:
+                broadcaster_calls.inc("circuit_open")
+                raise
         try:
-            url = f"{self.base_url}/wallets/status?address={address}&network={network}"
-            self._session.headers.update({"Authorization": f"Bearer {auth_token}"})
-            response = self._session.post(url=url, headers=self.headers)
-            response.raise_for_status()
-            data = await response.json()
-            logger.debug(f"test_wallet response: {data}")
+            return await self._test_wallet_with_retries(address, network, auth_token)
+        finally:
+            # a cancelled probe records nothing: don't let it hold the half-open slot forever
+            self.breaker.release_probe(probe)
+
+    async def _test_wallet_with_retries(self, address: str, network: str, auth_token: str):
+        self.retry_budget.record_request()
+        attempt = 0
+        while True:
+            try:
+                data = await self._hedged_post_status(address, network, auth_token)
+            except Exception as e:
+                if not self._is_retryable(e):
+                    # the service answered, it is the request that was rejected
+                    self.breaker.record_success()
+                    broadcaster_calls.inc("rejected")
+                    logger.error("Error testing wallet: %r", e)
+                    raise e
+                if attempt >= self.max_retries or not self.retry_budget.try_spend():
+                    # the breaker tracks calls, not attempts: retries that recover don't count
+                    self.breaker.record_failure()
+                    broadcaster_calls.inc("failed")
+                    logger.error("Error testing wallet after %s attempts: %r", attempt + 1, e)
+                    raise e
+                await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_cap))
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            broadcaster_calls.inc("success" if attempt == 0 else "success_after_retry")
+            logger.debug("test_wallet response: %s", data)
             return data
-        except Exception as e:
-            logger.error(f"Error testing wallet: {e}")
-            raise e
 
-broadcaster = Broadcaster()
\ No newline at end of file
+    def resilience_stats(self) -> dict:
+        return {"breaker": self.breaker.stats(), "retry_budget": self.retry_budget.stats()}
+
+    async def validate_wallet(self, address: str, network: str, auth_token: str) -> bool:
+        """
+        Cached, coalesced verdict for (address, network). Remote errors are
+        raised to every waiting caller and are never cached.
+        """
+        key = (network, address)
+        cached = self.validation_cache.get(key)
+        if cached is not MISSING:
+            logger.debug("validate_wallet cache hit key=%r cached=%r", key, cached)
+            return cached
+
+        async def fetch() -> bool:
+            ok = validation_status(await self.test_wallet(address=address, network=network, auth_token=auth_token))
+            self.validation_cache.set(key, ok, ttl=self.positive_ttl if ok else self.negative_ttl)
+            return ok
+
+        return await self._validations.do(key, fetch)
+
+    def validation_stats(self) -> dict:
+        cache = self.validation_cache.stats()
+        lookups = cache["hits"] + cache["misses"]
+        return {
+            **cache,
+            "hit_ratio": cache["hits"] / lookups if lookups else 0.0,
+            **self._validations.stats(),
+        }
+
+
+def validation_status(data: dict) -> bool:
+    """Extracts the mempool verdict from a /wallets/status response."""
+    return bool(((data or {}).get('results') or {}).get('mempool', {}).get('ok'))
+
+
+broadcaster = Broadcaster()
@@ -0,0 +1,189 @@
+import asyncio
+from json import dumps
+from hashlib import sha256
+from time import monotonic
+from datetime import timedelta
+from typing import Awaitable, Callable, NamedTuple, Optional
+from decouple import config
+from sqlalchemy.exc import IntegrityError
+from starlette.responses import Response
+from utils import Logger, Singleton, timestamp_update
+from backend.cache import LRUTTLCache, SingleFlight, MISSING
+from backend.database import async_dbpool
+from models.serialization import FastJSONResponse
+
+logger = Logger("services.idempotency")
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyError(Exception):
+    """A request that cannot run under its Idempotency-Key; status_code is the HTTP status to answer with."""
+
+    def __init__(self, status_code: int, detail: str):
+        super(IdempotencyError, self).__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class StoredResponse(NamedTuple):
+    request_hash: str
+    status_code: int
+    body: bytes
+
+
+def request_fingerprint(payload: dict) -> str:
+    """sha256 of the canonical JSON of a request body, to tell a retry from a different request reusing a key."""
+    return sha256(dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def _is_unique_violation(error: IntegrityError) -> bool:
+    # postgres: SQLSTATE 23505 (asyncpg UniqueViolationError), sqlite: "UNIQUE constraint failed"
+    orig = error.orig
+    return getattr(orig, "sqlstate", None) == "23505" or getattr(orig, "pgcode", None) == "23505" \
+        or type(orig).__name__ == "UniqueViolationError" or "UNIQUE constraint failed" in str(orig)
+
+
+class IdempotencyStore(metaclass=Singleton):
+    """
+    Idempotency-Key support for POST handlers. The first request with a key
+    claims it in idempotency_keys_tbl and runs; its 2xx response is stored for
+    IDEMPOTENCY_TTL seconds and replayed to every retry with the same key and
+    body, without running the handler again. Other outcomes (errors,
+    exceptions) release the claim, so a retry runs the request for real.
+
+    Concurrent duplicates wait for the first request: inside a worker they
+    share its result through SingleFlight, across workers they poll the
+    pending row for up to IDEMPOTENCY_WAIT_TIMEOUT seconds (409 after that).
+    A pending claim is leased for IDEMPOTENCY_LEASE seconds, so the key is
+    freed if the worker holding it dies. Stored responses are kept in a
+    per-worker LRU in front of the table, so replays usually cost no query.
+    """
+
+    def __init__(self):
+        super(IdempotencyStore, self).__init__()
+        self.ttl = float(config("IDEMPOTENCY_TTL", default="86400"))
+        self.lease = float(config("IDEMPOTENCY_LEASE", default="60"))
+        self.wait_timeout = float(config("IDEMPOTENCY_WAIT_TIMEOUT", default="10"))
+        self.poll_interval = float(config("IDEMPOTENCY_POLL_INTERVAL", default="0.1"))
+        self.purge_interval = float(config("IDEMPOTENCY_PURGE_INTERVAL", default="300"))
+        self.cache = LRUTTLCache(
+            name="idempotency",
+            max_entries=int(config("IDEMPOTENCY_CACHE_MAX_ENTRIES", default="10000")),
+            ttl=self.ttl,
+        )
+        self._flight = SingleFlight()
+        self._purged_at = monotonic()
+        self.executed = 0
+        self.replayed = 0
+        self.conflicts = 0
+        self.purged = 0
+
+    @staticmethod
+    def key_id(user_id: str, key: str) -> str:
+        return sha256(f"{user_id}:{key}".encode()).hexdigest()
+
+    async def run(self, user_id: str, key: str, request_hash: str,
+                  handler: Callable[[], Awaitable[Response]]) -> Response:
+        """
+        The response of `handler`, run at most once per (user, key): retries
+        get the stored response back, with an Idempotent-Replayed header.
+        Raises IdempotencyError for an invalid key (400), a key reused with
+        another body (422) or a duplicate still running elsewhere (409).
+        """
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise IdempotencyError(400, f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters")
+        key_id = self.key_id(user_id, key)
+        stored = self.cache.get(key_id)
+        if stored is MISSING:
+            response = None
+
+            async def execute() -> StoredResponse:
+                nonlocal response
+                stored, response = await self._execute(key_id, user_id, request_hash, handler)
+                return stored
+
+            # duplicates arriving on this worker meanwhile wait for the same outcome
+            stored = await self._flight.do(key_id, execute)
+            if response is not None:
+                return response
+        if stored.request_hash != request_hash:
+            self.conflicts += 1
+            raise IdempotencyError(422, f"{IDEMPOTENCY_HEADER} was already used with a different request")
+        self.replayed += 1
+        return FastJSONResponse(content=stored.body, status_code=stored.status_code, headers={REPLAYED_HEADER: "true"})
+
+    async def _execute(self, key_id: str, user_id: str, request_hash: str,
+                       handler: Callable[[], Awaitable[Response]]) -> tuple[StoredResponse, Optional[Response]]:
+        """
+        Claims the key and runs the handler: its outcome plus the Response it
+        returned. When the key is already taken, the stored outcome of the
+        request holding it, once there is one, and no Response.
+        """
+        deadline = monotonic() + self.wait_timeout
+        while True:
+            stored = await self._claim(key_id, user_id, request_hash)
+            if stored is None:
+                break
+            if stored.status_code or stored.request_hash != request_hash:
+                return stored, None
+            if monotonic() >= deadline:
+                self.conflicts += 1
+                raise IdempotencyError(409, f"A request with this {IDEMPOTENCY_HEADER} is still in progress")
+            await asyncio.sleep(self.poll_interval)
+        try:
+            response = await handler()
+        except BaseException:
+            await asyncio.shield(self._release(key_id))
+            raise
+        self.executed += 1
+        stored = StoredResponse(request_hash, response.status_code, bytes(response.body))
+        if 200 <= response.status_code < 300:
+            await self._complete(key_id, stored)
+        else:
+            await self._release(key_id)
+        return stored, response
+
+    async def _claim(self, key_id: str, user_id: str, request_hash: str) -> Optional[StoredResponse]:
+        """None once this worker holds the key, else the StoredResponse (status 0 while pending) of the holder."""
+        try:
+            async with async_dbpool as conn:
+                row = await conn.claim_idempotency_key(key_id, user_id, request_hash, lease=self.lease)
+        except IntegrityError as e:
+            if not _is_unique_violation(e):
+                # e.g. a foreign key violation: nobody holds the key, polling would only end in a 409
+                raise
+            # another worker inserted the same key first: poll its row
+            return StoredResponse(request_hash, 0, b"")
+        if row is None:
+            return None
+        stored = StoredResponse(row.request_hash, row.status_code, (row.response_body or "").encode())
+        if stored.status_code:
+            self.cache.set(key_id, stored, ttl=(row.expires_at - timestamp_update()).total_seconds())
+        return stored
+
+    async def _complete(self, key_id: str, stored: StoredResponse) -> None:
+        expires_at = timestamp_update() + timedelta(seconds=self.ttl)
+        async with async_dbpool as conn:
+            await conn.complete_idempotency_key(key_id, stored.status_code, stored.body.decode(), expires_at)
+            if monotonic() - self._purged_at >= self.purge_interval:
+                self._purged_at = monotonic()
+                self.purged += await conn.purge_expired_idempotency_keys()
+        self.cache.set(key_id, stored)
+
+    async def _release(self, key_id: str) -> None:
+        try:
+            async with async_dbpool as conn:
+                await conn.release_idempotency_key(key_id)
+        except Exception as e:
+            # the claim still frees itself once IDEMPOTENCY_LEASE runs out
+            logger.error("cannot release idempotency key %s: %r", key_id[:12], e)
+
+    def stats(self) -> dict:
+        return {"executed": self.executed, "replayed": self.replayed, "conflicts": self.conflicts,
+                "purged": self.purged, "in_flight": len(self._flight), **self.cache.stats()}
+
+
+idempotency = IdempotencyStore()
@@ -0,0 +1,255 @@
+import logging
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Iterable, Optional
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.types import ASGIApp, Scope, Receive, Send, Message
+from utils import Logger
+
+logger = Logger("services.metrics")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 0.75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Metric(object):
+    """
+    Minimal Prometheus metric. Values live in plain dicts keyed by the label
+    values: every update happens on the event loop of one worker process, so
+    no locks are needed (each worker exposes its own series).
+    """
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return "\n".join((f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}",
+                          *self.samples()))
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super(Counter, self).__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Gauge(Metric):
+    """A gauge set by the code, or read from `function` at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 function: Optional[Callable[[], dict[tuple, float]]] = None):
+        super(Gauge, self).__init__(name, documentation, labelnames)
+        self._values: dict[tuple, float] = {}
+        self.function = function
+
+    def set(self, value: float, *labels) -> None:
+        self._values[labels] = value
+
+    def inc(self, *labels, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def dec(self, *labels, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) - amount
+
+    def samples(self) -> Iterable[str]:
+        values = self._values
+        if self.function is not None:
+            try:
+                values = self.function()
+            except Exception as e:
+                logger.error("cannot collect %s: %r", self.name, e)
+                values = {}
+        for labels, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {value}"
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: tuple = LATENCY_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (+Inf last), sum]
+        self._values: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels) -> None:
+        entry = self._values.get(labels)
+        if entry is None:
+            entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self) -> Iterable[str]:
+        for labels, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}"
+
+
+class Registry(object):
+    def __init__(self):
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self.metrics) + "\n"
+
+
+registry = Registry()
+
+# ---------- HTTP ----------
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "HTTP requests being served"))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template and status",
+    ("method", "route", "status")))
+
+# ---------- DB pool ----------
+db_pool_checkout_duration = registry.register(Histogram(
+    "db_pool_checkout_duration_seconds", "Time to get a connection from the pool (waiting and connecting)",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)))
+db_pool_checkouts = registry.register(Counter(
+    "db_pool_checkouts_total", "Connection checkouts"))
+db_pool_timeouts = registry.register(Counter(
+    "db_pool_timeouts_total", "Checkouts that timed out waiting for a connection"))
+db_pool_connections = registry.register(Counter(
+    "db_pool_connections_total", "New DB connections opened"))
+db_pool_checked_out = registry.register(Gauge(
+    "db_pool_checked_out", "Connections currently checked out (from checkout/checkin events)"))
+
+# ---------- broadcaster ----------
+broadcaster_request_duration = registry.register(Histogram(
+    "broadcaster_request_duration_seconds", "Broadcaster HTTP attempts by outcome", ("outcome",)))
+broadcaster_calls = registry.register(Counter(
+    "broadcaster_calls_total", "test_wallet calls by final outcome", ("outcome",)))
+
+# ---------- background validation ----------
+validation_queue_depth = registry.register(Gauge(
+    "wallet_validation_queue_depth", "Wallets waiting for background validation"))
+validation_queue_lag = registry.register(Gauge(
+    "wallet_validation_queue_lag_seconds", "Age of the oldest queued validation job"))
+validation_jobs = registry.register(Gauge(
+    "wallet_validation_jobs", "Jobs handled by this worker's validation pool since start", ("outcome",)))
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool timing how long each checkout waits for (or opens) a connection."""
+
+    def _do_get(self):
+        started = perf_counter()
+        try:
+            return super(InstrumentedAsyncQueuePool, self)._do_get()
+        except exc.TimeoutError:
+            db_pool_timeouts.inc()
+            raise
+        finally:
+            db_pool_checkout_duration.observe(perf_counter() - started)
+
+
+# SQLAlchemy logs pools under their class path, which would make this pool a
+# child of the "services.metrics" logger: keep its per-checkout INFO/DEBUG out of runtime.log
+logging.getLogger(f"{InstrumentedAsyncQueuePool.__module__}.{InstrumentedAsyncQueuePool.__name__}") \
+    .setLevel(logging.WARNING)
+
+
+def instrument_engine(engine) -> None:
+    """Pool gauges and counters for an (async) engine, from SQLAlchemy pool events."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+    pool = sync_engine.pool
+
+    @event.listens_for(sync_engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        db_pool_connections.inc()
+
+    @event.listens_for(sync_engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        db_pool_checkouts.inc()
+        db_pool_checked_out.inc()
+
+    @event.listens_for(sync_engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        db_pool_checked_out.dec()
+
+    if hasattr(pool, "size"):
+        registry.register(Gauge("db_pool_size", "Configured pool size (DB_POOL_SIZE)",
+                                function=lambda: {(): pool.size()}))
+        registry.register(Gauge("db_pool_overflow", "Connections open beyond the pool size (up to DB_MAX_OVERFLOW)",
+                                function=lambda: {(): max(0, pool.overflow())}))
+        registry.register(Gauge("db_pool_idle", "Idle connections in the pool",
+                                function=lambda: {(): pool.checkedin()}))
+
+
+def register_stats(name: str, documentation: str, stats: Callable[[], dict]) -> None:
+    """Exposes the numeric values of a stats() dict (caches, breaker, ...) as one gauge labelled by key."""
+    registry.register(Gauge(name, documentation, ("key",), function=lambda: {
+        (key,): float(value) for key, value in stats().items() if isinstance(value, (int, float))
+    }))
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording in-flight requests and latency per method,
+    route template and status. The route template is the one resolved by
+    PathWhitelistMiddleware (scope["route_path"]), so ids in paths don't
+    create new series; unmatched paths are reported as "unmatched".
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = perf_counter()
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            http_requests_in_flight.dec()
+            http_request_duration.observe(
+                perf_counter() - started, scope["method"], scope.get("route_path", "unmatched"), str(status_code)
+            )
@@ -0,0 +1,136 @@
+import random
+from time import monotonic
+from typing import Optional
+from utils import Logger
+
+logger = Logger("services.resilience")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super(CircuitOpenError, self).__init__(f"{name} circuit is open, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker(object):
+    """
+    Classic closed -> open -> half-open breaker.
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    are rejected for `reset_timeout` seconds. Then up to `half_open_max_calls`
+    probes are let through: one success closes the circuit again, one failure
+    re-opens it. A probe that ends with neither (e.g. it was cancelled) hands
+    its slot back through release_probe().
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float, half_open_max_calls: int = 1):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes = 0
+        # bumped on every switch to half-open, so a probe from an earlier round frees nothing
+        self._round = 0
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probes = 0
+            self._round += 1
+        return self._state
+
+    def retry_after(self) -> float:
+        return max(0.0, self.reset_timeout - (monotonic() - self._opened_at))
+
+    def before_call(self) -> Optional[int]:
+        """
+        Raises CircuitOpenError when the call must not be attempted. Returns a
+        probe token when the call is a half-open probe: pass it to
+        release_probe() once the call is over, whatever its outcome.
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return None
+        if state == self.HALF_OPEN and self._probes < self.half_open_max_calls:
+            self._probes += 1
+            return self._round
+        self.rejected += 1
+        raise CircuitOpenError(self.name, self.retry_after())
+
+    def release_probe(self, probe: Optional[int]) -> None:
+        """Frees the slot of a probe that recorded neither a success nor a failure."""
+        if probe is not None and probe == self._round and self._state == self.HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def record_success(self) -> None:
+        if self._state != self.CLOSED:
+            logger.info("%s circuit closed", self.name)
+        self._state = self.CLOSED
+        self._failures = 0
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+            if self._state != self.OPEN:
+                logger.warning("%s circuit opened after %s failures", self.name, self._failures)
+                self.opened += 1
+            self._state = self.OPEN
+            self._opened_at = monotonic()
+
+    def stats(self) -> dict:
+        return {"state": self.state, "failures": self._failures, "opened": self.opened, "rejected": self.rejected}
+
+
+class RetryBudget(object):
+    """
+    Caps retries (and hedges) to a share of the regular traffic so a degraded
+    dependency is not hammered with extra load: every request deposits `ratio`
+    tokens, every retry withdraws one. `min_per_second` keeps a trickle of
+    retries available when traffic is low.
+    """
+
+    def __init__(self, ratio: float, min_per_second: float, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+        self._tokens = max_tokens
+        self._updated_at = monotonic()
+        self.spent = 0
+        self.denied = 0
+
+    def _refill(self, amount: float) -> None:
+        now = monotonic()
+        amount += (now - self._updated_at) * self.min_per_second
+        self._updated_at = now
+        self._tokens = min(self.max_tokens, self._tokens + amount)
+
+    def record_request(self) -> None:
+        self._refill(self.ratio)
+
+    def try_spend(self) -> bool:
+        self._refill(0.0)
+        if self._tokens >= 1.0:
+            self._tokens -= 1.0
+            self.spent += 1
+            return True
+        self.denied += 1
+        return False
+
+    def stats(self) -> dict:
+        return {"tokens": round(self._tokens, 2), "spent": self.spent, "denied": self.denied}
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0.0, min(cap, base * (2 ** attempt)))
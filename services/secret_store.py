@@ -0,0 +1,233 @@
+import threading
+from json import loads
+from time import monotonic, sleep
+from typing import Optional
+from decouple import config
+from sqlalchemy import event
+from utils import Logger, Singleton, get_aws_credentials
+
+logger = Logger("services.secret_store")
+
+# written into DATABASE_URL in place of the credentials, replaced at connect time
+USERNAME_PLACEHOLDER = "secret-username"
+PASSWORD_PLACEHOLDER = "secret-password"
+
+
+class SecretStore(object):
+    """Where secrets are read from. fetch() returns the decoded secret of `secret_id`."""
+
+    def fetch(self, secret_id: str) -> dict:
+        raise NotImplementedError
+
+
+class AwsSecretsManagerStore(SecretStore):
+    """AWS Secrets Manager. The boto3 client is built on first use and then reused (it is thread safe)."""
+
+    def __init__(self, region_name: Optional[str] = None):
+        self.region_name = region_name or config("AWS_REGION", default="us-east-1")
+        self._client = None
+        self._lock = threading.Lock()
+
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    # imported here: boto3/botocore take ~0.1s to import and only this store needs them
+                    import boto3
+                    if config("LOCAL", default="0") == "1":
+                        creds = get_aws_credentials()
+                        session = boto3.session.Session(
+                            aws_secret_access_key=creds.get("secret_access_key"),
+                            aws_access_key_id=creds.get("access_key_id"), region_name=self.region_name
+                        )
+                    else:
+                        session = boto3.session.Session(region_name=self.region_name)
+                    self._client = session.client("secretsmanager")
+        return self._client
+
+    def fetch(self, secret_id: str) -> dict:
+        return loads(self.client().get_secret_value(SecretId=secret_id).get("SecretString"))
+
+
+class InMemorySecretStore(SecretStore):
+    """
+    Local stand-in for tests and benchmarks: secrets are plain dicts, put()
+    simulates a rotation, and every fetch takes `latency` seconds.
+    """
+
+    def __init__(self, secrets: Optional[dict[str, dict]] = None, latency: float = 0.0):
+        self.secrets = dict(secrets or {})
+        self.latency = latency
+        self.fetches = 0
+
+    def put(self, secret_id: str, value: dict) -> None:
+        self.secrets[secret_id] = value
+
+    def fetch(self, secret_id: str) -> dict:
+        self.fetches += 1
+        if self.latency:
+            sleep(self.latency)
+        try:
+            return dict(self.secrets[secret_id])
+        except KeyError:
+            raise KeyError(f"Secret {secret_id} not found")
+
+
+class SecretsProvider(metaclass=Singleton):
+    """
+    Cached access to secrets. A secret is fetched on first use (at startup,
+    off the event loop); from then on a background thread checks every
+    SECRETS_REFRESH_CHECK seconds and refreshes the secrets older than
+    SECRETS_REFRESH_AFTER, whether they are read or not, so callers never
+    wait on the store again. When the store stays unreachable for longer than
+    SECRETS_CACHE_TTL the last value is still served (counted as stale) while
+    refreshes keep being retried: the database connect hook runs on the event
+    loop, and blocking it on Secrets Manager would stall every request. Thread
+    safe: the connect hook runs in whatever thread opens the connection.
+    """
+
+    # logical names used in the code -> secret ids in the store
+    aliases = {"database": lambda: config("SM_DB_KEY")}
+
+    def __init__(self):
+        super(SecretsProvider, self).__init__()
+        self.ttl = float(config("SECRETS_CACHE_TTL", default="900"))
+        self.refresh_after = float(config("SECRETS_REFRESH_AFTER", default="600"))
+        self.refresh_check = float(config("SECRETS_REFRESH_CHECK", default="30"))
+        self.store: SecretStore = AwsSecretsManagerStore()
+        self._entries: dict[str, tuple[dict, float]] = {}
+        self._refreshing: set[str] = set()
+        self._lock = threading.Lock()
+        self._refresher: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.refreshes = 0
+        self.failures = 0
+
+    def configure(self, store: SecretStore) -> None:
+        """Swaps the store, e.g. for an InMemorySecretStore in tests. Cached secrets are dropped."""
+        with self._lock:
+            self.store = store
+            self._entries.clear()
+
+    def secret_id(self, name: str) -> str:
+        if not name:
+            raise KeyError("Missing key")
+        alias = self.aliases.get(name)
+        return alias() if alias else name
+
+    def get(self, name: str) -> dict:
+        secret_id = self.secret_id(name)
+        entry = self._entries.get(secret_id)
+        if entry is None:
+            self.misses += 1
+            return self._fetch(secret_id)
+        self.hits += 1
+        age = monotonic() - entry[1]
+        if age >= self.refresh_after:
+            if age >= self.ttl:
+                self.stale += 1
+            self._refresh_in_background(secret_id)
+        return entry[0]
+
+    def refresh(self, name: str) -> None:
+        """
+        Fetches a secret again in a background thread, e.g. after the database
+        rejected its credentials; the cached value is served until it lands.
+        """
+        self._refresh_in_background(self.secret_id(name))
+
+    def _fetch(self, secret_id: str) -> dict:
+        try:
+            value = self.store.fetch(secret_id)
+        except Exception:
+            self.failures += 1
+            raise
+        with self._lock:
+            self._entries[secret_id] = (value, monotonic())
+            if self._refresher is None:
+                self._stopping.clear()
+                self._refresher = threading.Thread(target=self._refresh_loop, name="secret-refresher", daemon=True)
+                self._refresher.start()
+        return value
+
+    def _refresh_loop(self) -> None:
+        while not self._stopping.wait(self.refresh_check):
+            now = monotonic()
+            for secret_id, (_, fetched_at) in list(self._entries.items()):
+                if now - fetched_at >= self.refresh_after:
+                    self._refresh_in_background(secret_id)
+
+    def stop(self) -> None:
+        """Stops the refresher thread; the next fetch starts it again."""
+        with self._lock:
+            refresher, self._refresher = self._refresher, None
+            self._stopping.set()
+        if refresher is not None:
+            refresher.join(timeout=5)
+
+    def _refresh_in_background(self, secret_id: str) -> None:
+        with self._lock:
+            if secret_id in self._refreshing:
+                return
+            self._refreshing.add(secret_id)
+        threading.Thread(target=self._refresh, args=(secret_id,), name="secret-refresh", daemon=True).start()
+
+    def _refresh(self, secret_id: str) -> None:
+        try:
+            self._fetch(secret_id)
+            self.refreshes += 1
+        except Exception as e:
+            logger.error("cannot refresh secret %s, serving the cached value: %r", secret_id, e)
+        finally:
+            with self._lock:
+                self._refreshing.discard(secret_id)
+
+    def stats(self) -> dict:
+        return {"cached": len(self._entries), "hits": self.hits, "misses": self.misses, "stale": self.stale,
+                "refreshes": self.refreshes, "failures": self.failures}
+
+
+secrets_provider = SecretsProvider()
+
+
+def _is_authentication_error(error: Exception) -> bool:
+    # asyncpg: InvalidPasswordError / InvalidAuthorizationSpecificationError,
+    # psycopg2: OperationalError "password authentication failed ..."
+    return type(error).__name__ in ("InvalidPasswordError", "InvalidAuthorizationSpecificationError") \
+        or "password authentication failed" in str(error)
+
+
+def connect_with_secret(engine, secret_name: str = "database") -> None:
+    """
+    Fills the credentials of every new DBAPI connection of `engine` from the
+    secrets provider: user and password, plus any connect argument left as
+    USERNAME_PLACEHOLDER/PASSWORD_PLACEHOLDER in the URL (e.g. a database
+    named after the user). Rotated credentials are used by the next
+    connection the pool opens, without rebuilding the engine. A connection
+    refused for its credentials fails, and starts a refresh of the secret in
+    the background: the hook runs on the event loop for the async engine,
+    so it never waits on the store itself. Connections opened once the
+    refresh lands use the new credentials.
+    """
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    def with_credentials(cparams: dict) -> dict:
+        secret = secrets_provider.get(secret_name)
+        replacements = {USERNAME_PLACEHOLDER: secret["username"], PASSWORD_PLACEHOLDER: secret["password"]}
+        params = {key: replacements.get(value, value) if isinstance(value, str) else value
+                  for key, value in cparams.items()}
+        params.update(user=secret["username"], password=secret["password"])
+        return params
+
+    @event.listens_for(sync_engine, "do_connect")
+    def do_connect(dialect, conn_rec, cargs, cparams):
+        try:
+            return dialect.connect(*cargs, **with_credentials(cparams))
+        except Exception as e:
+            if _is_authentication_error(e):
+                logger.warning("database rejected the cached credentials, refreshing them: %r", e)
+                secrets_provider.refresh(secret_name)
+            raise
@@ -0,0 +1,165 @@
+import asyncio
+from typing import Optional
+from decouple import config
+from utils import Logger, Singleton
+from backend.database import async_dbpool
+from services.broadcaster import broadcaster
+
+logger = Logger("services.validation_worker")
+
+
+class ValidationWorkerPool(metaclass=Singleton):
+    """
+    In-process workers validating wallets against the broadcaster in the
+    background (WALLET_VALIDATION_MODE=async). Wallets are inserted with
+    validated_by_blockchain=False together with a row in the durable
+    wallet_validation_jobs_tbl queue; workers claim batches of due jobs with
+    SKIP LOCKED, validate them concurrently and flip the flag with one batched
+    UPDATE. Jobs whose remote call fails are left leased and picked up again
+    once the lease expires, up to VALIDATION_MAX_ATTEMPTS claims. Rejected
+    wallets stay unvalidated. stop() lets running batches finish before the
+    engine is disposed.
+    """
+
+    def __init__(self):
+        super(ValidationWorkerPool, self).__init__()
+        self.enabled = config("WALLET_VALIDATION_MODE", default="sync").lower() == "async"
+        self.workers = int(config("VALIDATION_WORKERS", default="2"))
+        self.batch_size = int(config("VALIDATION_BATCH_SIZE", default="50"))
+        self.poll_interval = float(config("VALIDATION_POLL_INTERVAL", default="1"))
+        self.lease = float(config("VALIDATION_LEASE_SECONDS", default="60"))
+        self.max_attempts = int(config("VALIDATION_MAX_ATTEMPTS", default="10"))
+        self.drain_timeout = float(config("VALIDATION_DRAIN_TIMEOUT", default="10"))
+        self._tasks: list[asyncio.Task] = []
+        self._stopping: Optional[asyncio.Event] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.processed = 0
+        self.validated = 0
+        self.rejected = 0
+        self.failed = 0
+        self.dropped = 0
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def check_config(self) -> None:
+        """Raises ValueError without BROADCASTER_SERVICE_TOKEN: the workers call the broadcaster with it."""
+        if not broadcaster.service_token:
+            # every call would go out as "Bearer " and be rejected until the jobs are dropped
+            logger.error("WALLET_VALIDATION_MODE=async but BROADCASTER_SERVICE_TOKEN is not set")
+            raise ValueError("WALLET_VALIDATION_MODE=async requires BROADCASTER_SERVICE_TOKEN")
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self.check_config()
+        self._stopping = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker(index), name=f"wallet-validation-{index}")
+            for index in range(self.workers)
+        ]
+        logger.info("started %s wallet validation workers", self.workers)
+
+    def notify(self) -> None:
+        """Wakes idle workers up early, e.g. right after jobs were enqueued."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self) -> None:
+        """Stops claiming new jobs and waits up to VALIDATION_DRAIN_TIMEOUT for running batches."""
+        if not self._tasks:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        done, pending = await asyncio.wait(self._tasks, timeout=self.drain_timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning("cancelled %s validation workers after %ss, their jobs are retried when the lease expires",
+                           len(pending), self.drain_timeout)
+        self._tasks = []
+        logger.info("wallet validation workers stopped")
+
+    async def _worker(self, index: int) -> None:
+        while not self._stopping.is_set():
+            try:
+                claimed = await self.run_once()
+            except Exception as e:
+                logger.error("validation worker %s failed: %r", index, e)
+                claimed = 0
+            if claimed >= self.batch_size or self._stopping.is_set():
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_once(self) -> int:
+        """Claims and processes one batch. Returns the number of jobs claimed."""
+        async with async_dbpool as conn:
+            jobs = await conn.claim_validation_jobs(limit=self.batch_size, lease=self.lease)
+        if not jobs:
+            return 0
+        outcomes = await asyncio.gather(
+            *(
+                broadcaster.validate_wallet(
+                    address=job.public_address,
+                    network=job.network,
+                    auth_token=broadcaster.service_token
+                )
+                for job in jobs
+            ),
+            return_exceptions=True
+        )
+        finished, validated = [], []
+        for job, outcome in zip(jobs, outcomes):
+            # BaseException: gather() hands back a CancelledError as a (truthy) result too
+            if isinstance(outcome, BaseException):
+                self.failed += 1
+                # the claim's UPDATE already counted this attempt on the loaded job
+                if job.attempts >= self.max_attempts:
+                    logger.error(
+                        "giving up on wallet %s after %s attempts: %r",
+                        job.wallet_id, job.attempts, outcome
+                    )
+                    self.dropped += 1
+                    finished.append(job)
+                continue
+            finished.append(job)
+            if outcome is True:
+                validated.append(job.wallet_id)
+                self.validated += 1
+            else:
+                self.rejected += 1
+        self.processed += len(jobs)
+        if finished:
+            async with async_dbpool as conn:
+                await conn.complete_validation_jobs(jobs=finished, validated_wallet_ids=validated)
+        logger.debug(
+            "validation batch: %s claimed, %s validated, %s finished",
+            len(jobs), len(validated), len(finished)
+        )
+        return len(jobs)
+
+    async def stats(self) -> dict:
+        async with async_dbpool as conn:
+            queue = await conn.validation_queue_stats()
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "workers": self.workers,
+            "queue_depth": queue["depth"],
+            "queue_lag_seconds": queue["lag_seconds"],
+            "processed": self.processed,
+            "validated": self.validated,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+
+validation_workers = ValidationWorkerPool()
@@ -1,12 +1,15 @@
 import re
-import boto3
+import atexit
+import os
 import logging
-from json import loads
+from copy import copy
+from queue import SimpleQueue
+from typing import Optional
+from json import dumps
 from decouple import config
 from datetime import datetime
-from botocore import exceptions
 from os.path import join, dirname, abspath, exists
-from logging.handlers import RotatingFileHandler
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 
 
@@ -18,22 +21,98 @@ class Singleton(type):
         return cls._instances[cls]
 
 
-class Logger(object, metaclass=Singleton):
+class _PreparedQueueHandler(QueueHandler):
+    """
+    Interpolates the message in the calling thread (args may be live ORM objects
+    that must not be touched from another thread) and leaves the rest of the
+    formatting - timestamps, JSON encoding, tracebacks - and the disk I/O to
+    the listener thread.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.utcfromtimestamp(record.created).isoformat(timespec="milliseconds") + "Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return dumps(entry, default=str)
+
+
+class Logger(object):
+    """
+    Per-module named logger (`Logger("backend.database")`). Records go through
+    a queue to one background listener thread owning the rotating file handler,
+    so request handlers never wait on formatting or disk I/O. Messages take
+    %-style arguments that are only interpolated when the level is enabled:
+        logger.debug("user found %r", user)
+    LOG_LEVEL (default INFO) gates every logger, LOG_FORMAT=json writes JSON lines.
+    With WEB_WORKERS > 1 every process writes its own logs/runtime-<pid>.log:
+    RotatingFileHandler cannot share (and rotate) one file across processes.
+    """
 
     logs_dir = join(dirname(abspath(__file__)), "logs")
+    level = logging.getLevelName(config("LOG_LEVEL", default="INFO").upper())
+    json_lines = config("LOG_FORMAT", default="text").lower() == "json"
+    _queue_handler: Optional[QueueHandler] = None
+    _listener: Optional[QueueListener] = None
+
     def __init__(self, logger_name: str):
         self._logger = logging.getLogger(logger_name)
-        self._logger.setLevel(logging.DEBUG)
-        handler = RotatingFileHandler(join(self.logs_dir, "runtime.log"), maxBytes=52428800, backupCount=7)
-        formatter = logging.Formatter('[%(name)s] %(asctime)s [%(levelname)s] %(message)s')
-        handler.setFormatter(formatter)
-        self._logger.addHandler(handler)
-
-    def _log(self, message: str, level: int = logging.INFO): self._logger.log(level=level, msg=message)
-    def info(self, message: str): self._log(message, level=logging.INFO)
-    def debug(self, message: str): self._log(message, level=logging.DEBUG)
-    def warning(self, message: str): self._log(message, level=logging.WARN)
-    def error(self, message: str): self._log(message, level=logging.ERROR)
+        self._logger.setLevel(self.level)
+        self._logger.propagate = False
+        handler = self._start_listener()
+        if handler not in self._logger.handlers:
+            self._logger.addHandler(handler)
+
+    @staticmethod
+    def log_file_name() -> str:
+        if int(config("WEB_WORKERS", default="1")) > 1:
+            return f"runtime-{os.getpid()}.log"
+        return "runtime.log"
+
+    @classmethod
+    def _start_listener(cls) -> QueueHandler:
+        if cls._queue_handler is None:
+            handler = RotatingFileHandler(join(cls.logs_dir, cls.log_file_name()), maxBytes=52428800, backupCount=7)
+            if cls.json_lines:
+                handler.setFormatter(JsonLinesFormatter())
+            else:
+                handler.setFormatter(logging.Formatter('[%(name)s] %(asctime)s [%(levelname)s] %(message)s'))
+            records = SimpleQueue()
+            cls._queue_handler = _PreparedQueueHandler(records)
+            cls._listener = QueueListener(records, handler, respect_handler_level=False)
+            cls._listener.start()
+            atexit.register(cls.shutdown)
+        return cls._queue_handler
+
+    @classmethod
+    def shutdown(cls) -> None:
+        """Flushes the queued records and stops the listener thread."""
+        if cls._listener is not None:
+            cls._listener.stop()
+            cls._listener = None
+
+    def _log(self, level: int, message: str, *args, **kwargs):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, message, *args, **kwargs)
+    def isEnabledFor(self, level: int) -> bool: return self._logger.isEnabledFor(level)
+    def info(self, message: str, *args, **kwargs): self._log(logging.INFO, message, *args, **kwargs)
+    def debug(self, message: str, *args, **kwargs): self._log(logging.DEBUG, message, *args, **kwargs)
+    def warning(self, message: str, *args, **kwargs): self._log(logging.WARN, message, *args, **kwargs)
+    def error(self, message: str, *args, **kwargs): self._log(logging.ERROR, message, *args, **kwargs)
 
 logger = Logger("utils")
 
@@ -63,30 +142,33 @@ def build_allowlist_from_routes(app):
     return paths
 
 
+def build_allowlist_matcher(routes) -> re.Pattern:
+    """
+        :params - routes: the application routes (app.routes)
+        Same paths as build_allowlist_from_routes, folded into one anchored
+        alternation so a request path is checked with a single match() call.
+        Path parameters become plain `[^/]+` (names may repeat across routes),
+        each route is one named group `r<index into routes>`.
+    """
+    alternatives = []
+    for index, route in enumerate(routes):
+        if hasattr(route, "path"):
+            path = re.sub(r"\\\{[^}]+\\\}", "[^/]+", re.escape(route.path))
+            # the group name tells which route matched: match.lastgroup == f"r{index}"
+            alternatives.append(f"(?P<r{index}>{path})")
+    if not alternatives:
+        return re.compile(r"(?!)")
+    return re.compile("(?:" + "|".join(alternatives) + ")$")
+
+
 def get_aws_credentials():
     return {"access_key_id": config("AWS_ACCESS_KEY"), "secret_access_key": config("AWS_SECRET_ACCESS_KEY")}
 
 
 def sm_get_secret_data(key: str):
-    if not key:
-        raise KeyError("Missing key")
-    if key == "database":
-        key = config("SM_DB_KEY")
-    try:
-        if config("LOCAL") == "1":
-            creds = get_aws_credentials()
-            session = boto3.session.Session(
-                aws_secret_access_key=creds.get("secret_access_key"),
-                aws_access_key_id=creds.get("access_key_id"), region_name="us-east-1").client(
-                "secretsmanager"
-            )
-        else:
-            session = boto3.session.Session(region_name="us-east-1").client("secretsmanager")
-        return loads(
-            session.get_secret_value(SecretId=key).get("SecretString")
-        )
-    except (Exception, exceptions.ClientError) as e:
-        raise e
+    """Cached secret (see services.secret_store.SecretsProvider)."""
+    from services.secret_store import secrets_provider  # services.secret_store imports utils
+    return secrets_provider.get(key)
 
 
 def check_association(user, wallet):